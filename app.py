@@ -31,12 +31,37 @@ button, svg, .material-icons, [role="button"] {
 """, unsafe_allow_html=True)
 
 import pandas as pd
-from prophet import Prophet
-import plotly.graph_objects as go
-import plotly.express as px
 import numpy as np
-from sklearn.metrics import mean_absolute_error, mean_squared_error, r2_score
+import io
+import os
 import warnings
+from model_cache import ModelCache, make_cache_key, dump_training_result, load_training_result, hash_dataframe
+from forecast_model import MODEL_CONFIG
+from incremental import detect_append, seed_state, train_incremental
+from intervals import INTERVAL_CONFIG, INTERVAL_MODES, predict_with_intervals
+from backtest import MIN_INITIAL_WEEKS, recent_cutoffs, run_backtest
+from batch import run_batch_forecast
+from charts import (
+    build_backtest_figure, build_box_figure, build_components_figure, build_forecast_figure,
+    build_histogram_figure, build_residuals_figure, build_scenario_figure, build_sensitivity_figure
+)
+from daily import aggregate_daily_csv
+from dataset_store import DatasetStore, dataset_key, hash_content
+from ingest import EXTERNAL_FACTOR_COLUMNS, REQUIRED_COLUMNS, combine_sheet_tabs, read_csv_columns, read_weekly_csv
+from pipeline import (
+    build_prophet_frame, build_whatif_engine, compute_metrics, default_future_factors, fetch_sheet_tabs, forecast_future_weeks,
+    forecast_scenarios, list_sheet_tabs, sheets_gid, validate_regressor_names
+)
+from profiling import StageProfiler
+from quality import describe_issues, find_quality_issues, summarize_issues
+from scenarios import (
+    DEFAULT_SCENARIO_NAME, climatology_path, factor_path, ramp_path, read_scenario_csv, scenario_summary, step_path
+)
+from sheets import SHEETS_FETCH_TTL, SheetsFetcher, combined_content_hash
+from synthetic import generate_synthetic_data
+from selection import SELECTION_CONFIG, SELECTION_DIRECTIONS, select_factors, subset_cache
+from tuning import TUNING_CONFIG, tune_model_config, tuning_cache
+from whatif import factor_range
 warnings.filterwarnings('ignore')
 
 # --- 1. ตั้งค่าหน้าเว็บ ---
@@ -59,15 +84,124 @@ if 'data_source' not in st.session_state:
     st.session_state.data_source = "ตัวอย่าง"
 if 'external_factors_enabled' not in st.session_state:
     st.session_state.external_factors_enabled = False
+if 'series_col' not in st.session_state:
+    st.session_state.series_col = None
+if 'incremental_state' not in st.session_state:
+    st.session_state.incremental_state = None
+
+# วัดเวลาแต่ละขั้นตอนของการรันรอบนี้ (แสดงในส่วน Debug ของ sidebar)
+profiler = StageProfiler(track_memory=st.session_state.get('profile_memory', False))
 
 # เลือกวิธีการเชื่อมต่อข้อมูล
 data_source = st.radio(
     "เลือกแหล่งข้อมูล:",
-    ["📊 Google Sheets (แนะนำ)", "📁 อัปโหลดไฟล์ CSV", "🎯 ข้อมูลตัวอย่าง"],
+    ["📊 Google Sheets (แนะนำ)", "📁 อัปโหลดไฟล์ CSV", "💾 ชุดข้อมูลที่บันทึกไว้", "🎯 ข้อมูลตัวอย่าง"],
     help="Google Sheets เหมาะสำหรับการแชร์และอัปเดตข้อมูลแบบ real-time"
 )
 
 # === วิธีที่ 1: Google Sheets ===
+# อายุของข้อมูลที่ดึงมาแล้ว (วินาที) ก่อนตรวจสอบกับ Google Sheets อีกครั้ง
+SHEETS_TTL = int(os.environ.get('FORECAST_SHEETS_TTL', str(SHEETS_FETCH_TTL)))
+
+@st.cache_resource
+def get_sheets_fetcher():
+    """ตัวดึงข้อมูล Google Sheets ที่ใช้ร่วมกันทุก session และทุกการ rerun"""
+    return SheetsFetcher(ttl=SHEETS_TTL)
+
+@st.cache_data(max_entries=8, show_spinner=False)
+def parse_sheet_content(content_hash, _content):
+    """แปลง CSV เป็น DataFrame และทำความสะอาด (ใช้ content_hash เป็นคีย์แคช)"""
+    buffer = io.BytesIO(_content)
+    missing_columns = [col for col in REQUIRED_COLUMNS if col not in read_csv_columns(buffer)]
+    if missing_columns:
+        return None, None, [], missing_columns
+    # อ่านตามชนิดที่ประกาศไว้และทำความสะอาดทีละส่วน (แปลงชนิด, ลบแถวที่ไม่ครบ, เรียงตามวันที่)
+    df_clean, series_col, notes = read_weekly_csv(buffer)
+    return df_clean, series_col, notes, []
+
+@st.cache_data(ttl=SHEETS_TTL, max_entries=8, show_spinner=False)
+def get_sheet_tabs(sheets_url):
+    """รายชื่อแท็บของ workbook (ว่างถ้าหาไม่ได้ - แคชไว้ตาม TTL เพื่อไม่ให้เรียกซ้ำทุก rerun)"""
+    try:
+        return list_sheet_tabs(sheets_url, get_sheets_fetcher())
+    except Exception:
+        return []
+
+def refresh_sheets():
+    """บังคับตรวจสอบทุกแท็บและรายชื่อแท็บกับ Google Sheets ในการ rerun ถัดไป"""
+    get_sheets_fetcher().invalidate()
+    get_sheet_tabs.clear()
+
+@st.cache_data(max_entries=8, show_spinner=False)
+def combine_sheet_content(content_hash, _tabs):
+    """รวมหลายแท็บ [(ชื่อ, เนื้อหา), ...] เป็นข้อมูลชุดเดียว (ใช้ hash รวมของทุกแท็บเป็นคีย์แคช)"""
+    return combine_sheet_tabs(_tabs)
+
+@st.cache_data(max_entries=4, show_spinner=False)
+def aggregate_uploaded_daily(file_id, _uploaded_file):
+    """รวมไฟล์รายวันที่อัปโหลดเป็นรายสัปดาห์ (ใช้ file_id เป็นคีย์แคช ไม่อ่านไฟล์ใหม่ทุกการ rerun)"""
+    progress_bar = st.progress(0.0, text="📅 กำลังรวมข้อมูลรายวัน...")
+    total_bytes = max(_uploaded_file.size, 1)
+
+    def report(rows_read):
+        done = min(_uploaded_file.tell() / total_bytes, 1.0)
+        progress_bar.progress(done, text=f"📅 กำลังรวมข้อมูลรายวัน... {rows_read:,} แถว")
+
+    _uploaded_file.seek(0)
+    result = aggregate_daily_csv(_uploaded_file, progress=report)
+    progress_bar.empty()
+    return result
+
+# คลังชุดข้อมูลที่ทำความสะอาดแล้วบนดิสก์ (ค่าว่าง = ปิด) ใช้ร่วมกันทุก session และคงอยู่หลังรีสตาร์ท
+DATASET_DIR = os.environ.get(
+    'FORECAST_DATASET_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'flu_forecast', 'datasets')
+)
+
+@st.cache_resource
+def get_dataset_store():
+    """คลังชุดข้อมูล (None ถ้าปิดไว้หรือไม่มี pyarrow)"""
+    if not DATASET_DIR:
+        return None
+    try:
+        return DatasetStore(DATASET_DIR)
+    except (ImportError, OSError):
+        return None
+
+@st.cache_data(max_entries=16, show_spinner=False)
+def uploaded_content_hash(file_id, _uploaded_file):
+    """hash ของไฟล์ที่อัปโหลด (ใช้ file_id เป็นคีย์แคช ไม่อ่านไฟล์ใหม่ทุกการ rerun)"""
+    return hash_content(_uploaded_file)
+
+@st.cache_resource(max_entries=8, show_spinner=False)
+def open_mapped_dataset(key):
+    """เปิดชุดข้อมูลจากคลังแบบ memory-map ครั้งเดียวต่อ process (ทุก session ใช้ข้อมูลชุดเดียวกัน ไม่คัดลอก)"""
+    loaded = get_dataset_store().load(key)
+    if loaded is None:
+        # ไม่แคชผลที่ไม่พบ
+        raise KeyError(key)
+    return loaded
+
+def open_stored_dataset(key):
+    """ชุดข้อมูลที่เคยทำความสะอาดแล้ว คืนค่า (df, คอลัมน์อนุกรม, ข้อความแจ้งเตือน) หรือ None"""
+    store = get_dataset_store()
+    if store is None or key not in store:
+        return None
+    try:
+        df_stored, metadata = open_mapped_dataset(key)
+    except KeyError:
+        return None
+    return df_stored, metadata['series_col'], metadata['notes']
+
+def store_dataset(key, df_clean, source, series_col, notes, kind='weekly'):
+    """บันทึกชุดข้อมูลที่ทำความสะอาดแล้วลงคลัง (ถ้าเปิดใช้)"""
+    store = get_dataset_store()
+    if store is None or len(df_clean) == 0:
+        return
+    try:
+        store.save(key, df_clean, source, series_col=series_col, notes=notes, kind=kind)
+    except OSError as e:
+        st.warning(f"⚠️ บันทึกชุดข้อมูลลงคลังไม่สำเร็จ: {e}")
+
 if data_source == "📊 Google Sheets (แนะนำ)":
     st.markdown("### 🌐 เชื่อมต่อ Google Sheets")
     
@@ -113,58 +247,82 @@ if data_source == "📊 Google Sheets (แนะนำ)":
             if "docs.google.com/spreadsheets" in sheets_url:
                 # ดึง spreadsheet ID
                 if "/d/" in sheets_url:
-                    sheet_id = sheets_url.split("/d/")[1].split("/")[0]
-                    csv_url = f"https://docs.google.com/spreadsheets/d/{sheet_id}/export?format=csv&gid=0"
+                    # รายชื่อแท็บของ workbook (หาไม่ได้ = ใช้เฉพาะแท็บที่ระบุใน URL)
+                    with profiler.stage('list_tabs'):
+                        sheet_tabs = get_sheet_tabs(sheets_url)
+                    if len(sheet_tabs) > 1:
+                        tab_names = dict(sheet_tabs)
+                        selected_gids = st.multiselect(
+                            "📑 แท็บที่ต้องการ:",
+                            list(tab_names),
+                            default=list(tab_names),
+                            format_func=tab_names.get,
+                            help="แท็บที่มี end_date, cases, week_num รวมเป็นข้อมูลหลายพื้นที่ (หนึ่งแท็บต่อพื้นที่) "
+                                 "แท็บที่มี end_date แต่ไม่มี cases ถือเป็นปัจจัยภายนอก นำมาต่อกับทุกพื้นที่ตาม end_date"
+                        )
+                        selected_tabs = [(gid, tab_names[gid]) for gid in selected_gids]
+                    else:
+                        selected_tabs = [(sheets_gid(sheets_url), "Sheet")]
                     
                     with st.spinner("🔄 กำลังดาวน์โหลดข้อมูลจาก Google Sheets..."):
-                        # อ่านข้อมูลจาก Google Sheets
-                        df_sheets = pd.read_csv(csv_url)
+                        # ดึงทุกแท็บพร้อมกันผ่านแคช - ภายใน TTL ไม่มีการดาวน์โหลดซ้ำ
+                        with profiler.stage('fetch', tabs=len(selected_tabs)):
+                            fetched_tabs, failed_tabs = fetch_sheet_tabs(sheets_url, selected_tabs, get_sheets_fetcher())
+                        for tab_name, error in failed_tabs.items():
+                            st.error(f"❌ ดาวน์โหลดแท็บ '{tab_name}' ไม่สำเร็จ: {error}")
+                        if not fetched_tabs:
+                            raise ValueError("ไม่มีแท็บที่ดาวน์โหลดสำเร็จ")
                         
-                        # ตรวจสอบคอลัมน์ที่จำเป็น
-                        required_columns = ['end_date', 'cases', 'week_num']
-                        missing_columns = [col for col in required_columns if col not in df_sheets.columns]
+                        # เนื้อหาที่เคยทำความสะอาดแล้วเปิดจากคลังได้ทันที (ข้ามการแปลงข้อมูล)
+                        if len(fetched_tabs) == 1:
+                            content_hash = fetched_tabs[0][1].content_hash
+                        else:
+                            content_hash = combined_content_hash(fetched_tabs)
+                        dataset_id = dataset_key(content_hash)
+                        with profiler.stage('open_stored'):
+                            stored = open_stored_dataset(dataset_id)
+                        if stored is not None:
+                            df_sheets, series_col, notes = stored
+                            missing_columns = []
+                        else:
+                            # แปลงและทำความสะอาดเฉพาะเมื่อเนื้อหาเปลี่ยน (แคชตาม hash ของเนื้อหา)
+                            tab_bytes = sum(len(result.content) for _, result in fetched_tabs)
+                            with profiler.stage('parse', bytes=tab_bytes):
+                                if len(fetched_tabs) == 1:
+                                    df_sheets, series_col, notes, missing_columns = parse_sheet_content(
+                                        content_hash, fetched_tabs[0][1].content
+                                    )
+                                else:
+                                    df_sheets, series_col, notes = combine_sheet_content(
+                                        content_hash, [(name, result.content) for name, result in fetched_tabs]
+                                    )
+                                    missing_columns = []
+                            if not missing_columns:
+                                store_dataset(dataset_id, df_sheets, sheets_url, series_col, notes)
                         
                         if missing_columns:
                             st.error(f"❌ Google Sheets ขาดคอลัมน์: {', '.join(missing_columns)}")
                         else:
-                            # ทำความสะอาดข้อมูลพื้นฐาน
-                            df_sheets['end_date'] = pd.to_datetime(df_sheets['end_date'], format='%d/%m/%Y', errors='coerce')
-                            df_sheets['cases'] = pd.to_numeric(df_sheets['cases'], errors='coerce')
-                            df_sheets['week_num'] = pd.to_numeric(df_sheets['week_num'], errors='coerce')
-                            
-                            # ทำความสะอาดข้อมูลปัจจัยภายนอก (แก้ไขชื่อคอลัมน์)
-                            external_cols = ['temperature', 'humidity', 'holiday_flag', 'campaign', 'outbreak_index', 
-                                           'population_density', 'school_closed', 'tourists']
-                            
-                            # รองรับทั้ง 'holidays' และ 'holiday_flag' 
-                            if 'holidays' in df_sheets.columns and 'holiday_flag' not in df_sheets.columns:
-                                df_sheets['holiday_flag'] = df_sheets['holidays']
-                                df_sheets.drop('holidays', axis=1, inplace=True)
-                                st.info("ℹ️ แปลงคอลัมน์ 'holidays' เป็น 'holiday_flag' แล้ว")
-                            
-                            for col in external_cols:
-                                if col in df_sheets.columns:
-                                    df_sheets[col] = pd.to_numeric(df_sheets[col], errors='coerce')
-                            
-                            # ลบแถวที่มีข้อมูลหลักไม่ครบ
-                            df_sheets = df_sheets.dropna(subset=required_columns).reset_index(drop=True)
+                            for note in notes:
+                                st.info(note)
                             
                             if len(df_sheets) > 0:
-                                # เรียงข้อมูลตามวันที่
-                                df_sheets = df_sheets.sort_values('end_date').reset_index(drop=True)
-                                
                                 # ตรวจสอบว่ามี external factors หรือไม่
-                                has_external = any(col in df_sheets.columns for col in external_cols)
+                                has_external = any(col in df_sheets.columns for col in EXTERNAL_FACTOR_COLUMNS)
                                 
                                 # เก็บข้อมูลใน session state
                                 st.session_state.current_data = df_sheets
                                 st.session_state.data_source = "Google Sheets"
                                 st.session_state.external_factors_enabled = has_external
+                                st.session_state.series_col = series_col
                                 
                                 st.success(f"✅ เชื่อมต่อ Google Sheets สำเร็จ! {len(df_sheets)} สัปดาห์")
                                 
+                                if series_col:
+                                    st.info(f"🗂️ พบข้อมูลหลายพื้นที่ในคอลัมน์ '{series_col}': {df_sheets[series_col].nunique()} พื้นที่")
+                                
                                 if has_external:
-                                    available_factors = [col for col in external_cols if col in df_sheets.columns]
+                                    available_factors = [col for col in EXTERNAL_FACTOR_COLUMNS if col in df_sheets.columns]
                                     st.info(f"🌍 พบปัจจัยภายนอก: {', '.join(available_factors)}")
                                 
                                 # แสดงข้อมูลพื้นฐาน
@@ -176,9 +334,16 @@ if data_source == "📊 Google Sheets (แนะนำ)":
                                 with col3:
                                     st.metric("จำนวนสัปดาห์", len(df_sheets))
                                 
-                                # ปุ่มรีเฟรชข้อมูล
-                                if st.button("🔄 รีเฟรชข้อมูลจาก Google Sheets"):
-                                    st.rerun()
+                                st.caption(
+                                    f"🕒 ดาวน์โหลดเมื่อ {pd.Timestamp.fromtimestamp(max(result.fetched_at for _, result in fetched_tabs)).strftime('%d/%m/%Y %H:%M:%S')}"
+                                    f" · ตรวจสอบการเปลี่ยนแปลงทุก {SHEETS_TTL} วินาที"
+                                )
+                                
+                                # ปุ่มรีเฟรชข้อมูล (บังคับตรวจสอบกับ Google Sheets ก่อน rerun)
+                                st.button(
+                                    "🔄 รีเฟรชข้อมูลจาก Google Sheets",
+                                    on_click=refresh_sheets
+                                )
                                     
                             else:
                                 st.error("❌ ไม่พบข้อมูลที่ถูกต้องใน Google Sheets")
@@ -217,6 +382,12 @@ elif data_source == "📁 อัปโหลดไฟล์ CSV":
         **หมายเหตุ:** ใช้ 'holiday_flag' แทน 'holidays' เพื่อหลีกเลี่ยงปัญหากับ Prophet
         """)
     
+    daily_mode = st.toggle(
+        "📅 ข้อมูลรายวัน / รายเคส (รวมเป็นรายสัปดาห์อัตโนมัติ)",
+        help="ไฟล์ต้องมีคอลัมน์วันที่ (date, report_date, onset_date หรือ end_date) "
+             "และ cases (ถ้าไม่มีจะนับหนึ่งแถวเป็นหนึ่งเคส) - อ่านทีละส่วน ใช้หน่วยความจำคงที่แม้ไฟล์ใหญ่"
+    )
+
     uploaded_file = st.file_uploader(
         "เลือกไฟล์ CSV",
         type=['csv'],
@@ -225,54 +396,54 @@ elif data_source == "📁 อัปโหลดไฟล์ CSV":
     
     if uploaded_file is not None:
         try:
-            # อ่านไฟล์ CSV
-            df_uploaded = pd.read_csv(uploaded_file)
-            
-            # ตรวจสอบคอลัมน์ที่จำเป็น
-            required_columns = ['end_date', 'cases', 'week_num']
-            missing_columns = [col for col in required_columns if col not in df_uploaded.columns]
+            kind = 'daily' if daily_mode else 'weekly'
+            stored = None
+            if get_dataset_store() is not None:
+                # ไฟล์ที่เคยอัปโหลดแล้ว (เนื้อหาเดียวกัน) เปิดจากคลังได้ทันที ไม่ต้องอ่านและทำความสะอาดใหม่
+                with profiler.stage('open_stored', bytes=uploaded_file.size):
+                    dataset_id = dataset_key(uploaded_content_hash(uploaded_file.file_id, uploaded_file), kind)
+                    stored = open_stored_dataset(dataset_id)
+            if stored is not None:
+                df_uploaded, series_col, notes = stored
+                missing_columns = []
+            elif daily_mode:
+                # รวมข้อมูลรายวันเป็นรายสัปดาห์ (ได้ข้อมูลที่สะอาดแล้ว)
+                with profiler.stage('aggregate_daily', bytes=uploaded_file.size):
+                    df_uploaded, series_col, notes = aggregate_uploaded_daily(uploaded_file.file_id, uploaded_file)
+                missing_columns = []
+            else:
+                # ตรวจสอบคอลัมน์ที่จำเป็นจาก header ก่อนอ่านทั้งไฟล์
+                missing_columns = [col for col in REQUIRED_COLUMNS if col not in read_csv_columns(uploaded_file)]
+                if not missing_columns:
+                    # อ่านตามชนิดที่ประกาศไว้และทำความสะอาดทีละส่วน (แปลงชนิด, ลบแถวที่ไม่ครบ, เรียงตามวันที่)
+                    with profiler.stage('parse', bytes=uploaded_file.size):
+                        df_uploaded, series_col, notes = read_weekly_csv(uploaded_file)
+            if stored is None and not missing_columns and get_dataset_store() is not None:
+                store_dataset(dataset_id, df_uploaded, uploaded_file.name, series_col, notes, kind)
             
             if missing_columns:
                 st.error(f"❌ ไฟล์ขาดคอลัมน์: {', '.join(missing_columns)}")
             else:
-                # แปลงประเภทข้อมูลพื้นฐาน
-                df_uploaded['end_date'] = pd.to_datetime(df_uploaded['end_date'], format='%d/%m/%Y', errors='coerce')
-                df_uploaded['cases'] = pd.to_numeric(df_uploaded['cases'], errors='coerce')
-                df_uploaded['week_num'] = pd.to_numeric(df_uploaded['week_num'], errors='coerce')
-                
-                # ทำความสะอาดข้อมูลปัจจัยภายนอก (แก้ไขชื่อคอลัมน์)
-                external_cols = ['temperature', 'humidity', 'holiday_flag', 'campaign', 'outbreak_index', 
-                               'population_density', 'school_closed', 'tourists']
-                
-                # รองรับทั้ง 'holidays' และ 'holiday_flag'
-                if 'holidays' in df_uploaded.columns and 'holiday_flag' not in df_uploaded.columns:
-                    df_uploaded['holiday_flag'] = df_uploaded['holidays']
-                    df_uploaded.drop('holidays', axis=1, inplace=True)
-                    st.info("ℹ️ แปลงคอลัมน์ 'holidays' เป็น 'holiday_flag' แล้ว")
-                
-                for col in external_cols:
-                    if col in df_uploaded.columns:
-                        df_uploaded[col] = pd.to_numeric(df_uploaded[col], errors='coerce')
-                
-                # ลบแถวที่มีข้อมูลหลักไม่ครบ
-                df_uploaded = df_uploaded.dropna(subset=required_columns).reset_index(drop=True)
+                for note in notes:
+                    st.info(note)
                 
                 if len(df_uploaded) > 0:
-                    # เรียงข้อมูลตามวันที่
-                    df_uploaded = df_uploaded.sort_values('end_date').reset_index(drop=True)
-                    
                     # ตรวจสอบว่ามี external factors หรือไม่
-                    has_external = any(col in df_uploaded.columns for col in external_cols)
+                    has_external = any(col in df_uploaded.columns for col in EXTERNAL_FACTOR_COLUMNS)
                     
                     # เก็บข้อมูลใน session state
                     st.session_state.current_data = df_uploaded
                     st.session_state.data_source = f"ไฟล์: {uploaded_file.name}"
                     st.session_state.external_factors_enabled = has_external
+                    st.session_state.series_col = series_col
                     
                     st.success(f"✅ อัปโหลดไฟล์สำเร็จ! {len(df_uploaded)} สัปดาห์")
                     
+                    if series_col:
+                        st.info(f"🗂️ พบข้อมูลหลายพื้นที่ในคอลัมน์ '{series_col}': {df_uploaded[series_col].nunique()} พื้นที่")
+                    
                     if has_external:
-                        available_factors = [col for col in external_cols if col in df_uploaded.columns]
+                        available_factors = [col for col in EXTERNAL_FACTOR_COLUMNS if col in df_uploaded.columns]
                         st.info(f"🌍 พบปัจจัยภายนอก: {', '.join(available_factors)}")
                     
                     # แสดงข้อมูลพื้นฐาน
@@ -289,7 +460,51 @@ elif data_source == "📁 อัปโหลดไฟล์ CSV":
         except Exception as e:
             st.error(f"❌ เกิดข้อผิดพลาดในการอ่านไฟล์: {str(e)}")
 
-# === วิธีที่ 3: ข้อมูลตัวอย่าง ===
+# === วิธีที่ 3: ชุดข้อมูลที่บันทึกไว้ ===
+elif data_source == "💾 ชุดข้อมูลที่บันทึกไว้":
+    st.markdown("### 💾 ชุดข้อมูลที่บันทึกไว้")
+    dataset_store = get_dataset_store()
+    dataset_entries = dataset_store.entries() if dataset_store is not None else []
+    
+    if dataset_store is None:
+        st.warning("⚠️ ไม่ได้เปิดใช้คลังชุดข้อมูล (ต้องมี pyarrow และตั้งค่า FORECAST_DATASET_DIR)")
+    elif not dataset_entries:
+        st.info("💡 ยังไม่มีชุดข้อมูลที่บันทึกไว้ - ข้อมูลจาก Google Sheets หรือไฟล์ที่อัปโหลดจะถูกบันทึกอัตโนมัติ")
+    else:
+        st.caption("เปิดจากไฟล์ที่ทำความสะอาดแล้วโดยตรง ไม่ต้องดาวน์โหลดหรืออ่านไฟล์ใหม่")
+        selected_entry = st.selectbox(
+            "เลือกชุดข้อมูล:",
+            dataset_entries,
+            format_func=lambda entry: (
+                f"{entry['source']} · {entry['rows']:,} แถว · {entry['start_date']} ถึง {entry['end_date']}"
+                f" · บันทึกเมื่อ {pd.Timestamp.fromtimestamp(entry['created_at']).strftime('%d/%m/%Y %H:%M')}"
+            )
+        )
+        with profiler.stage('open_stored', bytes=selected_entry['bytes']):
+            stored = open_stored_dataset(selected_entry['key'])
+        
+        if stored is None:
+            st.error("❌ เปิดชุดข้อมูลไม่สำเร็จ (ไฟล์อาจถูกลบไปแล้ว)")
+        else:
+            df_stored, series_col, notes = stored
+            st.session_state.current_data = df_stored
+            st.session_state.data_source = f"คลังข้อมูล: {selected_entry['source']}"
+            st.session_state.external_factors_enabled = bool(selected_entry['factors'])
+            st.session_state.series_col = series_col
+            
+            st.success(f"✅ เปิดชุดข้อมูลสำเร็จ! {len(df_stored):,} แถว")
+            if series_col:
+                st.info(f"🗂️ พบข้อมูลหลายพื้นที่ในคอลัมน์ '{series_col}': {selected_entry['n_series']} พื้นที่")
+            if selected_entry['factors']:
+                st.info(f"🌍 พบปัจจัยภายนอก: {', '.join(selected_entry['factors'])}")
+            
+            def remove_dataset(key):
+                dataset_store.remove(key)
+                st.session_state.current_data = None
+            
+            st.button("🗑️ ลบชุดข้อมูลนี้ออกจากคลัง", on_click=remove_dataset, args=(selected_entry['key'],))
+
+# === วิธีที่ 4: ข้อมูลตัวอย่าง ===
 else:  # ข้อมูลตัวอย่าง
     st.markdown("### 🎯 ใช้ข้อมูลตัวอย่าง")
     
@@ -300,83 +515,17 @@ else:  # ข้อมูลตัวอย่าง
         help="ข้อมูลจำลองสำหรับทดสอบระบบ"
     )
     
-    # สร้างข้อมูลตัวอย่างที่มี pattern ชัดเจนกว่า
-    np.random.seed(42)  # ให้ผลลัพธ์เหมือนเดิมทุกครั้ง
-    dates = pd.date_range(start='2024-01-07', end='2024-12-29', freq='W')
-    cases = []
-    
-    # สร้างข้อมูลที่มี pattern ชัดเจนกว่า
-    base_level = 100  # เพิ่ม base level
-    for i, date in enumerate(dates):
-        week_of_year = date.isocalendar()[1]
-        
-        # seasonal pattern ที่ชัดเจนกว่า (หนาวเยอะ ร้อนน้อย)
-        seasonal = 40 * np.sin(2 * np.pi * (week_of_year - 10) / 52)
-        
-        # trend ที่เบากว่า
-        trend = -0.1 * i
-        
-        # noise ที่น้อยกว่า
-        noise = np.random.normal(0, 5)
-        
-        # holiday spikes
-        holiday_boost = 0
-        if week_of_year in [1, 2, 13, 14, 31, 32, 52]:  # วันหยุดยาว
-            holiday_boost = 20
-        
-        final_value = base_level + seasonal + trend + noise + holiday_boost
-        cases.append(max(20, int(final_value)))  # เพิ่ม minimum value
-    
-    if sample_type == "📊 ข้อมูลพื้นฐาน (52 สัปดาห์)":
-        df_sample = pd.DataFrame({
-            'end_date': dates,
-            'cases': cases,
-            'week_num': range(1, len(dates) + 1)
-        })
-        st.session_state.external_factors_enabled = False
-    else:
-        # เพิ่มปัจจัยภายนอกที่มีความสัมพันธ์กับข้อมูล
-        temperatures = []
-        humidities = []
-        holiday_flags = []
-        campaigns = []
-        
-        for i, date in enumerate(dates):
-            week_of_year = date.isocalendar()[1]
-            
-            # อุณหภูมิ (มีความสัมพันธ์กับการระบาด)
-            temp = 26 + 6 * np.sin(2 * np.pi * (week_of_year - 10) / 52) + np.random.normal(0, 1)
-            temperatures.append(round(temp, 1))
-            
-            # ความชื้น
-            humidity = 70 + 15 * np.sin(2 * np.pi * (week_of_year - 20) / 52) + np.random.normal(0, 3)
-            humidities.append(max(40, min(95, int(humidity))))
-            
-            # วันหยุด (สอดคล้องกับ holiday boost)
-            holiday = 1 if week_of_year in [1, 2, 13, 14, 31, 32, 52] else 0
-            holiday_flags.append(holiday)
-            
-            # แคมเปญ (ลดการระบาด)
-            campaign = 1 if week_of_year in range(20, 25) or week_of_year in range(45, 50) else 0
-            campaigns.append(campaign)
-        
-        df_sample = pd.DataFrame({
-            'end_date': dates,
-            'cases': cases,
-            'week_num': range(1, len(dates) + 1),
-            'temperature': temperatures,
-            'humidity': humidities,
-            'holiday_flag': holiday_flags,
-            'campaign': campaigns,
-            'outbreak_index': np.random.uniform(0.1, 0.8, len(dates)).round(2),
-            'population_density': [1250] * len(dates),
-            'school_closed': [0 if week_of_year not in [14, 15, 16] else 1 for week_of_year in [date.isocalendar()[1] for date in dates]],
-            'tourists': np.random.randint(8000, 20000, len(dates))
-        })
-        st.session_state.external_factors_enabled = True
+    # สร้างข้อมูลตัวอย่างที่มี pattern ชัดเจนกว่า (seed คงที่ ให้ผลลัพธ์เหมือนเดิมทุกครั้ง)
+    # seed ของ numpy ยังใช้กับการสุ่มช่วงความเชื่อมั่นของ Prophet ด้านล่าง
+    np.random.seed(42)
+    with_factors = sample_type != "📊 ข้อมูลพื้นฐาน (52 สัปดาห์)"
+    with profiler.stage('generate_sample'):
+        df_sample = generate_synthetic_data(n_years=1, with_factors=with_factors, seed=42)
+    st.session_state.external_factors_enabled = with_factors
     
     # เก็บข้อมูลใน session state
     st.session_state.current_data = df_sample
+    st.session_state.series_col = None
     st.session_state.data_source = f"ข้อมูลตัวอย่าง: {sample_type.split(' ')[0][2:]}"
     
     if st.session_state.external_factors_enabled:
@@ -384,7 +533,8 @@ else:  # ข้อมูลตัวอย่าง
 
 # ใช้ข้อมูลที่เก็บใน session state
 if st.session_state.current_data is not None:
-    df = st.session_state.current_data.copy()
+    # ไม่คัดลอกค่าทั้งชุด (ข้อมูลจากคลังเป็น memory-map) - copy-on-write ป้องกันการแก้ข้อมูลใน session
+    df = st.session_state.current_data.copy(deep=False)
     st.info(f"🔄 แหล่งข้อมูลปัจจุบัน: **{st.session_state.data_source}**")
     
     # แสดงตัวอย่างข้อมูล
@@ -396,11 +546,42 @@ if st.session_state.current_data is not None:
         st.session_state.current_data = None
         st.session_state.data_source = "ตัวอย่าง"
         st.session_state.external_factors_enabled = False
+        st.session_state.series_col = None
         st.rerun()
 else:
     st.error("❌ ไม่พบข้อมูล กรุณาเลือกแหล่งข้อมูลด้านบน")
     st.stop()
 
+@st.cache_data(max_entries=16, show_spinner=False)
+def get_quality_issues(data_key, _df, series_col=None):
+    """ตารางปัญหาคุณภาพข้อมูลทุกอนุกรม (ใช้ data_key = hash ของข้อมูลเป็นคีย์แคช)"""
+    return find_quality_issues(_df, series_col)
+
+# ข้อมูลหลายพื้นที่ (long format): เลือกพื้นที่สำหรับการวิเคราะห์รายละเอียด
+series_col = st.session_state.series_col
+long_df = None
+if series_col and series_col in df.columns:
+    long_df = df
+    # ตรวจคุณภาพทุกพื้นที่พร้อมกันครั้งเดียว แล้วกรองเฉพาะพื้นที่ที่เลือก
+    with profiler.stage('quality', rows=len(long_df)):
+        quality_table = get_quality_issues(hash_dataframe(long_df), long_df, series_col)
+    with st.expander(f"🩺 สรุปคุณภาพข้อมูลรายพื้นที่ ({long_df[series_col].nunique()} พื้นที่)"):
+        quality_summary = summarize_issues(quality_table)
+        if len(quality_summary) > 0:
+            st.dataframe(quality_summary, use_container_width=True, hide_index=True)
+        else:
+            st.success("✅ ไม่พบปัญหาคุณภาพข้อมูลในทุกพื้นที่")
+    selected_series = st.selectbox(
+        f"🗂️ เลือกพื้นที่ ({series_col}) สำหรับการวิเคราะห์รายละเอียด:",
+        sorted(long_df[series_col].unique().tolist()),
+        help="การวิเคราะห์ด้านล่างใช้ข้อมูลของพื้นที่ที่เลือก ส่วนการพยากรณ์ทุกพื้นที่อยู่ท้ายหน้า"
+    )
+    df = long_df[long_df[series_col] == selected_series].reset_index(drop=True)
+    quality_table = quality_table[quality_table['series'] == selected_series]
+else:
+    with profiler.stage('quality', rows=len(df)):
+        quality_table = get_quality_issues(hash_dataframe(df), df)
+
 # === การตรวจสอบคุณภาพข้อมูลอย่างละเอียด ===
 st.subheader("📊 วิเคราะห์คุณภาพข้อมูล")
 
@@ -416,75 +597,7 @@ with col4:
     st.metric("ช่วงข้อมูล", f"{(df['end_date'].max() - df['end_date'].min()).days // 7} สัปดาห์")
 
 # การตรวจสอบคุณภาพข้อมูล
-data_quality_issues = []
-
-# 1. ตรวจสอบจำนวนข้อมูล
-if len(df) < 8:
-    data_quality_issues.append({
-        'type': 'insufficient_data',
-        'severity': 'warning',
-        'message': f"ข้อมูลมีเพียง {len(df)} สัปดาห์ (ควรมีอย่างน้อย 8 สัปดาห์)",
-        'suggestion': "เพิ่มข้อมูลย้อนหลังให้มากขึ้นเพื่อเพิ่มความแม่นยำ"
-    })
-
-# 2. ตรวจสอบค่าผิดปกติ (Outliers)
-Q1 = df['cases'].quantile(0.25)
-Q3 = df['cases'].quantile(0.75)
-IQR = Q3 - Q1
-lower_bound = Q1 - 1.5 * IQR
-upper_bound = Q3 + 1.5 * IQR
-
-outliers = df[(df['cases'] < lower_bound) | (df['cases'] > upper_bound)]
-if len(outliers) > 0:
-    data_quality_issues.append({
-        'type': 'outliers',
-        'severity': 'warning',
-        'message': f"พบค่าผิดปกติ {len(outliers)} จุด",
-        'details': outliers[['week_num', 'end_date', 'cases']].copy(),
-        'suggestion': f"ตรวจสอบข้อมูลในสัปดาห์ที่ {', '.join(map(str, outliers['week_num'].values))} - อาจเป็นช่วงระบาดหรือข้อมูลผิดพลาด"
-    })
-
-# 3. ตรวจสอบค่าศูนย์หรือติดลบ
-zero_negative = df[df['cases'] <= 0]
-if len(zero_negative) > 0:
-    data_quality_issues.append({
-        'type': 'zero_negative',
-        'severity': 'error',
-        'message': f"พบค่าศูนย์หรือติดลบ {len(zero_negative)} จุด",
-        'details': zero_negative[['week_num', 'end_date', 'cases']].copy(),
-        'suggestion': "แก้ไขให้เป็นค่าบวก หรือใช้ค่าเฉลี่ยของสัปดาห์ข้างเคียง"
-    })
-
-# 4. ตรวจสอบช่องว่างในลำดับสัปดาห์
-week_gaps = []
-for i in range(1, len(df)):
-    if df.iloc[i]['week_num'] - df.iloc[i-1]['week_num'] > 1:
-        week_gaps.append((df.iloc[i-1]['week_num'], df.iloc[i]['week_num']))
-
-if week_gaps:
-    data_quality_issues.append({
-        'type': 'missing_weeks',
-        'severity': 'warning',
-        'message': f"พบช่องว่างในลำดับสัปดาห์ {len(week_gaps)} จุด",
-        'details': week_gaps,
-        'suggestion': "เพิ่มข้อมูลในสัปดาห์ที่ขาดหายไป หรือปรับ week_num ให้ต่อเนื่องกัน"
-    })
-
-# 5. ตรวจสอบการกระโดดของข้อมูล (Sudden jumps)
-df_sorted = df.sort_values('week_num').copy()
-df_sorted['cases_diff'] = df_sorted['cases'].diff().abs()
-mean_diff = df_sorted['cases_diff'].mean()
-std_diff = df_sorted['cases_diff'].std()
-sudden_jumps = df_sorted[df_sorted['cases_diff'] > mean_diff + 2 * std_diff]
-
-if len(sudden_jumps) > 0:
-    data_quality_issues.append({
-        'type': 'sudden_jumps',
-        'severity': 'info',
-        'message': f"พบการเปลี่ยนแปลงกะทันหัน {len(sudden_jumps)} จุด",
-        'details': sudden_jumps[['week_num', 'end_date', 'cases', 'cases_diff']].copy(),
-        'suggestion': "ตรวจสอบว่าเป็นเหตุการณ์จริง (เช่น การระบาด) หรือข้อผิดพลาดในการบันทึก"
-    })
+data_quality_issues = describe_issues(quality_table)
 
 # แสดงผลการตรวจสอบ
 if data_quality_issues:
@@ -522,6 +635,7 @@ if data_quality_issues:
                     
                     # ถ้าเป็น outliers ให้แสดงเพิ่มเติม
                     if issue['type'] == 'outliers':
+                        lower_bound, upper_bound = issue['bounds']
                         details_with_stats = issue['details'].copy()
                         details_with_stats['สถิติ'] = details_with_stats['cases'].apply(
                             lambda x: f"{'🔺 สูงกว่าปกติ' if x > upper_bound else '🔻 ต่ำกว่าปกติ'} ({x:.0f} vs ปกติ {lower_bound:.0f}-{upper_bound:.0f})"
@@ -567,41 +681,81 @@ if len(df) > 0:
     col1, col2 = st.columns(2)
     
     with col1:
-        # Box plot สำหรับดู outliers
-        fig_box = go.Figure()
-        fig_box.add_trace(go.Box(
-            y=df['cases'],
-            name='จำนวนผู้ป่วย',
-            boxpoints='outliers',
-            marker_color='lightblue'
-        ))
-        
-        # เพิ่มเส้นค่าเฉลี่ย
-        fig_box.add_hline(
-            y=df['cases'].mean(), 
-            line_dash="dash", 
-            line_color="red",
-            annotation_text=f"ค่าเฉลี่ย: {df['cases'].mean():.1f}"
-        )
-        
-        fig_box.update_layout(
-            title="Box Plot: การกระจายของข้อมูล",
-            yaxis_title="จำนวนผู้ป่วย (ราย)",
-            height=400
-        )
-        st.plotly_chart(fig_box, use_container_width=True)
+        with profiler.stage('chart:box'):
+            fig_box = build_box_figure(df)
+            st.plotly_chart(fig_box, use_container_width=True)
     
     with col2:
-        # Histogram
-        fig_hist = px.histogram(
-            df, 
-            x='cases', 
-            nbins=min(20, len(df)//2),
-            title="Histogram: การแจกแจงของข้อมูล",
-            labels={'cases': 'จำนวนผู้ป่วย (ราย)', 'count': 'ความถี่'}
+        with profiler.stage('chart:histogram'):
+            fig_hist = build_histogram_figure(df)
+            st.plotly_chart(fig_hist, use_container_width=True)
+
+# จำนวนโมเดลสูงสุดที่เก็บในหน่วยความจำ และโฟลเดอร์แคชบนดิสก์ (ไม่บังคับ)
+MODEL_CACHE_MAX_ENTRIES = int(os.environ.get('FORECAST_MODEL_CACHE_SIZE', '16'))
+MODEL_CACHE_DIR = os.environ.get('FORECAST_MODEL_CACHE_DIR')
+BACKTEST_CACHE_MAX_ENTRIES = int(os.environ.get('FORECAST_BACKTEST_CACHE_SIZE', '1024'))
+BACKTEST_CACHE_SUBDIR = 'backtest'
+
+SELECTION_DIRECTION_LABELS = {
+    'forward': "เพิ่มทีละตัว (forward)",
+    'backward': "ตัดทีละตัว (backward)",
+}
+
+@st.cache_resource
+def get_selection_cache():
+    """แคชผล backtest ของแต่ละชุดปัจจัย (ใช้ร่วมกันทุก session และเก็บลงดิสก์ถ้าตั้ง MODEL_CACHE_DIR)"""
+    return subset_cache(MODEL_CACHE_DIR)
+
+def render_factor_selection(df, available_factors):
+    """เลือกปัจจัยอัตโนมัติแบบ stepwise แล้วแสดงผล คืนค่ารายการปัจจัยที่เลือก"""
+    direction = st.radio(
+        "วิธีเลือกปัจจัย",
+        SELECTION_DIRECTIONS,
+        format_func=SELECTION_DIRECTION_LABELS.get,
+        horizontal=True
+    )
+    if not recent_cutoffs(len(df), SELECTION_CONFIG['horizon'], SELECTION_CONFIG['max_cutoffs']):
+        st.info("ℹ️ ข้อมูลน้อยเกินไปสำหรับการเลือกปัจจัยอัตโนมัติ - ใช้ทุกปัจจัย")
+        return available_factors
+
+    selection_bar = st.progress(0.0, text="🤖 กำลังเลือกปัจจัย...")
+    with profiler.stage('select_factors', rows=len(df)):
+        result = select_factors(
+            build_prophet_frame(df, available_factors), available_factors, direction,
+            cache=get_selection_cache(),
+            progress=lambda done, total: selection_bar.progress(
+                done / total, text=f"🤖 กำลังเลือกปัจจัย ({done}/{total} โมเดลในขั้นนี้)"
+            )
+        )
+    selection_bar.empty()
+
+    if result['factors']:
+        st.success(f"✅ ปัจจัยที่เลือกอัตโนมัติ: {', '.join(result['factors'])}")
+    else:
+        st.info("ℹ️ ไม่มีปัจจัยที่ช่วยลดความผิดพลาดของ backtest - จะใช้โมเดลพื้นฐาน")
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.metric("Backtest MAE (ที่เลือก)", f"{result['mae']:.2f}",
+                  delta=f"{result['mae'] - result['all_factors_mae']:+.2f} เทียบกับทุกปัจจัย",
+                  delta_color="inverse")
+    with col2:
+        fit_all, fit_selected = result['fit_seconds']['all'], result['fit_seconds']['selected']
+        if fit_all and fit_selected:
+            st.metric("เวลาเทรนต่อโมเดล", f"{fit_selected:.2f} วินาที",
+                      delta=f"{fit_selected - fit_all:+.2f} วินาที เทียบกับทุกปัจจัย", delta_color="inverse")
+    with col3:
+        st.metric("โมเดลที่เทรน", f"{result['n_fits']}",
+                  help=f"ใช้ผลที่จำไว้ {result['n_cached_fits']} โมเดล "
+                       f"(ลองทุกชุดต้องเทรน {result['n_fits_exhaustive']} โมเดล)")
+    with st.expander(f"📋 ขั้นตอนการเลือก ({result['n_cutoffs']} จุดตัด, {result['seconds']:.1f} วินาที)"):
+        st.dataframe(
+            result['steps'].rename(columns={
+                'step': 'ขั้น', 'action': 'การทำ', 'factor': 'ปัจจัย', 'factors': 'ชุดปัจจัย',
+                'mae': 'MAE', 'chosen': 'เลือก'
+            }).round(3),
+            hide_index=True, use_container_width=True
         )
-        fig_hist.update_layout(height=400)
-        st.plotly_chart(fig_hist, use_container_width=True)
+    return result['factors']
 
 # --- การตั้งค่าปัจจัยภายนอก ---
 if st.session_state.external_factors_enabled:
@@ -609,65 +763,40 @@ if st.session_state.external_factors_enabled:
     
     # ตรวจสอบปัจจัยที่มีในข้อมูล
     available_factors = []
-    external_cols = ['temperature', 'humidity', 'holiday_flag', 'campaign', 'outbreak_index', 
-                    'population_density', 'school_closed', 'tourists']
     
-    for col in external_cols:
+    for col in EXTERNAL_FACTOR_COLUMNS:
         if col in df.columns and not df[col].isna().all():
             available_factors.append(col)
     
     if available_factors:
-        # เลือกปัจจัยที่จะใช้
-        selected_factors = st.multiselect(
-            "เลือกปัจจัยภายนอกที่ต้องการใช้ในการพยากรณ์:",
-            available_factors,
-            default=available_factors,
-            help="ปัจจัยที่เลือกจะถูกรวมเข้าในโมเดล Prophet"
+        auto_select = st.toggle(
+            "🤖 เลือกปัจจัยอัตโนมัติ (stepwise)",
+            value=False,
+            help="ลองเพิ่ม/ตัดปัจจัยทีละตัวแล้ววัดด้วย backtest หยุดเมื่อความผิดพลาดไม่ลดลงอีก "
+                 "- ผลของแต่ละชุดปัจจัยถูกจำไว้ตามข้อมูล"
         )
+        if auto_select:
+            selected_factors = render_factor_selection(df, available_factors)
+        else:
+            # เลือกปัจจัยที่จะใช้
+            selected_factors = st.multiselect(
+                "เลือกปัจจัยภายนอกที่ต้องการใช้ในการพยากรณ์:",
+                available_factors,
+                default=available_factors,
+                help="ปัจจัยที่เลือกจะถูกรวมเข้าในโมเดล Prophet"
+            )
         
         if selected_factors:
-            st.success(f"✅ จะใช้ปัจจัยภายนอก: {', '.join(selected_factors)}")
+            if not auto_select:
+                st.success(f"✅ จะใช้ปัจจัยภายนอก: {', '.join(selected_factors)}")
             
             # แสดงสถิติของปัจจัยภายนอก
             st.write("**📊 สถิติปัจจัยภายนอก:**")
             factor_stats = df[selected_factors].describe().round(2)
             st.dataframe(factor_stats, use_container_width=True)
-            
-            # การตั้งค่าสำหรับการพยากรณ์อนาคต
-            st.write("**🔮 การตั้งค่าปัจจัยภายนอกสำหรับการพยากรณ์:**")
-            
-            future_factors = {}
-            
-            for factor in selected_factors:
-                col1, col2, col3 = st.columns([1, 2, 1])
-                
-                with col1:
-                    st.write(f"**{factor}:**")
-                
-                with col2:
-                    method = st.selectbox(
-                        f"วิธีกำหนดค่า {factor}",
-                        ["ใช้ค่าเฉลี่ย", "ใช้ค่าล่าสุด", "กำหนดเอง"],
-                        key=f"method_{factor}"
-                    )
-                
-                with col3:
-                    if method == "ใช้ค่าเฉลี่ย":
-                        value = df[factor].mean()
-                        st.write(f"ค่าเฉลี่ย: {value:.2f}")
-                    elif method == "ใช้ค่าล่าสุด":
-                        value = df[factor].iloc[-1]
-                        st.write(f"ค่าล่าสุด: {value:.2f}")
-                    else:
-                        value = st.number_input(
-                            f"ค่า {factor}",
-                            value=float(df[factor].mean()),
-                            key=f"custom_{factor}"
-                        )
-                
-                future_factors[factor] = value
         else:
-            st.warning("⚠️ ไม่ได้เลือกปัจจัยภายนอกใดๆ - จะใช้โมเดลพื้นฐาน")
+            if not auto_select:
+                st.warning("⚠️ ไม่ได้เลือกปัจจัยภายนอกใดๆ - จะใช้โมเดลพื้นฐาน")
             selected_factors = []
     else:
         st.info("ℹ️ ไม่พบปัจจัยภายนอกในข้อมูล - จะใช้โมเดลพื้นฐาน")
@@ -676,35 +805,7 @@ else:
     selected_factors = []
 
 # --- เตรียมข้อมูลสำหรับ Prophet ---
-prophet_df = pd.DataFrame({
-    'ds': df['end_date'],
-    'y': df['cases']
-})
-
-# เพิ่มปัจจัยภายนอก
-for factor in selected_factors:
-    prophet_df[factor] = df[factor]
-
-prophet_df['week_num'] = df['week_num']
-
-# --- ฟังก์ชันเช็ค Prophet reserved names ---
-def get_prophet_reserved_names():
-    """ส่งคืนรายชื่อที่ Prophet จองไว้"""
-    return [
-        'ds', 'y', 't', 'trend', 'seasonal', 'seasonality', 
-        'holidays', 'holiday', 'mcmc_samples', 'uncertainty_samples',
-        'yhat', 'yhat_lower', 'yhat_upper', 'cap', 'floor',
-        'additive_terms', 'multiplicative_terms', 'extra_regressors'
-    ]
-
-def validate_regressor_names(factors):
-    """ตรวจสอบว่าชื่อปัจจัยไม่ใช่ reserved names"""
-    reserved_names = get_prophet_reserved_names()
-    invalid_names = [factor for factor in factors if factor in reserved_names]
-    
-    if invalid_names:
-        return False, invalid_names
-    return True, []
+prophet_df = build_prophet_frame(df, selected_factors)
 
 # ตรวจสอบชื่อปัจจัยภายนอก
 if selected_factors:
@@ -720,417 +821,515 @@ if selected_factors:
         st.stop()
 
 # --- สร้างและเทรนโมเดล Prophet (แก้ไขแล้ว) ---
-def calculate_safe_mape(actual, predicted):
-    """คำนวณ MAPE โดยหลีกเลี่ยงการหารด้วยศูนย์"""
-    # กรองเฉพาะค่าที่ actual > 0 เพื่อหลีกเลี่ยงการหารด้วยศูนย์
-    mask = actual > 0
-    if mask.sum() == 0:
-        return np.inf  # ถ้าไม่มีค่า actual ที่ > 0
-    
-    actual_filtered = actual[mask]
-    predicted_filtered = predicted[mask]
-    
-    mape = np.mean(np.abs((actual_filtered - predicted_filtered) / actual_filtered)) * 100
-    return mape
 
-def train_prophet_model_with_factors(data, factors):
-    """สร้างและเทรนโมเดล Prophet พร้อมปัจจัยภายนอก (แก้ไขแล้ว)"""
-    
-    # ปรับการแบ่งข้อมูลให้เหมาะสมกว่า
-    if len(data) >= 20:
-        # ใช้ time series split สำหรับข้อมูลเยอะ
-        test_size = max(3, min(8, len(data) // 4))  # 3-8 สัปดาห์สำหรับ test
-    elif len(data) >= 10:
-        test_size = 3  # 3 สัปดาห์สำหรับข้อมูลปานกลาง
-    else:
-        test_size = 0  # ไม่ split ถ้าข้อมูลน้อยเกินไป
-    
-    if test_size > 0:
-        split_point = len(data) - test_size
-        train_data = data.iloc[:split_point]
-        test_data = data.iloc[split_point:]
-    else:
-        train_data = data
-        test_data = pd.DataFrame()
-    
-    # สร้างโมเดล Prophet ที่ปรับปรุงแล้ว
-    model = Prophet(
-        daily_seasonality=False,
-        weekly_seasonality=False,  # ปิดก่อน จะเพิ่มเองที่ละเอียดกว่า
-        yearly_seasonality=True if len(data) >= 52 else False,
-        seasonality_mode='additive',
-        interval_width=0.95,
-        changepoint_prior_scale=0.01,  # ลดความ sensitive ต่อ changepoints
-        seasonality_prior_scale=1.0,   # ลดความ flexible ของ seasonality
-        uncertainty_samples=100        # ลดจำนวน samples สำหรับความเร็ว
+@st.cache_resource
+def get_model_cache():
+    """แคชโมเดลที่ใช้ร่วมกันทุก session และทุกการ rerun"""
+    return ModelCache(
+        max_entries=MODEL_CACHE_MAX_ENTRIES,
+        disk_dir=MODEL_CACHE_DIR,
+        dumps=dump_training_result,
+        loads=load_training_result
     )
+
+# โหมดต่อยอด: เมื่อมีเพียงสัปดาห์ใหม่ต่อท้าย จะเริ่มเทรนจากพารามิเตอร์ของโมเดลเดิม
+incremental_mode = st.sidebar.toggle(
+    "⚡ อัปเดตโมเดลแบบต่อยอด (warm start)",
+    value=True,
+    help="เมื่อข้อมูลเดิมไม่เปลี่ยนและมีเพียงสัปดาห์ใหม่ต่อท้าย จะเทรนต่อจากโมเดลเดิมแทนการเทรนใหม่ทั้งหมด"
+)
+
+# ค้นหาค่า prior ของโมเดลจาก backtest (ผลแคชตามข้อมูล เปิดครั้งถัดไปไม่ต้องค้นหาใหม่)
+tuning_mode = st.sidebar.toggle(
+    "🎯 ปรับค่าโมเดลอัตโนมัติ (tuning)",
+    value=False,
+    help="ค้นหา prior ของ trend/seasonality/ปัจจัยภายนอก และ Fourier order ด้วย successive halving "
+         "บนจุดตัดของ backtest - ใช้เวลาครั้งแรก แล้วจำค่าที่ดีที่สุดของข้อมูลชุดนี้ไว้"
+)
+
+# วิธีคำนวณช่วงความเชื่อมั่น (ไม่มีผลต่อการเทรน จึงไม่อยู่ในคีย์แคชของโมเดล)
+INTERVAL_MODE_LABELS = {
+    'sampled': "สุ่มเฉพาะช่วงพยากรณ์ (เร็ว)",
+    'analytic': "สูตรประมาณ ไม่สุ่ม (เร็วที่สุด)",
+    'prophet': "Prophet เดิม (สุ่มทุกแถว ช้าที่สุด)",
+}
+interval_mode = st.sidebar.selectbox(
+    "📏 วิธีคำนวณช่วงความเชื่อมั่น",
+    INTERVAL_MODES,
+    index=INTERVAL_MODES.index(INTERVAL_CONFIG['mode']),
+    format_func=INTERVAL_MODE_LABELS.get,
+    help="แบบสุ่มจะสุ่มเส้นทาง trend เฉพาะสัปดาห์ที่พยากรณ์และจำเส้นทางไว้ - เปลี่ยนค่าปัจจัยในอนาคตไม่ต้องสุ่มใหม่"
+)
+interval_samples = INTERVAL_CONFIG['samples']
+if interval_mode == 'sampled':
+    interval_samples = st.sidebar.number_input(
+        "จำนวนเส้นทางที่สุ่ม",
+        min_value=100,
+        max_value=10000,
+        value=INTERVAL_CONFIG['samples'],
+        step=100,
+        help="มากขึ้น = ขอบเขตช่วงนิ่งขึ้นแต่ช้าลง"
+    )
+
+@st.cache_resource
+def get_tuning_cache():
+    """แคชผลการปรับค่าโมเดลตาม hash ของข้อมูล (ใช้ร่วมกันทุก session และเก็บลงดิสก์ถ้าตั้ง MODEL_CACHE_DIR)"""
+    return tuning_cache(MODEL_CACHE_DIR, max_entries=MODEL_CACHE_MAX_ENTRIES)
+
+model_config = MODEL_CONFIG
+if tuning_mode:
+    if not recent_cutoffs(len(prophet_df), TUNING_CONFIG['horizon'], TUNING_CONFIG['max_cutoffs']):
+        st.info("ℹ️ ข้อมูลน้อยเกินไปสำหรับการปรับค่าโมเดล - ใช้ค่าเริ่มต้น")
+    else:
+        tuning_bar = st.progress(0.0, text="🎯 กำลังปรับค่าโมเดล...")
+        with profiler.stage('tune', rows=len(prophet_df)):
+            tuning_result = tune_model_config(
+                prophet_df, selected_factors,
+                cache=get_tuning_cache(),
+                progress=lambda done, total: tuning_bar.progress(
+                    min(done / total, 1.0), text=f"🎯 กำลังปรับค่าโมเดล ({done}/{total} โมเดล)"
+                )
+            )
+        tuning_bar.empty()
+        model_config = tuning_result['config']
+        with st.expander(
+            f"🎯 ค่าโมเดลที่ปรับแล้ว - MAE {tuning_result['mae']:.2f} "
+            f"(ค่าเริ่มต้น {tuning_result['default_mae']:.2f}, {tuning_result['n_cutoffs']} จุดตัด)"
+        ):
+            if tuning_result['cached']:
+                st.caption("ใช้ผลการค้นหาที่บันทึกไว้ของข้อมูลชุดนี้")
+            else:
+                st.caption(
+                    f"เทรน {tuning_result['n_fits']} โมเดล "
+                    f"(ค้นหาครบทุกชุดต้องเทรน {tuning_result['n_fits_exhaustive']} โมเดล)"
+                )
+            st.dataframe(
+                pd.DataFrame({'ค่า': list(tuning_result['params']), 'ที่เลือก': list(tuning_result['params'].values())}),
+                hide_index=True, use_container_width=True
+            )
+            st.dataframe(
+                tuning_result['trials'].sort_values(['rung', 'mae'], ascending=[False, True]).round(3),
+                hide_index=True, use_container_width=True
+            )
+
+# เทรนโมเดล (ใช้โมเดลจากแคชถ้าข้อมูล ปัจจัย และการตั้งค่าไม่เปลี่ยน)
+model_cache = get_model_cache()
+model_cache_key = make_cache_key(prophet_df, selected_factors, model_config)
+cached_result = model_cache.get(model_cache_key)
+
+if cached_result is not None:
+    model, val_mae, val_mape, has_validation = cached_result
+    if incremental_mode:
+        incremental_state = st.session_state.incremental_state
+        if incremental_state is None or detect_append(incremental_state['data'], prophet_df) != 0:
+            # จำโมเดลนี้ไว้เป็นจุดเริ่มต้นเมื่อมีสัปดาห์ใหม่ในครั้งถัดไป
+            st.session_state.incremental_state = seed_state(prophet_df, selected_factors, cached_result, model_config)
+else:
+    previous_state = st.session_state.incremental_state if incremental_mode else None
+    with st.spinner("🔄 กำลังเทรนโมเดล Prophet..."), profiler.stage('train', rows=len(prophet_df)):
+        training_result, st.session_state.incremental_state, training_mode = train_incremental(
+            prophet_df, selected_factors, previous_state, config=model_config,
+            notify=lambda level, message: getattr(st, level)(message),
+            profiler=profiler
+        )
+    if training_mode == 'warm':
+        n_new_weeks = len(prophet_df) - len(previous_state['data'])
+        st.info(f"⚡ พบข้อมูลใหม่ {n_new_weeks} สัปดาห์ - เทรนต่อจากโมเดลเดิม (warm start)")
+    model_cache.put(model_cache_key, training_result)
+    model, val_mae, val_mape, has_validation = training_result
+
+# --- พยากรณ์ช่วงข้อมูลในอดีต (คำนวณครั้งเดียวต่อโมเดล) ---
+@st.cache_data(max_entries=MODEL_CACHE_MAX_ENTRIES, show_spinner=False)
+def predict_history(model_key, interval_mode, _model, _prophet_df):
+    """พยากรณ์ค่าในอดีตของโมเดล (ใช้ model_key และ interval_mode เป็นคีย์แคช)"""
+    return predict_with_intervals(_model, _prophet_df.drop(columns=['y', 'week_num']), interval_mode)
+
+with st.spinner("🔮 กำลังพยากรณ์..."), profiler.stage('predict_history', rows=len(prophet_df)):
+    history_forecast = predict_history(model_cache_key, interval_mode, model, prophet_df)
+
+FACTOR_PATH_METHODS = [
+    "ใช้ค่าเฉลี่ย", "ใช้ค่าล่าสุด", "กำหนดเอง",
+    "ตามฤดูกาล", "เปลี่ยนค่าตั้งแต่สัปดาห์ที่", "ไล่ระดับ", "กำหนดรายสัปดาห์",
+]
+
+
+def render_future_factor_inputs(df, selected_factors, future_dates):
+    """แสดงตัวเลือกค่าปัจจัยภายนอกในอนาคต และคืนค่าที่เลือก (ค่าเดียว หรือ array รายสัปดาห์)"""
+    if not selected_factors:
+        return {}
     
-    # เพิ่ม seasonality ที่กำหนดเอง
-    if len(data) >= 12:
-        model.add_seasonality(name='monthly', period=30.5/7, fourier_order=3)
-    if len(data) >= 26:
-        model.add_seasonality(name='quarterly', period=91.25/7, fourier_order=2)
-    
-    # เพิ่ม external regressors ด้วยการตั้งค่าที่ conservative
-    factor_configs = {
-        'temperature': {'prior_scale': 0.1, 'mode': 'additive'},
-        'humidity': {'prior_scale': 0.1, 'mode': 'additive'},
-        'holiday_flag': {'prior_scale': 0.5, 'mode': 'additive'},
-        'campaign': {'prior_scale': 0.3, 'mode': 'additive'},
-        'outbreak_index': {'prior_scale': 0.5, 'mode': 'multiplicative'},
-        'population_density': {'prior_scale': 0.05, 'mode': 'additive'},
-        'school_closed': {'prior_scale': 0.3, 'mode': 'additive'},
-        'tourists': {'prior_scale': 0.1, 'mode': 'additive'}
-    }
-    
-    for factor in factors:
-        if factor in factor_configs:
-            config = factor_configs[factor]
-            model.add_regressor(factor, prior_scale=config['prior_scale'], mode=config['mode'])
-        else:
-            # ใช้ค่า conservative สำหรับปัจจัยที่ไม่ได้กำหนดไว้
-            model.add_regressor(factor, prior_scale=0.1, mode='additive')
+    # การตั้งค่าสำหรับการพยากรณ์อนาคต
+    st.write("**🔮 การตั้งค่าปัจจัยภายนอกสำหรับการพยากรณ์:**")
     
-    # เทรนด้วยข้อมูล train
-    model.fit(train_data)
+    future_factors = {}
+    weeks = len(future_dates)
     
-    # ทดสอบกับข้อมูล test ถ้ามี
-    if len(test_data) > 0:
-        # สร้าง future dataframe สำหรับ validation
-        future_test = model.make_future_dataframe(periods=len(test_data), freq='W')
-        
-        # เพิ่มค่าปัจจัยภายนอกสำหรับ test
-        for factor in factors:
-            if factor in test_data.columns:
-                future_test[factor] = list(train_data[factor]) + list(test_data[factor])
-        
-        forecast_test = model.predict(future_test)
-        
-        # คำนวณ validation metrics
-        test_actual = test_data['y'].values
-        test_predicted = forecast_test.iloc[-len(test_data):]['yhat'].values
+    for factor in selected_factors:
+        col1, col2, col3 = st.columns([1, 2, 1])
+        mean_value = float(df[factor].mean())
         
-        # ใช้ safe MAPE calculation
-        validation_mae = mean_absolute_error(test_actual, test_predicted)
-        validation_mape = calculate_safe_mape(test_actual, test_predicted)
+        with col1:
+            st.write(f"**{factor}:**")
         
-        # ป้องกัน MAPE ที่ผิดปกติ
-        if validation_mape > 200:  # ถ้า MAPE มากกว่า 200% ให้ปรับโมเดล
-            st.warning(f"⚠️ MAPE เบื้องต้น {validation_mape:.1f}% สูงเกินไป - กำลังปรับโมเดล...")
-            
-            # สร้างโมเดลใหม่ที่ conservative กว่า
-            model_adjusted = Prophet(
-                daily_seasonality=False,
-                weekly_seasonality=False,
-                yearly_seasonality=False,  # ปิด yearly seasonality
-                seasonality_mode='additive',
-                interval_width=0.95,
-                changepoint_prior_scale=0.001,  # ลดให้มากกว่าเดิม
-                seasonality_prior_scale=0.1     # ลดให้มากกว่าเดิม
+        with col2:
+            method = st.selectbox(
+                f"วิธีกำหนดค่า {factor}",
+                FACTOR_PATH_METHODS,
+                key=f"method_{factor}"
             )
-            
-            # เพิ่ม regressors แบบ conservative มาก
-            for factor in factors:
-                model_adjusted.add_regressor(factor, prior_scale=0.01, mode='additive')
-            
-            model_adjusted.fit(train_data)
-            forecast_test_adjusted = model_adjusted.predict(future_test)
-            
-            test_predicted_adjusted = forecast_test_adjusted.iloc[-len(test_data):]['yhat'].values
-            validation_mape_adjusted = calculate_safe_mape(test_actual, test_predicted_adjusted)
-            
-            if validation_mape_adjusted < validation_mape:
-                model = model_adjusted
-                validation_mape = validation_mape_adjusted
-                validation_mae = mean_absolute_error(test_actual, test_predicted_adjusted)
-                st.info(f"✅ ปรับโมเดลสำเร็จ - MAPE ลดเหลือ {validation_mape:.1f}%")
         
-        # เทรนใหม่ด้วยข้อมูลทั้งหมด
-        model_final = Prophet(
-            daily_seasonality=False,
-            weekly_seasonality=False,
-            yearly_seasonality=True if len(data) >= 52 else False,
-            seasonality_mode='additive',
-            interval_width=0.95,
-            changepoint_prior_scale=0.01,
-            seasonality_prior_scale=1.0
-        )
-        
-        # เพิ่ม seasonality
-        if len(data) >= 12:
-            model_final.add_seasonality(name='monthly', period=30.5/7, fourier_order=3)
-        if len(data) >= 26:
-            model_final.add_seasonality(name='quarterly', period=91.25/7, fourier_order=2)
-        
-        for factor in factors:
-            if factor in factor_configs:
-                config = factor_configs[factor]
-                model_final.add_regressor(factor, prior_scale=config['prior_scale'], mode=config['mode'])
+        with col3:
+            if method == "ใช้ค่าเฉลี่ย":
+                value = df[factor].mean()
+                st.write(f"ค่าเฉลี่ย: {value:.2f}")
+            elif method == "ใช้ค่าล่าสุด":
+                value = df[factor].iloc[-1]
+                st.write(f"ค่าล่าสุด: {value:.2f}")
+            elif method == "กำหนดเอง":
+                value = st.number_input(
+                    f"ค่า {factor}",
+                    value=mean_value,
+                    key=f"custom_{factor}"
+                )
+            elif method == "ตามฤดูกาล":
+                value = climatology_path(df, factor, future_dates)
+                st.write(f"เฉลี่ยสัปดาห์เดียวกันในอดีต: {value.min():.2f} - {value.max():.2f}")
+            elif method == "เปลี่ยนค่าตั้งแต่สัปดาห์ที่":
+                start_week = st.number_input(
+                    f"เริ่มสัปดาห์ที่ ({factor})", min_value=1, max_value=weeks,
+                    value=min(2, weeks), key=f"step_week_{factor}"
+                )
+                after = st.number_input(f"ค่าใหม่ {factor}", value=mean_value, key=f"step_value_{factor}")
+                value = step_path(df[factor].iloc[-1], after, start_week, weeks)
+            elif method == "ไล่ระดับ":
+                start = st.number_input(
+                    f"สัปดาห์แรก ({factor})", value=float(df[factor].iloc[-1]), key=f"ramp_start_{factor}"
+                )
+                end = st.number_input(f"สัปดาห์สุดท้าย ({factor})", value=mean_value, key=f"ramp_end_{factor}")
+                value = ramp_path(start, end, weeks)
             else:
-                model_final.add_regressor(factor, prior_scale=0.1, mode='additive')
-        
-        model_final.fit(data)
+                edited = st.data_editor(
+                    pd.DataFrame({
+                        'สัปดาห์ที่': np.arange(1, weeks + 1),
+                        factor: np.full(weeks, round(mean_value, 2)),
+                    }),
+                    disabled=['สัปดาห์ที่'],
+                    hide_index=True,
+                    key=f"path_{factor}_{weeks}"
+                )
+                value = edited[factor].astype(float).fillna(mean_value).to_numpy()
         
-        return model_final, validation_mae, validation_mape, True
-    else:
-        return model, None, None, False
+        future_factors[factor] = value
+    
+    return future_factors
+
+def render_scenario_comparison(model, df, selected_factors, future_factors, future_dates,
+                               interval_mode, interval_samples, stage_profiler):
+    """เปรียบเทียบหลายสถานการณ์ (ค่าปัจจัยคนละชุด) ในการพยากรณ์ครั้งเดียว"""
+    st.subheader("🧪 เปรียบเทียบสถานการณ์")
+    st.caption(
+        f"'{DEFAULT_SCENARIO_NAME}' คือค่าปัจจัยที่ตั้งไว้ด้านบน เพิ่มสถานการณ์สำเร็จรูปหรืออัปโหลด CSV "
+        "(คอลัมน์ scenario, week หรือ end_date และปัจจัย) ปัจจัยที่ไม่ได้กำหนดใช้ค่าของสถานการณ์หลัก"
+    )
+    weeks = len(future_dates)
+    builtin = {
+        "ค่าเฉลี่ยทุกปัจจัย": default_future_factors(df, selected_factors),
+        "ค่าล่าสุดทุกปัจจัย": default_future_factors(df, selected_factors, method='last'),
+        "ตามฤดูกาลทุกปัจจัย": {
+            factor: climatology_path(df, factor, future_dates) for factor in selected_factors
+        },
+    }
+    col1, col2 = st.columns(2)
+    with col1:
+        chosen = st.multiselect("สถานการณ์สำเร็จรูป", list(builtin), key="scenario_builtin")
+    with col2:
+        scenario_file = st.file_uploader("ไฟล์สถานการณ์ (CSV)", type=['csv'], key="scenario_file")
 
-# เทรนโมเดล
-with st.spinner("🔄 กำลังเทรนโมเดล Prophet..."):
-    model, val_mae, val_mape, has_validation = train_prophet_model_with_factors(prophet_df, selected_factors)
+    scenarios = {DEFAULT_SCENARIO_NAME: future_factors}
+    scenarios.update({name: builtin[name] for name in chosen})
+    if scenario_file is not None:
+        try:
+            uploaded, notes = read_scenario_csv(scenario_file, selected_factors, future_dates)
+        except ValueError as e:
+            st.error(f"❌ อ่านไฟล์สถานการณ์ไม่ได้: {e}")
+            uploaded, notes = {}, []
+        for note in notes:
+            st.caption(note)
+        for name, values in uploaded.items():
+            scenarios[f"{name} (ไฟล์)" if name in scenarios else name] = values
+
+    if len(scenarios) < 2:
+        st.info("ℹ️ เลือกสถานการณ์สำเร็จรูปหรืออัปโหลดไฟล์เพื่อเปรียบเทียบกับสถานการณ์หลัก")
+        return
+
+    # ทุกสถานการณ์ใช้ trend ชุดเดียวกัน และคำนวณในการพยากรณ์ครั้งเดียว
+    with st.spinner("🔮 กำลังพยากรณ์ตามสถานการณ์..."), \
+            stage_profiler.stage('predict_scenarios', scenarios=len(scenarios), weeks=weeks):
+        forecasts = forecast_scenarios(
+            model, df, selected_factors, scenarios, weeks, interval_mode, interval_samples,
+            base_factors=future_factors
+        )
 
-# --- ส่วนสำหรับผู้ใช้ป้อนข้อมูลและพยากรณ์ ---
-st.header("🔮 พยากรณ์จำนวนผู้ป่วย")
+    with stage_profiler.stage('chart:scenarios'):
+        st.plotly_chart(build_scenario_figure(df, forecasts), use_container_width=True)
+    st.dataframe(scenario_summary(forecasts, DEFAULT_SCENARIO_NAME), hide_index=True, use_container_width=True)
 
-# จำกัดจำนวนสัปดาห์การพยากรณ์ให้สมเหตุสมผล
-max_forecast_weeks = min(12, len(df) // 2)
+SENSITIVITY_STATISTICS = {
+    "ผู้ป่วยรวม (ราย)": 'total',
+    "ค่าสูงสุดรายสัปดาห์ (ราย)": 'peak',
+}
 
-weeks_to_forecast = st.slider(
-    "เลือกจำนวนสัปดาห์ที่ต้องการพยากรณ์ไปข้างหน้า:",
-    min_value=1,
-    max_value=max_forecast_weeks,
-    value=min(4, max_forecast_weeks),
-    help=f"แนะนำไม่เกิน {max_forecast_weeks} สัปดาห์เพื่อความแม่นยำ"
-)
 
-if weeks_to_forecast > len(df) // 4:
-    st.warning(f"⚠️ การพยากรณ์ {weeks_to_forecast} สัปดาห์ อาจไม่แม่นยำเนื่องจากข้อมูลจำกัด")
+def render_sensitivity(model, df, selected_factors, future_factors, weeks_to_forecast, stage_profiler):
+    """heatmap ความไวของการพยากรณ์ต่อค่าปัจจัยสองตัว (ปัจจัยอื่นใช้ค่าที่ตั้งไว้ด้านบน)"""
+    st.subheader("🎛️ ความไวต่อปัจจัยภายนอก")
+    st.caption("คำนวณจากส่วนประกอบของโมเดลที่เก็บไว้ ไม่ต้องพยากรณ์ใหม่ทุกชุดค่า (ไม่รวมช่วงความเชื่อมั่น)")
+    none_option = "ไม่มี"
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        x_factor = st.selectbox("ปัจจัยแกนนอน", selected_factors, key="sensitivity_x")
+    with col2:
+        y_options = [none_option] + [factor for factor in selected_factors if factor != x_factor]
+        y_factor = st.selectbox("ปัจจัยแกนตั้ง", y_options, index=min(1, len(y_options) - 1), key="sensitivity_y")
+    with col3:
+        label = st.selectbox("ค่าที่แสดง", list(SENSITIVITY_STATISTICS), key="sensitivity_statistic")
+    y_factor = None if y_factor == none_option else y_factor
+
+    with stage_profiler.stage('whatif'):
+        engine = build_whatif_engine(model, df, selected_factors, future_factors, weeks_to_forecast)
+        axes = {x_factor: factor_range(df, x_factor)}
+        if y_factor:
+            axes[y_factor] = factor_range(df, y_factor)
+        grid = engine.grid(axes)
+    st.plotly_chart(
+        build_sensitivity_figure(grid, x_factor, y_factor, SENSITIVITY_STATISTICS[label], label),
+        use_container_width=True
+    )
 
-# สร้างช่วงวันที่สำหรับการพยากรณ์
-future = model.make_future_dataframe(periods=weeks_to_forecast, freq='W')
+def render_stage_timings(stage_profiler, file_name, key, **context):
+    """ตารางเวลาแต่ละขั้นตอนของ stage_profiler พร้อมปุ่มดาวน์โหลด log (context ใส่ในทุกบรรทัดของ log)"""
+    stage_table = stage_profiler.table()
+    if len(stage_table) == 0:
+        return
+    st.caption(f"รวมทั้งรอบ {stage_profiler.elapsed_ms():,.0f} ms · ขั้นตอนที่ใช้แคชจะใช้เวลาน้อยมาก")
+    stage_table['stage'] = ['\u2003' * depth + stage for depth, stage in zip(stage_table['depth'], stage_table['stage'])]
+    st.dataframe(
+        stage_table[['stage', 'wall_ms', 'cpu_ms', 'peak_mb']].rename(columns={
+            'stage': 'ขั้นตอน',
+            'wall_ms': 'Wall (ms)',
+            'cpu_ms': 'CPU (ms)',
+            'peak_mb': 'Peak (MB)'
+        }).round(1),
+        use_container_width=True,
+        hide_index=True
+    )
+    st.download_button(
+        "⬇️ ดาวน์โหลด log (JSON Lines)",
+        stage_profiler.to_json_lines(**context),
+        file_name=file_name,
+        mime="application/x-ndjson",
+        key=key
+    )
 
-# เพิ่มค่าปัจจัยภายนอกสำหรับอนาคต
-for factor in selected_factors:
-    if factor in future_factors:
-        # เติมค่าในอดีต
-        historical_values = list(prophet_df[factor])
-        # เติมค่าในอนาคต
-        future_values = [future_factors[factor]] * weeks_to_forecast
-        # รวมกัน
-        future[factor] = historical_values + future_values
+# --- ส่วนพยากรณ์ (fragment: เปลี่ยน slider หรือค่าปัจจัยแล้ว rerun เฉพาะส่วนนี้ ไม่เทรนโมเดลใหม่) ---
+@st.fragment
+def render_forecast_section(model, df, prophet_df, selected_factors, history_forecast,
+                            has_validation, val_mae, val_mape, interval_mode, interval_samples):
+    """สร้างช่วงพยากรณ์อนาคตจากโมเดลที่เทรนแล้ว และแสดงตาราง/กราฟพยากรณ์"""
+    # rerun เฉพาะ fragment ไม่ได้รันส่วนท้ายของสคริปต์ จึงวัด แสดง และ log เวลาของส่วนนี้เอง
+    section_profiler = StageProfiler(track_memory=st.session_state.get('profile_memory', False))
+    # --- ส่วนสำหรับผู้ใช้ป้อนข้อมูลและพยากรณ์ ---
+    st.header("🔮 พยากรณ์จำนวนผู้ป่วย")
+
+    # จำกัดจำนวนสัปดาห์การพยากรณ์ให้สมเหตุสมผล
+    max_forecast_weeks = min(12, len(df) // 2)
+
+    # เลือกจำนวนสัปดาห์ก่อน เพื่อให้กำหนดค่าปัจจัยรายสัปดาห์ได้ครบทุกสัปดาห์
+    weeks_to_forecast = st.slider(
+        "เลือกจำนวนสัปดาห์ที่ต้องการพยากรณ์ไปข้างหน้า:",
+        min_value=1,
+        max_value=max_forecast_weeks,
+        value=min(4, max_forecast_weeks),
+        help=f"แนะนำไม่เกิน {max_forecast_weeks} สัปดาห์เพื่อความแม่นยำ"
+    )
 
-# ทำการพยากรณ์
-with st.spinner("🔮 กำลังพยากรณ์..."):
-    forecast = model.predict(future)
+    if weeks_to_forecast > len(df) // 4:
+        st.warning(f"⚠️ การพยากรณ์ {weeks_to_forecast} สัปดาห์ อาจไม่แม่นยำเนื่องจากข้อมูลจำกัด")
 
-# แยกข้อมูลการพยากรณ์ (เฉพาะส่วนอนาคต)
-forecast_future = forecast.tail(weeks_to_forecast).copy()
+    # วันที่ของสัปดาห์ที่พยากรณ์ (ตรงกับ make_future_dataframe ของโมเดล)
+    last_date = df['end_date'].max()
+    future_dates = pd.date_range(last_date, periods=weeks_to_forecast + 1, freq='W')
+    future_dates = future_dates[future_dates > last_date][:weeks_to_forecast]
+    future_factors = render_future_factor_inputs(df, selected_factors, future_dates)
 
-# เพิ่ม week_num สำหรับการแสดงผล
-last_week_num = df['week_num'].max()
-forecast_future['week_num'] = range(last_week_num + 1, last_week_num + weeks_to_forecast + 1)
+    # ทำการพยากรณ์เฉพาะส่วนอนาคต (ส่วนอดีตพยากรณ์ไว้แล้วใน history_forecast)
+    # ค่าพยากรณ์ถูกจำกัดให้อยู่ในช่วงที่สมเหตุสมผลในคอลัมน์ *_adjusted
+    with st.spinner("🔮 กำลังพยากรณ์..."), section_profiler.stage('predict_future', weeks=weeks_to_forecast):
+        forecast_future = forecast_future_weeks(
+            model, df, selected_factors, future_factors, weeks_to_forecast, interval_mode, interval_samples
+        )
 
-# เพิ่มการเปรียบเทียบกับ Simple Baseline
-recent_avg = df['cases'].tail(min(4, len(df))).mean()
-baseline_forecast = [recent_avg] * weeks_to_forecast
+    # เพิ่มการเปรียบเทียบกับ Simple Baseline
+    recent_avg = df['cases'].tail(min(4, len(df))).mean()
+    baseline_forecast = [recent_avg] * weeks_to_forecast
+
+    # ตรวจสอบความสมเหตุสมผลของการพยากรณ์
+    forecast_mean = forecast_future['yhat'].mean()
+    historical_mean = df['cases'].mean()
+    forecast_ratio = forecast_mean / historical_mean if historical_mean > 0 else float('inf')
+
+    # เตือนถ้าการพยากรณ์ผิดปกติ
+    if forecast_ratio > 3 or forecast_ratio < 0.3:
+        st.warning(f"⚠️ การพยากรณ์อาจไม่สมเหตุสมผล (เปลี่ยนแปลง {forecast_ratio:.1f} เท่าจากค่าเฉลี่ยเดิม)")
+
+    # --- แสดงผลลัพธ์การพยากรณ์ ---
+    st.subheader("📋 ผลการพยากรณ์")
+
+    # แสดงข้อมูล validation ถ้ามี
+    if has_validation:
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.metric("Validation MAE", f"{val_mae:.2f}")
+        with col2:
+            if val_mape < 1000:  # แสดงเฉพาะเมื่อ MAPE สมเหตุสมผล
+                st.metric("Validation MAPE", f"{val_mape:.1f}%")
+            else:
+                st.metric("Validation MAPE", "ข้อมูลไม่เพียงพอ")
+        with col3:
+            if selected_factors:
+                st.metric("External Factors", f"{len(selected_factors)} ตัว")
+            else:
+                st.metric("โมเดล", "พื้นฐาน")
+
+    # สร้างตารางผลการพยากรณ์
+    forecast_display_data = {
+        'สัปดาห์ที่': forecast_future['week_num'].astype(int),
+        'วันที่': forecast_future['ds'].dt.strftime('%d/%m/%Y'),
+        'Prophet พยากรณ์ (ราย)': forecast_future['yhat_adjusted'].round(0).astype(int),
+        'Baseline เฉลี่ย (ราย)': [int(recent_avg)] * weeks_to_forecast,
+        'ต่างจาก Baseline': (forecast_future['yhat_adjusted'] - recent_avg).round(0).astype(int),
+        'ช่วงต่ำ (95% CI)': forecast_future['yhat_lower_adjusted'].round(0).astype(int),
+        'ช่วงสูง (95% CI)': forecast_future['yhat_upper_adjusted'].round(0).astype(int)
+    }
 
-# ตรวจสอบความสมเหตุสมผลของการพยากรณ์
-forecast_mean = forecast_future['yhat'].mean()
-historical_mean = df['cases'].mean()
-forecast_ratio = forecast_mean / historical_mean if historical_mean > 0 else float('inf')
+    # เพิ่มคอลัมน์ปัจจัยภายนอกถ้ามี
+    if selected_factors:
+        for factor in selected_factors:
+            if factor in future_factors:
+                forecast_display_data[f'{factor}'] = factor_path(future_factors[factor], weeks_to_forecast)
 
-# เตือนถ้าการพยากรณ์ผิดปกติ
-if forecast_ratio > 3 or forecast_ratio < 0.3:
-    st.warning(f"⚠️ การพยากรณ์อาจไม่สมเหตุสมผล (เปลี่ยนแปลง {forecast_ratio:.1f} เท่าจากค่าเฉลี่ยเดิม)")
+    forecast_display = pd.DataFrame(forecast_display_data)
+    st.dataframe(forecast_display, use_container_width=True)
 
-# จำกัดค่าพยากรณ์ให้อยู่ในช่วงที่สมเหตุสมผล
-min_reasonable = max(0, historical_mean * 0.1)
-max_reasonable = historical_mean * 5
+    # เตือนหากค่าพยากรณ์แตกต่างจาก baseline มากเกินไป
+    max_diff_percent = abs((forecast_future['yhat_adjusted'] - recent_avg) / recent_avg * 100).max()
+    if max_diff_percent > 50:
+        st.warning(f"⚠️ การพยากรณ์แตกต่างจาก baseline มากถึง {max_diff_percent:.1f}% - ควรตรวจสอบความสมเหตุสมผล")
+    elif max_diff_percent < 5:
+        st.info(f"ℹ️ การพยากรณ์ใกล้เคียง baseline ({max_diff_percent:.1f}%) - โมเดลอาจไม่ได้เพิ่มคุณค่ามากนัก")
 
-forecast_future['yhat_adjusted'] = forecast_future['yhat'].clip(min_reasonable, max_reasonable)
-forecast_future['yhat_upper_adjusted'] = forecast_future['yhat_upper'].clip(min_reasonable, max_reasonable)
-forecast_future['yhat_lower_adjusted'] = forecast_future['yhat_lower'].clip(0, max_reasonable)
+    # --- แสดงกราฟแนวโน้มและการพยากรณ์แบบเชื่อมต่อ ---
+    st.subheader("📈 กราฟแนวโน้มและการพยากรณ์")
 
-# --- แสดงผลลัพธ์การพยากรณ์ ---
-st.subheader("📋 ผลการพยากรณ์")
+    with section_profiler.stage('chart:forecast'):
+        fig = build_forecast_figure(df, history_forecast, forecast_future, baseline_forecast,
+                                    n_factors=len(selected_factors))
+        st.plotly_chart(fig, use_container_width=True)
+
+    if selected_factors:
+        render_scenario_comparison(model, df, selected_factors, future_factors, future_dates,
+                                   interval_mode, interval_samples, section_profiler)
+        render_sensitivity(model, df, selected_factors, future_factors, weeks_to_forecast, section_profiler)
+
+    # --- แสดงสถิติข้อมูลพื้นฐาน ---
+    st.subheader("📈 สถิติข้อมูลและการพยากรณ์")
+
+    col1, col2 = st.columns(2)
 
-# แสดงข้อมูล validation ถ้ามี
-if has_validation:
-    col1, col2, col3 = st.columns(3)
     with col1:
-        st.metric("Validation MAE", f"{val_mae:.2f}")
+        st.write("**สถิติข้อมูลในอดีต:**")
+        stats_df = pd.DataFrame({
+            'สถิติ': ['ค่าเฉลี่ย', 'ค่ามัธยฐาน', 'ส่วนเบียงเบนมาตรฐาน', 'ค่าต่ำสุด', 'ค่าสูงสุด'],
+            'ค่า': [
+                f"{df['cases'].mean():.1f} ราย",
+                f"{df['cases'].median():.1f} ราย", 
+                f"{df['cases'].std():.1f} ราย",
+                f"{df['cases'].min():.0f} ราย",
+                f"{df['cases'].max():.0f} ราย"
+            ]
+        })
+        st.dataframe(stats_df, hide_index=True)
+
     with col2:
-        if val_mape < 1000:  # แสดงเฉพาะเมื่อ MAPE สมเหตุสมผล
-            st.metric("Validation MAPE", f"{val_mape:.1f}%")
-        else:
-            st.metric("Validation MAPE", "ข้อมูลไม่เพียงพอ")
-    with col3:
-        if selected_factors:
-            st.metric("External Factors", f"{len(selected_factors)} ตัว")
-        else:
-            st.metric("โมเดล", "พื้นฐาน")
-
-# สร้างตารางผลการพยากรณ์
-forecast_display_data = {
-    'สัปดาห์ที่': forecast_future['week_num'].astype(int),
-    'วันที่': forecast_future['ds'].dt.strftime('%d/%m/%Y'),
-    'Prophet พยากรณ์ (ราย)': forecast_future['yhat_adjusted'].round(0).astype(int),
-    'Baseline เฉลี่ย (ราย)': [int(recent_avg)] * weeks_to_forecast,
-    'ต่างจาก Baseline': (forecast_future['yhat_adjusted'] - recent_avg).round(0).astype(int),
-    'ช่วงต่ำ (95% CI)': forecast_future['yhat_lower_adjusted'].round(0).astype(int),
-    'ช่วงสูง (95% CI)': forecast_future['yhat_upper_adjusted'].round(0).astype(int)
-}
+        st.write("**สถิติการพยากรณ์:**")
+        forecast_stats_df = pd.DataFrame({
+            'สถิติ': ['ค่าเฉลี่ย', 'ค่ามัธยฐาน', 'ส่วนเบียงเบนมาตรฐาน', 'ค่าต่ำสุด', 'ค่าสูงสุด'],
+            'ค่า': [
+                f"{forecast_future['yhat_adjusted'].mean():.1f} ราย",
+                f"{forecast_future['yhat_adjusted'].median():.1f} ราย",
+                f"{forecast_future['yhat_adjusted'].std():.1f} ราย", 
+                f"{forecast_future['yhat_adjusted'].min():.0f} ราย",
+                f"{forecast_future['yhat_adjusted'].max():.0f} ราย"
+            ]
+        })
+        st.dataframe(forecast_stats_df, hide_index=True)
 
-# เพิ่มคอลัมน์ปัจจัยภายนอกถ้ามี
-if selected_factors:
-    for factor in selected_factors:
-        if factor in future_factors:
-            forecast_display_data[f'{factor}'] = [future_factors[factor]] * weeks_to_forecast
-
-forecast_display = pd.DataFrame(forecast_display_data)
-st.dataframe(forecast_display, use_container_width=True)
-
-# เตือนหากค่าพยากรณ์แตกต่างจาก baseline มากเกินไป
-max_diff_percent = abs((forecast_future['yhat_adjusted'] - recent_avg) / recent_avg * 100).max()
-if max_diff_percent > 50:
-    st.warning(f"⚠️ การพยากรณ์แตกต่างจาก baseline มากถึง {max_diff_percent:.1f}% - ควรตรวจสอบความสมเหตุสมผล")
-elif max_diff_percent < 5:
-    st.info(f"ℹ️ การพยากรณ์ใกล้เคียง baseline ({max_diff_percent:.1f}%) - โมเดลอาจไม่ได้เพิ่มคุณค่ามากนัก")
-
-# --- แสดงกราฟแนวโน้มและการพยากรณ์แบบเชื่อมต่อ ---
-st.subheader("📈 กราฟแนวโน้มและการพยากรณ์")
-
-# สร้างกราฟที่เชื่อมต่อกัน
-fig = go.Figure()
-
-# 1. เพิ่มข้อมูลจริง
-fig.add_trace(go.Scatter(
-    x=df['week_num'],
-    y=df['cases'],
-    mode='lines+markers',
-    name='ข้อมูลจริง',
-    line=dict(color='blue', width=2),
-    marker=dict(size=8),
-    hovertemplate='สัปดาห์ที่: %{x}<br>ผู้ป่วย: %{y} ราย<extra></extra>'
-))
-
-# 2. สร้างข้อมูลการพยากรณ์แบบเชื่อมต่อ
-last_week = df['week_num'].max()
-last_cases = df['cases'].iloc[-1]
-
-# จุดเชื่อมต่อ + การพยากรณ์
-forecast_weeks_connected = [last_week] + list(range(last_week + 1, last_week + weeks_to_forecast + 1))
-forecast_values_connected = [last_cases] + list(forecast_future['yhat_adjusted'])
-
-fig.add_trace(go.Scatter(
-    x=forecast_weeks_connected,
-    y=forecast_values_connected,
-    mode='lines+markers',
-    name='Prophet พยากรณ์',
-    line=dict(color='red', width=2),
-    marker=dict(size=8, symbol='diamond'),
-    hovertemplate='สัปดาห์ที่: %{x}<br>พยากรณ์: %{y:.0f} ราย<extra></extra>'
-))
-
-# 3. เพิ่ม Confidence Interval แบบเชื่อมต่อ
-ci_upper_connected = [last_cases] + list(forecast_future['yhat_upper_adjusted'])
-ci_lower_connected = [last_cases] + list(forecast_future['yhat_lower_adjusted'])
-
-fig.add_trace(go.Scatter(
-    x=forecast_weeks_connected + forecast_weeks_connected[::-1],
-    y=ci_upper_connected + ci_lower_connected[::-1],
-    fill='toself',
-    fillcolor='rgba(255,0,0,0.2)',
-    line=dict(color='rgba(255,255,255,0)'),
-    name='ช่วงความเชื่อมั่น 95%',
-    showlegend=True,
-    hoverinfo='skip'
-))
-
-# 4. เพิ่ม Baseline แบบเชื่อมต่อ
-baseline_connected = [last_cases] + baseline_forecast
-fig.add_trace(go.Scatter(
-    x=forecast_weeks_connected,
-    y=baseline_connected,
-    mode='lines+markers',
-    name='Baseline (เฉลี่ย 4 สัปดาห์)',
-    line=dict(color='orange', width=2, dash='dot'),
-    marker=dict(size=6, symbol='square'),
-    hovertemplate='สัปดาห์ที่: %{x}<br>Baseline: %{y:.0f} ราย<extra></extra>'
-))
-
-# 5. เพิ่มเส้นแนวโน้มที่เชื่อมต่อ
-historical_trend = forecast[:len(df)]['yhat']
-trend_connected = list(historical_trend) + list(forecast_future['yhat_adjusted'])
-trend_weeks_connected = list(df['week_num']) + list(range(last_week + 1, last_week + weeks_to_forecast + 1))
-
-fig.add_trace(go.Scatter(
-    x=trend_weeks_connected,
-    y=trend_connected,
-    mode='lines',
-    name='แนวโน้ม (Prophet)',
-    line=dict(color='green', dash='dash', width=1),
-    opacity=0.7,
-    hovertemplate='สัปดาห์ที่: %{x}<br>แนวโน้ม: %{y:.0f} ราย<extra></extra>'
-))
-
-# 6. เพิ่มเส้นแบ่งระหว่างข้อมูลจริงกับการพยากรณ์
-fig.add_vline(
-    x=last_week + 0.5, 
-    line_dash="solid", 
-    line_color="gray",
-    line_width=2,
-    annotation_text="จุดเริ่มพยากรณ์",
-    annotation_position="top"
-)
+    # --- แสดงการวิเคราะห์แนวโน้ม ---
+    st.subheader("📊 การวิเคราะห์แนวโน้ม")
 
-# ตั้งค่ากราฟ
-title = 'แนวโน้มผู้ป่วยและการพยากรณ์ (Facebook Prophet'
-if selected_factors:
-    title += f' + {len(selected_factors)} External Factors'
-title += ')'
-
-fig.update_layout(
-    title={
-        'text': title,
-        'x': 0.5,
-        'xanchor': 'center'
-    },
-    xaxis_title='สัปดาห์ที่',
-    yaxis_title='จำนวนผู้ป่วย (ราย)',
-    hovermode='x unified',
-    showlegend=True,
-    height=600,
-    font=dict(family="kanit, sans-serif", size=12),
-    plot_bgcolor='white'
-)
+    col1, col2, col3 = st.columns(3)
 
-# ตั้งค่าช่วงแกน
-x_min = max(1, df['week_num'].min() - 1)
-x_max = df['week_num'].max() + weeks_to_forecast + 1
-fig.update_xaxes(
-    range=[x_min, x_max],
-    showgrid=True, 
-    gridwidth=1, 
-    gridcolor='lightgray',
-    dtick=max(1, (x_max - x_min) // 20)
-)
+    with col1:
+        avg_forecast = forecast_future['yhat_adjusted'].mean()
+        avg_historical = df['cases'].mean()
+        trend_change = ((avg_forecast - avg_historical) / avg_historical) * 100
+    
+        st.metric(
+            label="การเปลี่ยนแปลงค่าเฉลี่ย",
+            value=f"{trend_change:+.1f}%",
+            delta=f"{avg_forecast - avg_historical:+.1f} ราย"
+        )
 
-y_min = 0
-y_max = max(df['cases'].max(), forecast_future['yhat_upper'].max()) * 1.1
-fig.update_yaxes(
-    range=[y_min, y_max],
-    showgrid=True, 
-    gridwidth=1, 
-    gridcolor='lightgray'
-)
+    with col2:
+        first_forecast = forecast_future['yhat_adjusted'].iloc[0] 
+        last_forecast = forecast_future['yhat_adjusted'].iloc[-1]
+        forecast_trend = last_forecast - first_forecast
+    
+        st.metric(
+            label="แนวโน้มในช่วงพยากรณ์",
+            value="เพิ่มขึ้น" if forecast_trend > 0 else "ลดลง" if forecast_trend < 0 else "คงที่",
+            delta=f"{forecast_trend:+.1f} ราย"
+        )
 
-st.plotly_chart(fig, use_container_width=True)
+    with col3:
+        uncertainty = forecast_future['yhat_upper_adjusted'].mean() - forecast_future['yhat_lower_adjusted'].mean()
+        st.metric(
+            label="ช่วงความไม่แน่นอนเฉลี่ย",
+            value=f"±{uncertainty/2:.1f} ราย",
+            help="ช่วงความเชื่อมั่น 95% เฉลี่ย"
+        )
+
+    with st.sidebar.expander("⏱️ เวลาส่วนพยากรณ์ (รอบล่าสุด)"):
+        render_stage_timings(section_profiler, "forecast_stage_timings.jsonl", key='forecast_timing_log',
+                             section='forecast', data_source=st.session_state.data_source, rows=len(df))
+    section_profiler.log_summary(section='forecast', data_source=st.session_state.data_source, rows=len(df))
+
+render_forecast_section(model, df, prophet_df, selected_factors, history_forecast,
+                        has_validation, val_mae, val_mape, interval_mode, interval_samples)
 
 # --- คำนวณค่าทางสถิติของโมเดล ---
 try:
     # ใช้ข้อมูลในอดีตเพื่อประเมินความแม่นยำ
-    historical_forecast = forecast[forecast['ds'].isin(df['end_date'])]
+    historical_forecast = history_forecast[history_forecast['ds'].isin(df['end_date'])]
     
     if len(historical_forecast) == len(df):
         actual_values = df['cases'].values
         predicted_values = historical_forecast['yhat'].values
         
-        # คำนวณค่า error metrics
-        mae = mean_absolute_error(actual_values, predicted_values)
-        rmse = np.sqrt(mean_squared_error(actual_values, predicted_values))
-        mape = calculate_safe_mape(actual_values, predicted_values)  # ใช้ safe MAPE
-        r2 = r2_score(actual_values, predicted_values)
+        # คำนวณค่า error metrics (ใช้ safe MAPE)
+        with profiler.stage('metrics'):
+            metrics = compute_metrics(actual_values, predicted_values)
+        mae, rmse, mape, r2 = metrics['mae'], metrics['rmse'], metrics['mape'], metrics['r2']
         
         show_metrics = True
     else:
@@ -1208,108 +1407,97 @@ if show_metrics:
     # แสดงกราฟ Residuals Analysis
     st.subheader("🔍 การวิเคราะห์ Residuals")
 
-    residuals = actual_values - predicted_values
-
-    fig_residuals = go.Figure()
-
-    # กราฟ residuals vs predicted
-    fig_residuals.add_trace(go.Scatter(
-        x=predicted_values,
-        y=residuals,
-        mode='markers',
-        name='Residuals',
-        marker=dict(color='purple', size=8)
-    ))
-
-    # เส้น y=0
-    fig_residuals.add_hline(y=0, line_dash="dash", line_color="red")
-
-    fig_residuals.update_layout(
-        title="Residuals vs Predicted Values",
-        xaxis_title="ค่าพยากรณ์",
-        yaxis_title="Residuals (จริง - พยากรณ์)",
-        height=400
+    with profiler.stage('chart:residuals'):
+        fig_residuals = build_residuals_figure(actual_values, predicted_values)
+        st.plotly_chart(fig_residuals, use_container_width=True)
+
+# --- Backtest แบบ rolling-origin (expanding window) ---
+@st.cache_resource
+def get_backtest_cache():
+    """แคชผล backtest ตาม hash ของข้อมูลและการตั้งค่า (ใช้ร่วมกันทุก session)
+
+    เก็บผลรายจุดตัดด้วย จึงต้องจุได้มากกว่าแคชโมเดล
+    บนดิสก์ใช้โฟลเดอร์ย่อยของตัวเอง เพราะการลบไฟล์เกินจำนวนนับทุกไฟล์ในโฟลเดอร์
+    """
+    return ModelCache(
+        max_entries=BACKTEST_CACHE_MAX_ENTRIES,
+        disk_dir=os.path.join(MODEL_CACHE_DIR, BACKTEST_CACHE_SUBDIR) if MODEL_CACHE_DIR else None,
+        max_disk_entries=BACKTEST_CACHE_MAX_ENTRIES
     )
 
-    st.plotly_chart(fig_residuals, use_container_width=True)
-
-# --- แสดงสถิติข้อมูลพื้นฐาน ---
-st.subheader("📈 สถิติข้อมูลและการพยากรณ์")
-
-col1, col2 = st.columns(2)
-
-with col1:
-    st.write("**สถิติข้อมูลในอดีต:**")
-    stats_df = pd.DataFrame({
-        'สถิติ': ['ค่าเฉลี่ย', 'ค่ามัธยฐาน', 'ส่วนเบียงเบนมาตรฐาน', 'ค่าต่ำสุด', 'ค่าสูงสุด'],
-        'ค่า': [
-            f"{df['cases'].mean():.1f} ราย",
-            f"{df['cases'].median():.1f} ราย", 
-            f"{df['cases'].std():.1f} ราย",
-            f"{df['cases'].min():.0f} ราย",
-            f"{df['cases'].max():.0f} ราย"
-        ]
-    })
-    st.dataframe(stats_df, hide_index=True)
+st.subheader("🧪 Backtest แบบ Rolling-origin")
 
-with col2:
-    st.write("**สถิติการพยากรณ์:**")
-    forecast_stats_df = pd.DataFrame({
-        'สถิติ': ['ค่าเฉลี่ย', 'ค่ามัธยฐาน', 'ส่วนเบียงเบนมาตรฐาน', 'ค่าต่ำสุด', 'ค่าสูงสุด'],
-        'ค่า': [
-            f"{forecast_future['yhat_adjusted'].mean():.1f} ราย",
-            f"{forecast_future['yhat_adjusted'].median():.1f} ราย",
-            f"{forecast_future['yhat_adjusted'].std():.1f} ราย", 
-            f"{forecast_future['yhat_adjusted'].min():.0f} ราย",
-            f"{forecast_future['yhat_adjusted'].max():.0f} ราย"
-        ]
-    })
-    st.dataframe(forecast_stats_df, hide_index=True)
-
-# --- แสดงการวิเคราะห์แนวโน้ม ---
-st.subheader("📊 การวิเคราะห์แนวโน้ม")
-
-col1, col2, col3 = st.columns(3)
-
-with col1:
-    avg_forecast = forecast_future['yhat_adjusted'].mean()
-    avg_historical = df['cases'].mean()
-    trend_change = ((avg_forecast - avg_historical) / avg_historical) * 100
-    
-    st.metric(
-        label="การเปลี่ยนแปลงค่าเฉลี่ย",
-        value=f"{trend_change:+.1f}%",
-        delta=f"{avg_forecast - avg_historical:+.1f} ราย"
-    )
+if len(prophet_df) <= MIN_INITIAL_WEEKS:
+    st.info(f"ℹ️ ต้องมีข้อมูลมากกว่า {MIN_INITIAL_WEEKS} สัปดาห์จึงจะทำ backtest ได้")
+else:
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        bt_initial = st.number_input(
+            "จำนวนสัปดาห์เริ่มต้น (initial)",
+            min_value=MIN_INITIAL_WEEKS,
+            max_value=len(prophet_df) - 1,
+            value=max(MIN_INITIAL_WEEKS, len(prophet_df) // 2),
+            help="จำนวนสัปดาห์ที่ใช้เทรนในรอบแรก แต่ละรอบถัดไปจะขยายหน้าต่างออกไป"
+        )
+    with col2:
+        bt_step = st.number_input("ระยะห่างระหว่างจุดตัด (step)", min_value=1, max_value=26, value=1)
+    with col3:
+        bt_horizon = st.number_input(
+            "จำนวนสัปดาห์ที่พยากรณ์ (horizon)",
+            min_value=1,
+            max_value=len(prophet_df) - int(bt_initial),
+            value=min(4, len(prophet_df) - int(bt_initial))
+        )
 
-with col2:
-    first_forecast = forecast_future['yhat_adjusted'].iloc[0] 
-    last_forecast = forecast_future['yhat_adjusted'].iloc[-1]
-    forecast_trend = last_forecast - first_forecast
-    
-    st.metric(
-        label="แนวโน้มในช่วงพยากรณ์",
-        value="เพิ่มขึ้น" if forecast_trend > 0 else "ลดลง" if forecast_trend < 0 else "คงที่",
-        delta=f"{forecast_trend:+.1f} ราย"
-    )
+    if st.toggle("▶️ รัน backtest", help="เทรนทุกจุดตัดพร้อมกันหลาย process - ผลลัพธ์ถูกแคชตามข้อมูล"):
+        progress_bar = st.progress(0.0, text="🔄 กำลังทำ backtest...")
+        try:
+            with profiler.stage('backtest'):
+                bt_summary, bt_predictions = run_backtest(
+                    prophet_df, selected_factors,
+                    initial=int(bt_initial), step=int(bt_step), horizon=int(bt_horizon),
+                    config=model_config,
+                    cache=get_backtest_cache(),
+                    progress=lambda done, total: progress_bar.progress(done / total, text=f"🔄 จุดตัด {done}/{total}")
+                )
+        except ValueError as e:
+            progress_bar.empty()
+            st.warning(f"⚠️ ไม่สามารถทำ backtest ได้: {e}")
+        else:
+            progress_bar.empty()
+            st.write(f"**ผลจาก {bt_predictions['cutoff'].nunique()} จุดตัด:**")
+            st.dataframe(
+                bt_summary.rename(columns={
+                    'horizon': 'สัปดาห์ข้างหน้า',
+                    'n_cutoffs': 'จำนวนจุดตัด',
+                    'mae': 'MAE',
+                    'rmse': 'RMSE',
+                    'mape': 'MAPE (%)'
+                }).round(2),
+                use_container_width=True,
+                hide_index=True
+            )
 
-with col3:
-    uncertainty = forecast_future['yhat_upper_adjusted'].mean() - forecast_future['yhat_lower_adjusted'].mean()
-    st.metric(
-        label="ช่วงความไม่แน่นอนเฉลี่ย",
-        value=f"±{uncertainty/2:.1f} ราย",
-        help="ช่วงความเชื่อมั่น 95% เฉลี่ย"
-    )
+            with profiler.stage('chart:backtest'):
+                fig_backtest = build_backtest_figure(bt_summary)
+                st.plotly_chart(fig_backtest, use_container_width=True)
 
 # --- แสดงกราฟ components ของ Prophet ---
 st.subheader("🔧 การวิเคราะห์องค์ประกอบ (Trend & Seasonality)")
 
-try:
-    # สร้างกราฟ trend
-    fig_components = model.plot_components(forecast)
-    st.pyplot(fig_components)
-except Exception as e:
-    st.warning(f"ไม่สามารถแสดงกราฟ components ได้: {str(e)}")
+@st.cache_data(max_entries=MODEL_CACHE_MAX_ENTRIES, show_spinner=False)
+def components_figure(model_key, interval_mode, _model, _forecast):
+    """กราฟองค์ประกอบของโมเดล (ใช้ model_key และ interval_mode เป็นคีย์แคช)"""
+    return build_components_figure(_model, _forecast)
+
+# สร้างและส่งกราฟเฉพาะเมื่อผู้ใช้เปิดดู
+if st.toggle("▶️ แสดงกราฟองค์ประกอบ", help="แยก trend, seasonality และผลของปัจจัยภายนอกจากผลพยากรณ์ในอดีต"):
+    try:
+        with profiler.stage('chart:components'):
+            fig_components = components_figure(model_cache_key, interval_mode, model, history_forecast)
+            st.plotly_chart(fig_components, use_container_width=True)
+    except Exception as e:
+        st.warning(f"ไม่สามารถแสดงกราฟ components ได้: {str(e)}")
 
 # แสดงข้อมูลปัจจัยภายนอกที่มีผล
 if selected_factors and show_metrics:
@@ -1337,6 +1525,65 @@ st.caption("หมายเหตุ: การพยากรณ์นี้ใ
 if selected_factors:
     st.caption(f"โมเดลนี้รวมปัจจัยภายนอก {len(selected_factors)} ตัว เพื่อเพิ่มความแม่นยำ")
 
+# --- พยากรณ์ทุกพื้นที่ (Batch) ---
+BATCH_PAGE_SIZE = 50
+
+if long_df is not None:
+    st.subheader("🗂️ พยากรณ์ทุกพื้นที่ (Batch)")
+    n_series = long_df[series_col].nunique()
+    batch_weeks = st.number_input("จำนวนสัปดาห์ที่พยากรณ์ (ทุกพื้นที่):", min_value=1, max_value=12, value=4)
+    batch_key = make_cache_key(long_df, selected_factors, {
+        'kind': 'batch', 'weeks': int(batch_weeks), 'config': MODEL_CONFIG,
+        'interval_mode': interval_mode, 'interval_samples': interval_samples
+    })
+
+    if st.button(f"▶️ พยากรณ์ทั้ง {n_series} พื้นที่"):
+        progress_bar = st.progress(0.0, text="🔄 กำลังพยากรณ์ทุกพื้นที่...")
+        with profiler.stage('batch_forecast', series=n_series):
+            batch_forecast, batch_errors = run_batch_forecast(
+                long_df, series_col, selected_factors,
+                weeks_to_forecast=int(batch_weeks),
+                progress=lambda done, total: progress_bar.progress(done / total, text=f"🔄 เสร็จแล้ว {done}/{total} พื้นที่"),
+                interval_mode=interval_mode,
+                interval_samples=interval_samples
+            )
+        progress_bar.empty()
+        st.session_state.batch_result = (batch_key, batch_forecast, batch_errors)
+
+    batch_result = st.session_state.get('batch_result')
+    if batch_result is not None and batch_result[0] == batch_key:
+        _, batch_forecast, batch_errors = batch_result
+        st.success(f"✅ พยากรณ์สำเร็จ {batch_forecast['series'].nunique()} จาก {n_series} พื้นที่")
+
+        if len(batch_errors) > 0:
+            st.warning(f"⚠️ พยากรณ์ไม่สำเร็จ {len(batch_errors)} พื้นที่")
+            st.dataframe(batch_errors, use_container_width=True, hide_index=True)
+
+        # แบ่งหน้าตารางผลพยากรณ์
+        n_pages = max(1, -(-len(batch_forecast) // BATCH_PAGE_SIZE))
+        page = st.number_input(f"หน้า (ทั้งหมด {n_pages} หน้า)", min_value=1, max_value=n_pages, value=1)
+        page_rows = batch_forecast.iloc[(page - 1) * BATCH_PAGE_SIZE:page * BATCH_PAGE_SIZE]
+        st.dataframe(
+            pd.DataFrame({
+                'พื้นที่': page_rows['series'],
+                'สัปดาห์ที่': page_rows['week_num'].astype(int),
+                'วันที่': page_rows['ds'].dt.strftime('%d/%m/%Y'),
+                'Prophet พยากรณ์ (ราย)': page_rows['yhat_adjusted'].round(0).astype(int),
+                'ช่วงต่ำ (95% CI)': page_rows['yhat_lower_adjusted'].round(0).astype(int),
+                'ช่วงสูง (95% CI)': page_rows['yhat_upper_adjusted'].round(0).astype(int),
+                'Validation MAPE': page_rows['val_mape'].round(1)
+            }),
+            use_container_width=True,
+            hide_index=True
+        )
+
+        st.download_button(
+            "💾 ดาวน์โหลดผลพยากรณ์ทุกพื้นที่ (CSV)",
+            batch_forecast.to_csv(index=False).encode('utf-8'),
+            file_name="batch_forecast.csv",
+            mime="text/csv"
+        )
+
 # --- Sidebar Information ---
 st.sidebar.subheader("ข้อมูลโมเดล")
 st.sidebar.info("""
@@ -1432,6 +1679,8 @@ if st.session_state.data_source == "Google Sheets":
     st.sidebar.success("✅ เชื่อมต่อ Google Sheets สำเร็จ - ข้อมูลจะอัปเดตแบบ real-time")
 elif "ไฟล์:" in st.session_state.data_source:
     st.sidebar.info("📁 ใช้ไฟล์ที่อัปโหลด - ข้อมูลคงที่ตามไฟล์")
+elif st.session_state.data_source.startswith("คลังข้อมูล:"):
+    st.sidebar.info("💾 ใช้ชุดข้อมูลที่บันทึกไว้ - ข้อมูลคงที่ตามที่บันทึก")
 else:
     st.sidebar.warning("🎯 ใช้ข้อมูลตัวอย่าง - เพื่อการทดสอบเท่านั้น")
 
@@ -1450,10 +1699,10 @@ st.sidebar.markdown("""
 </div>
 """, unsafe_allow_html=True)
 
-# เพิ่มส่วนแสดงข้อมูล debug สำหรับ validation metrics
+# เพิ่มส่วนแสดงข้อมูล debug สำหรับ validation metrics และเวลาของแต่ละขั้นตอน
+st.sidebar.subheader("🔧 ข้อมูล Debug")
+
 if has_validation and val_mape is not None:
-    st.sidebar.subheader("🔧 ข้อมูล Debug")
-    
     if val_mape > 200:
         st.sidebar.error(f"⚠️ MAPE สูงมาก: {val_mape:.1f}%")
         st.sidebar.write("**สาเหตุที่เป็นไปได้:**")
@@ -1462,3 +1711,16 @@ if has_validation and val_mape is not None:
         st.sidebar.write("- ข้อมูลมี pattern ซับซ้อน")
     else:
         st.sidebar.success(f"✅ MAPE ปกติ: {val_mape:.1f}%")
+
+with st.sidebar.expander("⏱️ เวลาแต่ละขั้นตอน (รอบนี้)"):
+    st.toggle(
+        "วัดหน่วยความจำสูงสุด",
+        key='profile_memory',
+        help="ใช้ tracemalloc วัดหน่วยความจำของ Python ต่อขั้นตอน (ทำให้แอปช้าลงเล็กน้อยขณะเปิด)"
+    )
+    st.caption("ส่วนพยากรณ์ (slider และค่าปัจจัย) วัดแยกในหัวข้อ \"เวลาส่วนพยากรณ์\"")
+    render_stage_timings(profiler, "stage_timings.jsonl", key='stage_timing_log',
+                         data_source=st.session_state.data_source, rows=len(df))
+
+# เขียนเวลาแต่ละขั้นตอนลง log (logger 'flu_forecast.profiling' ระดับ INFO)
+profiler.log_summary(data_source=st.session_state.data_source, rows=len(df))
@@ -0,0 +1,162 @@
+"""Backtest แบบ rolling-origin (expanding window) สำหรับโมเดล Prophet
+
+แต่ละจุดตัด (cutoff) เทรนด้วยข้อมูลตั้งแต่ต้นจนถึงจุดตัด แล้วพยากรณ์ `horizon` สัปดาห์ถัดไป
+จุดตัดทั้งหมดถูกเทรนพร้อมกันใน process pool และตารางความผิดพลาดรายช่วงพยากรณ์
+ถูกแคชตาม hash ของข้อมูล
+"""
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+import pandas as pd
+
+from forecast_model import (
+    MODEL_CONFIG, calculate_safe_mape, fit_prophet_model, reset_process_pool, submit_task
+)
+from model_cache import make_cache_key
+
+# จำนวนสัปดาห์ขั้นต่ำของหน้าต่างเทรนแรก (initial=None = ใช้ครึ่งหนึ่งของข้อมูล แต่ไม่น้อยกว่านี้)
+MIN_INITIAL_WEEKS = 12
+
+
+def make_cutoffs(n_rows, initial=None, step=1, horizon=4):
+    """คืนรายการตำแหน่งจุดตัด (จำนวนแถวที่ใช้เทรน) ของแต่ละรอบ backtest"""
+    if initial is None:
+        initial = max(MIN_INITIAL_WEEKS, n_rows // 2)
+    if step < 1 or horizon < 1:
+        raise ValueError("step และ horizon ต้องมากกว่า 0")
+    if initial < 2:
+        raise ValueError("initial ต้องมีอย่างน้อย 2 สัปดาห์")
+    return list(range(initial, n_rows - horizon + 1, step))
+
+
+def recent_cutoffs(n_rows, horizon, max_cutoffs):
+    """จุดตัดเรียงจากล่าสุดย้อนหลัง ห่างกัน horizon สัปดาห์ (ช่วงทดสอบไม่ซ้อนกัน)
+
+    หน้าต่างเทรนแรกไม่น้อยกว่าครึ่งหนึ่งของข้อมูล ใช้ในการปรับค่าโมเดลและการเลือกปัจจัย
+    """
+    initial = max(MIN_INITIAL_WEEKS, n_rows // 2)
+    return list(range(n_rows - horizon, initial - 1, -horizon))[:max_cutoffs]
+
+
+def backtest_cutoff(data, factors, cutoff, horizon, config=MODEL_CONFIG):
+    """เทรนโมเดลด้วยข้อมูล data[:cutoff] แล้วพยากรณ์ช่วง data[cutoff:cutoff + horizon]"""
+    train_data = data.iloc[:cutoff]
+    test_data = data.iloc[cutoff:cutoff + horizon]
+
+    model = fit_prophet_model('primary', train_data, len(train_data), factors, config)
+    forecast = model.predict(test_data[['ds'] + list(factors)])
+
+    return pd.DataFrame({
+        'cutoff': train_data['ds'].iloc[-1],
+        'horizon': np.arange(1, len(test_data) + 1),
+        'ds': test_data['ds'].values,
+        'y': test_data['y'].values,
+        'yhat': forecast['yhat'].values
+    })
+
+
+def summarize_backtest(predictions):
+    """สรุปความผิดพลาดแยกตามช่วงพยากรณ์ (1..horizon สัปดาห์ข้างหน้า)"""
+    rows = []
+    for horizon, group in predictions.groupby('horizon', sort=True):
+        actual = group['y'].values
+        predicted = group['yhat'].values
+        errors = actual - predicted
+        rows.append({
+            'horizon': horizon,
+            'n_cutoffs': len(group),
+            'mae': np.mean(np.abs(errors)),
+            'rmse': np.sqrt(np.mean(errors ** 2)),
+            'mape': calculate_safe_mape(actual, predicted)
+        })
+    return pd.DataFrame(rows, columns=['horizon', 'n_cutoffs', 'mae', 'rmse', 'mape'])
+
+
+def run_backtest(data, factors, initial=None, step=1, horizon=4, config=MODEL_CONFIG,
+                 parallel=True, cache=None, progress=None):
+    """รัน rolling-origin backtest
+
+    คืนค่า (ตารางความผิดพลาดรายช่วงพยากรณ์, ตารางผลพยากรณ์ทุกจุดตัด)
+    cache: ModelCache (ไม่บังคับ) สำหรับเก็บผลตาม hash ของข้อมูลและการตั้งค่า
+    ผลของแต่ละจุดตัดถูกแคชตาม hash ของหน้าต่างข้อมูลที่ใช้ (data[:cutoff + horizon])
+    เมื่อข้อมูลถูกเพิ่มต่อท้าย จึงเทรนเฉพาะจุดตัดใหม่
+    progress(done, total): callback แจ้งความคืบหน้า
+    """
+    factors = list(factors)
+    cutoffs = make_cutoffs(len(data), initial, step, horizon)
+    if not cutoffs:
+        raise ValueError("ข้อมูลไม่พอสำหรับ backtest ตามค่าที่กำหนด")
+
+    cache_key = None
+    window_keys = {}
+    cached_windows = {}
+    if cache is not None:
+        cache_key = make_cache_key(data, factors, {
+            'kind': 'backtest', 'config': config,
+            'initial': cutoffs[0], 'step': step, 'horizon': horizon
+        })
+        cached = cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+        for cutoff in cutoffs:
+            window_keys[cutoff] = make_cache_key(data.iloc[:cutoff + horizon], factors, {
+                'kind': 'backtest_window', 'config': config, 'cutoff': cutoff, 'horizon': horizon
+            })
+            window = cache.get(window_keys[cutoff])
+            if window is not None:
+                cached_windows[cutoff] = window
+
+    pending = [cutoff for cutoff in cutoffs if cutoff not in cached_windows]
+    n_cached = len(cached_windows)
+    window_progress = None
+    if progress:
+        window_progress = lambda done, _: progress(n_cached + done, len(cutoffs))
+        progress(n_cached, len(cutoffs))
+
+    fitted = _run_cutoffs(data, factors, pending, horizon, config, parallel, window_progress)
+    for cutoff, window in zip(pending, fitted):
+        if cache is not None:
+            cache.put(window_keys[cutoff], window)
+        cached_windows[cutoff] = window
+
+    predictions = pd.concat([cached_windows[cutoff] for cutoff in cutoffs], ignore_index=True)
+    result = (summarize_backtest(predictions), predictions)
+
+    if cache is not None:
+        cache.put(cache_key, result)
+    return result
+
+
+def _run_cutoffs(data, factors, cutoffs, horizon, config, parallel, progress):
+    return run_windows(data, [(factors, cutoff, config) for cutoff in cutoffs], horizon, parallel, progress)
+
+
+def run_windows(data, jobs, horizon, parallel=True, progress=None, task=backtest_cutoff):
+    """รัน task(data, factors, cutoff, horizon, config) ของทุกงาน (factors, cutoff, config) พร้อมกันใน process pool
+
+    คืนค่าผลตามลำดับ jobs ถ้า process pool ใช้ไม่ได้ งานที่เหลือจะรันใน process ปัจจุบัน
+    task ต้องเป็นฟังก์ชันระดับโมดูลเพื่อส่งไป worker ได้ (ค่าเริ่มต้น = backtest_cutoff)
+    progress(done, total): callback แจ้งความคืบหน้า
+    """
+    total = len(jobs)
+    results = []
+    if parallel and total > 1:
+        try:
+            futures = [
+                submit_task(task, data, factors, cutoff, horizon, config)
+                for factors, cutoff, config in jobs
+            ]
+            for future in futures:
+                results.append(future.result())
+                if progress:
+                    progress(len(results), total)
+            return results
+        except (BrokenProcessPool, OSError):
+            reset_process_pool()
+
+    for factors, cutoff, config in jobs[len(results):]:
+        results.append(task(data, factors, cutoff, horizon, config))
+        if progress:
+            progress(len(results), total)
+    return results
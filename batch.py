@@ -0,0 +1,160 @@
+"""พยากรณ์หลายอนุกรมพร้อมกัน (ระดับจังหวัด/อำเภอ) จากข้อมูลแบบ long format
+
+แต่ละอนุกรมถูกเทรนด้วยขั้นตอนเดียวกับ train_prophet_model_with_factors
+งานถูกแบ่งเป็นกลุ่ม (chunk) ส่งเข้า process pool โดยจำกัดจำนวนกลุ่มที่ค้างอยู่พร้อมกัน
+เพื่อคุมการใช้หน่วยความจำ อนุกรมที่ล้มเหลวจะถูกบันทึกไว้โดยไม่กระทบอนุกรมอื่น
+"""
+from concurrent.futures import FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+import pandas as pd
+
+from forecast_model import (
+    MAX_WORKERS, MODEL_CONFIG, clip_forecast, reset_process_pool, submit_task,
+    train_prophet_model_with_factors
+)
+from intervals import predict_with_intervals
+
+FORECAST_COLUMNS = [
+    'series', 'ds', 'week_num', 'yhat', 'yhat_lower', 'yhat_upper',
+    'yhat_adjusted', 'yhat_lower_adjusted', 'yhat_upper_adjusted', 'val_mae', 'val_mape'
+]
+ERROR_COLUMNS = ['series', 'error']
+
+
+def forecast_single_series(data, factors, weeks_to_forecast, config=MODEL_CONFIG,
+                           interval_mode=None, interval_samples=None):
+    """เทรนและพยากรณ์อนุกรมเดียว (data มีคอลัมน์ end_date, cases, week_num และปัจจัย)
+
+    ค่าปัจจัยภายนอกในอนาคตใช้ค่าเฉลี่ยของอนุกรมนั้น
+    interval_mode, interval_samples: วิธีคำนวณช่วงความเชื่อมั่น (ดู intervals.py, ค่าเริ่มต้นจาก INTERVAL_CONFIG)
+    """
+    prophet_df = pd.DataFrame({'ds': data['end_date'].values, 'y': data['cases'].values})
+    for factor in factors:
+        prophet_df[factor] = data[factor].values
+
+    # เทรนภายใน worker อยู่แล้ว จึงไม่เปิด process pool ซ้อน
+    model, val_mae, val_mape, _ = train_prophet_model_with_factors(
+        prophet_df, factors, config=config, parallel=False
+    )
+
+    future = model.make_future_dataframe(periods=weeks_to_forecast, freq='W', include_history=False)
+    for factor in factors:
+        future[factor] = prophet_df[factor].mean()
+
+    forecast_future = predict_with_intervals(model, future, interval_mode, interval_samples)
+    forecast_future = forecast_future[['ds', 'yhat', 'yhat_lower', 'yhat_upper']]
+    forecast_future = clip_forecast(forecast_future, data['cases'].mean())
+
+    last_week_num = int(data['week_num'].max())
+    forecast_future['week_num'] = range(last_week_num + 1, last_week_num + weeks_to_forecast + 1)
+    forecast_future['val_mae'] = np.nan if val_mae is None else val_mae
+    forecast_future['val_mape'] = np.nan if val_mape is None else val_mape
+    return forecast_future
+
+
+def forecast_chunk(chunk, factors, weeks_to_forecast, config=MODEL_CONFIG,
+                   interval_mode=None, interval_samples=None):
+    """พยากรณ์กลุ่มของอนุกรม [(key, data), ...] คืนค่า (ผลพยากรณ์, ข้อผิดพลาด)"""
+    forecasts = []
+    errors = []
+    for key, data in chunk:
+        try:
+            forecast_future = forecast_single_series(
+                data, factors, weeks_to_forecast, config, interval_mode, interval_samples
+            )
+        except Exception as e:
+            errors.append({'series': key, 'error': f"{type(e).__name__}: {e}"})
+            continue
+        forecast_future.insert(0, 'series', key)
+        forecasts.append(forecast_future)
+
+    forecast_df = pd.concat(forecasts, ignore_index=True) if forecasts else None
+    return forecast_df, errors
+
+
+def iter_series_chunks(long_df, series_col, factors, chunk_size):
+    """แบ่งข้อมูล long format เป็นกลุ่มละ chunk_size อนุกรม (สร้างทีละกลุ่มเมื่อต้องการ)"""
+    columns = ['end_date', 'cases', 'week_num'] + list(factors)
+    chunk = []
+    for key, group in long_df.groupby(series_col, sort=True, observed=True):
+        chunk.append((key, group[columns].reset_index(drop=True)))
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def run_batch_forecast(long_df, series_col, factors, weeks_to_forecast=4, config=MODEL_CONFIG,
+                       chunk_size=8, max_in_flight=None, parallel=True, progress=None,
+                       interval_mode=None, interval_samples=None):
+    """พยากรณ์ทุกอนุกรมในข้อมูล long format
+
+    คืนค่า (ตารางพยากรณ์รวมทุกอนุกรม, ตารางอนุกรมที่ล้มเหลว)
+    max_in_flight: จำนวนกลุ่มสูงสุดที่ส่งเข้า pool พร้อมกัน (ค่าเริ่มต้น 2 เท่าของจำนวน worker)
+    interval_mode, interval_samples: วิธีคำนวณช่วงความเชื่อมั่นของทุกอนุกรม (ดู intervals.py)
+    progress(done, total): callback แจ้งจำนวนอนุกรมที่เสร็จแล้ว
+    """
+    factors = list(factors)
+    total = long_df[series_col].nunique()
+    chunks = iter_series_chunks(long_df, series_col, factors, chunk_size)
+    max_in_flight = max_in_flight or 2 * MAX_WORKERS
+
+    forecasts = []
+    errors = []
+    done = 0
+
+    def collect(result, n_series):
+        nonlocal done
+        forecast_df, chunk_errors = result
+        if forecast_df is not None:
+            forecasts.append(forecast_df)
+        errors.extend(chunk_errors)
+        done += n_series
+        if progress:
+            progress(done, total)
+
+    pending = {}
+    try:
+        for chunk in chunks:
+            if not parallel:
+                collect(forecast_chunk(chunk, factors, weeks_to_forecast, config,
+                                       interval_mode, interval_samples), len(chunk))
+                continue
+
+            # จำกัดจำนวนงานที่ค้างอยู่ เพื่อไม่ให้ข้อมูลทุกอนุกรมถูกส่งเข้า pool พร้อมกัน
+            while len(pending) >= max_in_flight:
+                finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    collect(future.result(), pending.pop(future))
+
+            future = submit_task(forecast_chunk, chunk, factors, weeks_to_forecast, config,
+                                 interval_mode, interval_samples)
+            pending[future] = len(chunk)
+
+        for future in list(pending):
+            collect(future.result(), pending.pop(future))
+    except (BrokenProcessPool, OSError):
+        # pool เสีย - ทำอนุกรมที่เหลือแบบทีละตัวใน process นี้
+        reset_process_pool()
+        finished_series = set()
+        for forecast_df in forecasts:
+            finished_series.update(forecast_df['series'].unique())
+        finished_series.update(error['series'] for error in errors)
+        remaining = long_df[~long_df[series_col].isin(finished_series)]
+        rest_forecasts, rest_errors = run_batch_forecast(
+            remaining, series_col, factors, weeks_to_forecast, config,
+            chunk_size=chunk_size, parallel=False,
+            progress=(lambda n, _: progress(done + n, total)) if progress else None,
+            interval_mode=interval_mode, interval_samples=interval_samples
+        )
+        forecasts.append(rest_forecasts)
+        errors.extend(rest_errors.to_dict('records'))
+
+    forecast_table = (
+        pd.concat(forecasts, ignore_index=True) if forecasts
+        else pd.DataFrame(columns=FORECAST_COLUMNS)
+    )
+    return forecast_table[FORECAST_COLUMNS], pd.DataFrame(errors, columns=ERROR_COLUMNS)
@@ -0,0 +1,655 @@
+"""วัดเวลาของขั้นตอนหลักในแอปตามความยาวของข้อมูล แล้วบันทึกผลเป็น JSON เพื่อเทียบระหว่างเวอร์ชัน
+
+กลุ่มที่วัด:
+- parse_csv: อ่าน CSV + ทำความสะอาด (อนุกรมเดียว, หลายอนุกรม และรวมข้อมูลรายวันเป็นรายสัปดาห์)
+- sheets: ดาวน์โหลดจากเซิร์ฟเวอร์ HTTP จำลองในเครื่อง (ครั้งแรก / ตรวจสอบซ้ำแบบ 304) + แปลงข้อมูล
+- quality: find_quality_issues
+- fit: train_prophet_model_with_factors กับปัจจัยภายนอก 0-8 ตัว, การปรับค่าโมเดล (tune_model_config) หนึ่งครั้ง
+  และการเลือกปัจจัยอัตโนมัติ (select_factors) ครั้งแรกเทียบกับครั้งที่สองที่ใช้ผลที่จำไว้
+- predict: พยากรณ์อนาคตหลายช่วง (แยกตามวิธีคำนวณช่วงความเชื่อมั่น), พยากรณ์ย้อนหลังทั้งหมด
+  หลายสถานการณ์ในครั้งเดียวเทียบกับวนพยากรณ์ทีละสถานการณ์ และตารางความไว (WhatIfEngine)
+- figures: สร้างกราฟ Plotly และแปลงเป็น JSON (สิ่งที่ st.plotly_chart ทำ) พร้อมขนาด payload
+- rerun: รัน app.py ทั้งสคริปต์ผ่าน AppTest ครั้งแรก (เทรน) และ rerun (ใช้แคช)
+- startup: import ทุกอย่างที่ app.py import ใน process ใหม่ (เวลาก่อนหน้าแรกแสดงผล) เทียบกับงบ
+  STARTUP_BUDGET_SECONDS และตรวจว่าไม่มีไลบรารีหนักถูกโหลดตั้งแต่เริ่ม
+
+ข้อมูลทั้งหมดมาจาก synthetic.py (seed คงที่) ความยาวตั้งแต่ 10 สัปดาห์ถึง 20 ปี
+
+ตัวอย่าง:
+    python benchmark.py --output bench/base.json
+    python benchmark.py --quick --only fit,predict
+    python benchmark.py --output bench/new.json --compare bench/base.json
+"""
+import argparse
+import ast
+import hashlib
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pandas as pd
+
+from charts import (
+    build_box_figure, build_components_figure, build_forecast_figure, build_histogram_figure,
+    build_residuals_figure
+)
+from daily import aggregate_daily_csv
+from dataset_store import DatasetStore, dataset_key, hash_content
+from forecast_model import MODEL_CONFIG, train_prophet_model_with_factors
+from ingest import DATE_FORMAT, EXTERNAL_FACTOR_COLUMNS, read_weekly_csv
+from intervals import predict_with_intervals
+from model_cache import ModelCache
+import pipeline
+from pipeline import (
+    build_prophet_frame, build_whatif_engine, default_future_factors, forecast_future_weeks, forecast_scenarios,
+    load_sheet_tabs, prepare_data
+)
+from quality import find_quality_issues
+from sheets import SHEETS_MAX_WORKERS, SheetsFetcher
+from synthetic import SAMPLE_START_DATE, generate_synthetic_data, write_dataset
+from selection import select_factors, subset_cache
+from tuning import tune_model_config
+
+BENCHMARK_GROUPS = ['parse_csv', 'sheets', 'quality', 'fit', 'predict', 'figures', 'rerun', 'startup']
+
+# ความยาวข้อมูล (สัปดาห์): 10 สัปดาห์ ถึง 20 ปี
+HISTORY_LENGTHS = [10, 52, 104, 260, 520, 1040]
+QUICK_HISTORY_LENGTHS = [10, 52, 260]
+FACTOR_COUNTS = [0, 1, 2, 4, 8]
+QUICK_FACTOR_COUNTS = [0, 8]
+# ความยาวข้อมูลของการวัด tune_model_config (วัดครั้งเดียวเพราะเทรนหลายสิบโมเดล)
+TUNING_WEEKS = 104
+PREDICT_HORIZONS = [1, 4, 12, 26, 52]
+SCENARIO_COUNTS = [1, 10, 50]
+# จำนวนค่าต่อแกนของตาราง what-if 3 ปัจจัย (ชุดค่าผสม = ค่านี้ยกกำลังสาม)
+WHATIF_GRID_SIZES = [5, 20, 50]
+RERUN_LENGTHS = [52, 260, 1040]
+QUICK_RERUN_LENGTHS = [52]
+
+# ข้อมูลหลายอนุกรม (long format) สำหรับ parse_csv และ quality
+MULTI_SERIES_WEEKS = 520
+MULTI_SERIES_COUNT = 900
+QUICK_MULTI_SERIES_COUNT = 100
+# จำนวนโรงพยาบาลในข้อมูลรายวันจำลอง (แถวต่อวัน)
+DAILY_HOSPITALS = 50
+# workbook จำลอง: จำนวนแท็บพื้นที่ (+ แท็บปัจจัย 1 แท็บ) และเวลาตอบของแต่ละคำขอ
+SHEETS_WORKBOOK_TABS = 90
+SHEETS_TAB_LATENCY = 0.2
+
+# ถ้าค่ามัธยฐานช้ากว่าผลเดิมเกินสัดส่วนนี้ ถือว่า regression
+REGRESSION_THRESHOLD = 1.2
+# ส่วนต่างที่น้อยกว่านี้ (วินาที) ถือเป็นความคลาดเคลื่อนของการวัด ไม่นับเป็น regression
+REGRESSION_MIN_SECONDS = 0.005
+
+# เวลา import ของ app.py ใน process ใหม่ที่ยอมรับได้ (วินาที)
+STARTUP_BUDGET_SECONDS = 2.0
+# ไลบรารีที่ต้อง import เมื่อใช้งานจริงเท่านั้น (ไม่ควรถูกโหลดก่อนหน้าแรกแสดงผล)
+DEFERRED_MODULES = ['prophet', 'cmdstanpy', 'sklearn', 'matplotlib', 'plotly.express']
+
+
+def measure(func, repeat=3):
+    """เรียก func ซ้ำ repeat ครั้ง คืนค่า (ผลลัพธ์ครั้งสุดท้าย, สถิติเวลาเป็นวินาที)"""
+    timings = []
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - started)
+    return result, {
+        'min': min(timings),
+        'median': statistics.median(timings),
+        'mean': statistics.fmean(timings),
+        'repeat': repeat,
+    }
+
+
+class BenchmarkRecorder:
+    """เก็บผลการวัดและพิมพ์ความคืบหน้า"""
+
+    def __init__(self, verbose=True):
+        self.results = []
+        self.verbose = verbose
+
+    def add(self, group, name, params, stats):
+        self.results.append({'group': group, 'name': name, 'params': params, 'stats': stats})
+        if self.verbose:
+            params_text = ', '.join(f"{key}={value}" for key, value in params.items())
+            print(f"{group:<10} {name:<24} {params_text:<36} median {stats['median'] * 1000:10.1f} ms",
+                  flush=True)
+
+
+def _weeks_data(n_weeks, with_factors=True):
+    return generate_synthetic_data(n_weeks=n_weeks, with_factors=with_factors, seed=42)
+
+
+def _csv_bytes(df):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'data.csv')
+        write_dataset(df, path)
+        with open(path, 'rb') as f:
+            return f.read()
+
+
+def _daily_csv_bytes(n_weeks, n_hospitals=DAILY_HOSPITALS):
+    """CSV รายวันรายโรงพยาบาล (วันที่, โรงพยาบาล, cases, อุณหภูมิ) ครอบคลุม n_weeks สัปดาห์"""
+    rng = np.random.default_rng(42)
+    days = pd.date_range(SAMPLE_START_DATE, periods=n_weeks * 7, freq='D') - pd.Timedelta(days=6)
+    df = pd.DataFrame({
+        'date': np.repeat(days.strftime(DATE_FORMAT).to_numpy(), n_hospitals),
+        'hospital': np.tile([f"H{i:03d}" for i in range(n_hospitals)], len(days)),
+        'cases': rng.poisson(3, size=len(days) * n_hospitals),
+        'temperature': np.repeat(26 + 6 * np.sin(np.arange(len(days)) / 58), n_hospitals).round(1),
+    })
+    return df.to_csv(index=False).encode()
+
+
+def bench_parse_csv(recorder, lengths, n_multi_series, repeat):
+    for n_weeks in lengths:
+        content = _csv_bytes(_weeks_data(n_weeks))
+        _, read_stats = measure(lambda: pd.read_csv(io.BytesIO(content)), repeat)
+        raw = pd.read_csv(io.BytesIO(content))
+        _, prepare_stats = measure(lambda: prepare_data(raw), repeat)
+        params = {'weeks': n_weeks, 'bytes': len(content)}
+        recorder.add('parse_csv', 'read_csv', params, read_stats)
+        recorder.add('parse_csv', 'prepare_data', params, prepare_stats)
+        _, stats = measure(lambda: read_weekly_csv(io.BytesIO(content)), repeat)
+        recorder.add('parse_csv', 'read_weekly_csv', params, stats)
+
+    content = _csv_bytes(generate_synthetic_data(n_series=n_multi_series, n_weeks=MULTI_SERIES_WEEKS))
+    _, stats = measure(lambda: prepare_data(pd.read_csv(io.BytesIO(content))), repeat)
+    recorder.add('parse_csv', 'read_prepare_long',
+                 {'weeks': MULTI_SERIES_WEEKS, 'series': n_multi_series, 'bytes': len(content)}, stats)
+    _, stats = measure(lambda: read_weekly_csv(io.BytesIO(content)), repeat)
+    recorder.add('parse_csv', 'read_weekly_csv_long',
+                 {'weeks': MULTI_SERIES_WEEKS, 'series': n_multi_series, 'bytes': len(content)}, stats)
+    # เปิดชุดเดียวกันจากคลังชุดข้อมูล (memory-map แทนการอ่านและทำความสะอาดใหม่)
+    with tempfile.TemporaryDirectory() as tmp:
+        store = DatasetStore(tmp)
+        key = dataset_key(hash_content(content))
+        df_long, series_col, notes = read_weekly_csv(io.BytesIO(content))
+        store.save(key, df_long, 'benchmark', series_col=series_col, notes=notes)
+        _, stats = measure(lambda: store.load(key), repeat)
+        recorder.add('parse_csv', 'open_stored_long',
+                     {'weeks': MULTI_SERIES_WEEKS, 'series': n_multi_series, 'bytes': len(content)}, stats)
+
+    # ข้อมูลรายวันรายโรงพยาบาล อ่านทีละ chunk แล้วรวมเป็นรายสัปดาห์
+    for n_weeks in lengths:
+        content = _daily_csv_bytes(n_weeks)
+        _, stats = measure(lambda: aggregate_daily_csv(io.BytesIO(content)), repeat)
+        recorder.add('parse_csv', 'aggregate_daily',
+                     {'weeks': n_weeks, 'hospitals': DAILY_HOSPITALS, 'bytes': len(content)}, stats)
+
+
+def _serve_bytes(payloads, latency=0.0):
+    """เซิร์ฟเวอร์ HTTP จำลองปลายทาง export ของ Google Sheets (รองรับ ETag / 304, หน่วงเวลาทุกคำขอได้)"""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            time.sleep(latency)
+            content = payloads[self.path]
+            etag = '"%s"' % hashlib.md5(content).hexdigest()
+            if self.headers.get('If-None-Match') == etag:
+                self.send_response(304)
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header('ETag', etag)
+            self.send_header('Content-Length', str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler, bind_and_activate=False)
+    # คิวรอเชื่อมต่อค่าเริ่มต้นมีแค่ 5 - คำขอพร้อมกันจำนวนมากจะถูกปฏิเสธแล้วลองใหม่ช้าๆ
+    server.request_queue_size = 128
+    server.server_bind()
+    server.server_activate()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def _workbook_payloads(workbook_id, n_regions, n_weeks):
+    """workbook จำลอง: หนึ่งแท็บต่อพื้นที่ (end_date, cases, week_num) + แท็บปัจจัยภายนอกหนึ่งแท็บ"""
+    base = f"/spreadsheets/d/{workbook_id}"
+    cases = generate_synthetic_data(n_series=n_regions, n_weeks=n_weeks, with_factors=False)
+    weather = generate_synthetic_data(n_weeks=n_weeks)[['end_date'] + EXTERNAL_FACTOR_COLUMNS]
+    tabs = [(str(1000 + i), f"R{i:02d}", group.drop(columns=['series_id']))
+            for i, (_, group) in enumerate(cases.groupby('series_id', sort=True))]
+    tabs.append(('0', 'weather', weather))
+    payloads = {f"{base}/export?format=csv&gid={gid}": _csv_bytes(df) for gid, _, df in tabs}
+    items = ''.join(
+        f'items.push({{name: "{name}", pageUrl: "https:\\/\\/docs.google.com{base}\\/htmlview\\/sheet?gid\\x3d{gid}", '
+        f'gid: "{gid}", initialSheet: false}});'
+        for gid, name, _ in tabs
+    )
+    payloads[f"{base}/htmlview"] = f"<html><script>{items}</script></html>".encode('utf-8')
+    return payloads
+
+
+def bench_sheets(recorder, lengths, repeat):
+    payloads = {f"/export/{n_weeks}.csv": _csv_bytes(_weeks_data(n_weeks)) for n_weeks in lengths}
+    server = _serve_bytes(payloads)
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    try:
+        for n_weeks in lengths:
+            url = f"{base}/export/{n_weeks}.csv"
+            params = {'weeks': n_weeks, 'bytes': len(payloads[f"/export/{n_weeks}.csv"])}
+            # ครั้งแรก: ตัวดึงใหม่ทุกครั้ง จึงดาวน์โหลดเนื้อหาเต็ม
+            _, stats = measure(lambda: SheetsFetcher(ttl=0).fetch(url), repeat)
+            recorder.add('sheets', 'download', params, stats)
+
+            fetcher = SheetsFetcher(ttl=0)
+            fetcher.fetch(url)
+            _, stats = measure(lambda: fetcher.fetch(url, force=True), repeat)
+            recorder.add('sheets', 'revalidate_304', params, stats)
+
+            content = fetcher.fetch(url).content
+            _, stats = measure(lambda: prepare_data(pd.read_csv(io.BytesIO(content))), repeat)
+            recorder.add('sheets', 'parse', params, stats)
+    finally:
+        server.shutdown()
+
+    # workbook หลายแท็บ ทุกคำขอหน่วง SHEETS_TAB_LATENCY วินาที (ดึงพร้อมกัน ≈ แท็บที่ช้าที่สุด)
+    payloads = _workbook_payloads('workbook', SHEETS_WORKBOOK_TABS, 52)
+    server = _serve_bytes(payloads, latency=SHEETS_TAB_LATENCY)
+    export_base = pipeline.SHEETS_EXPORT_BASE
+    pipeline.SHEETS_EXPORT_BASE = f"http://127.0.0.1:{server.server_address[1]}"
+    url = "https://docs.google.com/spreadsheets/d/workbook/edit"
+    try:
+        for max_workers in (1, SHEETS_MAX_WORKERS):
+            params = {'tabs': SHEETS_WORKBOOK_TABS + 1, 'latency_ms': SHEETS_TAB_LATENCY * 1000,
+                      'workers': max_workers}
+            _, stats = measure(lambda: load_sheet_tabs(url, fetcher=SheetsFetcher(ttl=0), max_workers=max_workers),
+                               repeat)
+            recorder.add('sheets', 'workbook_tabs', params, stats)
+    finally:
+        pipeline.SHEETS_EXPORT_BASE = export_base
+        server.shutdown()
+
+
+def bench_quality(recorder, lengths, n_multi_series, repeat):
+    for n_weeks in lengths:
+        df = _weeks_data(n_weeks, with_factors=False)
+        _, stats = measure(lambda: find_quality_issues(df), repeat)
+        recorder.add('quality', 'single_series', {'weeks': n_weeks}, stats)
+
+    df = generate_synthetic_data(n_series=n_multi_series, n_weeks=MULTI_SERIES_WEEKS, with_factors=False)
+    _, stats = measure(lambda: find_quality_issues(df, 'series_id'), repeat)
+    recorder.add('quality', 'long_format', {'weeks': MULTI_SERIES_WEEKS, 'series': n_multi_series}, stats)
+
+
+def _fit(df, factors, parallel):
+    prophet_df = build_prophet_frame(df, factors)
+    return train_prophet_model_with_factors(prophet_df, factors, config=MODEL_CONFIG, parallel=parallel)
+
+
+def bench_fit(recorder, lengths, factor_counts, repeat, parallel):
+    # เริ่ม process pool ก่อน เพื่อไม่ให้เวลาเริ่มต้นไปรวมกับรายการแรก
+    _fit(_weeks_data(52), [], parallel)
+    for n_weeks in lengths:
+        df = _weeks_data(n_weeks)
+        for n_factors in factor_counts:
+            factors = EXTERNAL_FACTOR_COLUMNS[:n_factors]
+            _, stats = measure(lambda: _fit(df, factors, parallel), repeat)
+            recorder.add('fit', 'train_with_factors',
+                         {'weeks': n_weeks, 'factors': n_factors, 'parallel': parallel}, stats)
+
+    # successive halving: จำนวนโมเดลที่เทรนจริงเทียบกับการค้นหาครบทุกชุด
+    factors = list(EXTERNAL_FACTOR_COLUMNS)
+    prophet_df = build_prophet_frame(_weeks_data(TUNING_WEEKS), factors)
+    result, stats = measure(lambda: tune_model_config(prophet_df, factors, parallel=parallel), repeat=1)
+    recorder.add('fit', 'tune', {
+        'weeks': TUNING_WEEKS, 'parallel': parallel,
+        'fits': result['n_fits'], 'exhaustive_fits': result['n_fits_exhaustive']
+    }, stats)
+
+    # stepwise: ครั้งแรกเทรนจริง ครั้งที่สองใช้ผลของแต่ละชุดปัจจัยที่จำไว้
+    cache = subset_cache()
+    for run in ('cold', 'cached'):
+        result, stats = measure(
+            lambda: select_factors(prophet_df, factors, parallel=parallel, cache=cache), repeat=1
+        )
+        recorder.add('fit', 'select_factors', {
+            'weeks': TUNING_WEEKS, 'parallel': parallel, 'run': run,
+            'fits': result['n_fits'], 'cached_fits': result['n_cached_fits'],
+            'exhaustive_fits': result['n_fits_exhaustive'], 'selected': len(result['factors'])
+        }, stats)
+
+
+def _fitted_forecasts(lengths, parallel):
+    """เทรนโมเดลด้วยปัจจัยทั้งหมดหนึ่งครั้งต่อความยาว (ไม่นับเวลา) สำหรับ predict และ figures"""
+    factors = list(EXTERNAL_FACTOR_COLUMNS)
+    fitted = {}
+    for n_weeks in lengths:
+        df = _weeks_data(n_weeks)
+        prophet_df = build_prophet_frame(df, factors)
+        model = train_prophet_model_with_factors(prophet_df, factors, parallel=parallel)[0]
+        fitted[n_weeks] = (df, prophet_df, model, factors)
+    return fitted
+
+
+def bench_predict(recorder, fitted, horizons, repeat):
+    for n_weeks, (df, prophet_df, model, factors) in fitted.items():
+        future_factors = default_future_factors(df, factors)
+        for horizon in horizons:
+            _, stats = measure(lambda: forecast_future_weeks(model, df, factors, future_factors, horizon), repeat)
+            recorder.add('predict', 'forecast_future', {'weeks': n_weeks, 'horizon': horizon}, stats)
+
+            # เทียบวิธีคำนวณช่วงความเชื่อมั่น: sampled ใช้แคชใหม่ทุกครั้ง, sampled_cached ใช้เส้นทางเดิม
+            future = model.make_future_dataframe(periods=horizon, freq='W', include_history=False)
+            for factor in factors:
+                future[factor] = future_factors[factor]
+            engines = {
+                'prophet': lambda: predict_with_intervals(model, future, 'prophet'),
+                'sampled': lambda: predict_with_intervals(model, future, 'sampled', cache=ModelCache(1)),
+                'sampled_cached': lambda: predict_with_intervals(model, future, 'sampled'),
+                'analytic': lambda: predict_with_intervals(model, future, 'analytic'),
+            }
+            for mode, engine in engines.items():
+                _, stats = measure(engine, repeat)
+                recorder.add('predict', 'intervals', {'weeks': n_weeks, 'horizon': horizon, 'mode': mode}, stats)
+
+        history = prophet_df.drop(columns=['y', 'week_num'])
+        _, stats = measure(lambda: predict_with_intervals(model, history), repeat)
+        recorder.add('predict', 'history', {'weeks': n_weeks}, stats)
+        _, stats = measure(lambda: model.predict(history), repeat)
+        recorder.add('predict', 'history_prophet', {'weeks': n_weeks}, stats)
+
+        # สถานการณ์ที่ค่าปัจจัยแรกต่างกัน: พยากรณ์ครั้งเดียว เทียบกับเรียก forecast_future_weeks ทีละสถานการณ์
+        horizon = 12
+        for n_scenarios in SCENARIO_COUNTS:
+            scenarios = {
+                f's{i}': {factors[0]: future_factors[factors[0]] * (0.5 + i / max(n_scenarios, 1))}
+                for i in range(n_scenarios)
+            }
+            _, stats = measure(lambda: forecast_scenarios(model, df, factors, scenarios, horizon), repeat)
+            recorder.add('predict', 'scenarios',
+                         {'weeks': n_weeks, 'horizon': horizon, 'scenarios': n_scenarios}, stats)
+            _, stats = measure(lambda: [
+                forecast_future_weeks(model, df, factors, {**future_factors, **values}, horizon)
+                for values in scenarios.values()
+            ], repeat)
+            recorder.add('predict', 'scenarios_loop',
+                         {'weeks': n_weeks, 'horizon': horizon, 'scenarios': n_scenarios}, stats)
+
+        # what-if: สร้าง engine ครั้งเดียว แล้วคำนวณตาราง 3 ปัจจัยโดยไม่เรียก predict
+        engine, stats = measure(lambda: build_whatif_engine(model, df, factors, future_factors, horizon), repeat)
+        recorder.add('predict', 'whatif_build', {'weeks': n_weeks, 'horizon': horizon}, stats)
+        for size in WHATIF_GRID_SIZES:
+            axes = {factor: np.linspace(0.5, 1.5, size) * future_factors[factor] for factor in factors[:3]}
+            _, stats = measure(lambda: engine.grid(axes), repeat)
+            recorder.add('predict', 'whatif_grid',
+                         {'weeks': n_weeks, 'horizon': horizon, 'combinations': size ** len(axes)}, stats)
+
+
+def bench_figures(recorder, fitted, repeat, weeks_to_forecast=4):
+    for n_weeks, (df, prophet_df, model, factors) in fitted.items():
+        forecast_future = forecast_future_weeks(
+            model, df, factors, default_future_factors(df, factors), weeks_to_forecast
+        )
+        history_forecast = predict_with_intervals(model, prophet_df.drop(columns=['y', 'week_num']))
+        baseline = [df['cases'].tail(4).mean()] * weeks_to_forecast
+        builders = {
+            'forecast': lambda: build_forecast_figure(df, history_forecast, forecast_future, baseline,
+                                                      n_factors=len(factors)),
+            'box': lambda: build_box_figure(df),
+            'histogram': lambda: build_histogram_figure(df),
+            'residuals': lambda: build_residuals_figure(df['cases'].values, history_forecast['yhat'].values),
+            'components': lambda: build_components_figure(model, history_forecast),
+        }
+        for name, build in builders.items():
+            fig, stats = measure(build, repeat)
+            recorder.add('figures', f"{name}_build", {'weeks': n_weeks}, stats)
+            payload, stats = measure(fig.to_json, repeat)
+            # ขนาดข้อมูลที่ส่งไปเบราว์เซอร์ (ควรคงที่เมื่อข้อมูลยาวขึ้น เพราะลดจุดแล้ว)
+            stats['payload_bytes'] = len(payload)
+            recorder.add('figures', f"{name}_to_json", {'weeks': n_weeks}, stats)
+
+        # กราฟองค์ประกอบเดิมของ Prophet (matplotlib) แปลงเป็น PNG แบบที่ st.pyplot ทำ เพื่อเทียบ
+        def plot_components_png():
+            import matplotlib.pyplot as plt
+
+            fig = model.plot_components(history_forecast)
+            buffer = io.BytesIO()
+            fig.savefig(buffer, format='png')
+            plt.close(fig)
+            return buffer.getbuffer().nbytes
+
+        _, stats = measure(plot_components_png, repeat)
+        recorder.add('figures', 'components_matplotlib', {'weeks': n_weeks}, stats)
+
+
+def bench_rerun(recorder, lengths, repeat):
+    from streamlit.testing.v1 import AppTest
+
+    app_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app.py')
+    for n_weeks in lengths:
+        at = AppTest.from_file(app_path, default_timeout=1800)
+        at.session_state['current_data'] = _weeks_data(n_weeks)
+        at.session_state['data_source'] = 'benchmark'
+        at.session_state['external_factors_enabled'] = True
+
+        # รอบแรก: เทรนโมเดล (แต่ละความยาวเป็นข้อมูลใหม่ จึงไม่โดนแคช)
+        _, stats = measure(at.run, 1)
+        if at.exception:
+            raise RuntimeError(f"app.py ล้มเหลว ({n_weeks} สัปดาห์): {at.exception[0].value}")
+        recorder.add('rerun', 'first_run', {'weeks': n_weeks}, stats)
+
+        _, stats = measure(at.run, repeat)
+        recorder.add('rerun', 'rerun', {'weeks': n_weeks}, stats)
+
+
+def _app_import_source():
+    """คำสั่ง import ระดับบนสุดทั้งหมดของ app.py (ไม่รันส่วนอื่นของสคริปต์)"""
+    app_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app.py')
+    with open(app_path, encoding='utf-8') as f:
+        tree = ast.parse(f.read())
+    imports = [node for node in tree.body if isinstance(node, (ast.Import, ast.ImportFrom))]
+    return '\n'.join(ast.unparse(node) for node in imports)
+
+
+def _cold_import(source):
+    """รัน source ใน interpreter ใหม่ คืนค่า (เวลาที่ใช้เป็นวินาที, DEFERRED_MODULES ที่ถูกโหลด)"""
+    script = (
+        "import json, sys, time\n"
+        "started = time.perf_counter()\n"
+        f"{source}\n"
+        "elapsed = time.perf_counter() - started\n"
+        f"loaded = [name for name in {DEFERRED_MODULES!r} if name in sys.modules]\n"
+        "print(json.dumps({'seconds': elapsed, 'loaded': loaded}))\n"
+    )
+    completed = subprocess.run(
+        [sys.executable, '-c', script], capture_output=True, text=True, check=True,
+        cwd=os.path.dirname(os.path.abspath(__file__))
+    )
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+    return result['seconds'], result['loaded']
+
+
+def bench_startup(recorder, repeat, budget=STARTUP_BUDGET_SECONDS):
+    """วัดเวลา import ของ app.py แบบ cold และไลบรารีที่เลื่อนไปโหลดตอนใช้ คืนค่าสรุปเทียบกับงบ"""
+    source = _app_import_source()
+    timings, loaded = [], []
+    for _ in range(repeat):
+        seconds, loaded = _cold_import(source)
+        timings.append(seconds)
+    stats = {
+        'min': min(timings),
+        'median': statistics.median(timings),
+        'mean': statistics.fmean(timings),
+        'repeat': repeat,
+    }
+    recorder.add('startup', 'app_imports', {}, stats)
+
+    # ค่าใช้จ่ายที่ถูกเลื่อนไปจ่ายตอนเทรน/วาดกราฟครั้งแรก (เพื่อดูว่าประหยัดไปเท่าไร)
+    timings = [_cold_import('\n'.join(f"import {name}" for name in DEFERRED_MODULES))[0]
+               for _ in range(repeat)]
+    recorder.add('startup', 'deferred_imports', {}, {
+        'min': min(timings),
+        'median': statistics.median(timings),
+        'mean': statistics.fmean(timings),
+        'repeat': repeat,
+    })
+    return {
+        'budget_seconds': budget,
+        'median_seconds': stats['median'],
+        'eager_modules': loaded,
+        'within_budget': stats['median'] <= budget and not loaded,
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _library_versions():
+    versions = {'python': platform.python_version()}
+    for name in ['numpy', 'pandas', 'prophet', 'plotly', 'streamlit', 'pyarrow']:
+        try:
+            versions[name] = __import__(name).__version__
+        except ImportError:
+            versions[name] = None
+    return versions
+
+
+def _result_key(result):
+    return result['group'], result['name'], json.dumps(result['params'], sort_keys=True)
+
+
+def compare_results(current, baseline, threshold=REGRESSION_THRESHOLD):
+    """เทียบค่ามัธยฐานกับผลเดิม คืนค่า DataFrame หนึ่งแถวต่อรายการที่มีในทั้งสองชุด"""
+    previous = {_result_key(result): result['stats']['median'] for result in baseline['results']}
+    rows = []
+    for result in current['results']:
+        key = _result_key(result)
+        if key not in previous:
+            continue
+        ratio = result['stats']['median'] / previous[key] if previous[key] > 0 else float('inf')
+        diff = result['stats']['median'] - previous[key]
+        rows.append({
+            'group': key[0],
+            'name': key[1],
+            'params': key[2],
+            'baseline_ms': previous[key] * 1000,
+            'current_ms': result['stats']['median'] * 1000,
+            'ratio': ratio,
+            'regression': ratio > threshold and diff > REGRESSION_MIN_SECONDS,
+        })
+    return pd.DataFrame(rows, columns=['group', 'name', 'params', 'baseline_ms', 'current_ms', 'ratio',
+                                       'regression'])
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="วัดเวลาของขั้นตอนหลักและบันทึกผลเป็น JSON")
+    parser.add_argument('--output', default='benchmark_results.json', help="ไฟล์ JSON ผลลัพธ์")
+    parser.add_argument('--quick', action='store_true', help="ใช้ความยาวและจำนวนปัจจัยชุดเล็ก")
+    parser.add_argument('--only', default=None,
+                        help=f"เลือกกลุ่มคั่นด้วยจุลภาค ({', '.join(BENCHMARK_GROUPS)})")
+    parser.add_argument('--repeat', type=int, default=3, help="จำนวนครั้งที่วัดซ้ำต่อรายการ")
+    parser.add_argument('--fit-repeat', type=int, default=1, help="จำนวนครั้งที่วัดซ้ำสำหรับกลุ่ม fit")
+    parser.add_argument('--no-parallel', action='store_true', help="เทรนทีละโมเดลใน process เดียว")
+    parser.add_argument('--compare', default=None, help="ไฟล์ JSON ผลเดิมสำหรับเทียบ")
+    parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD,
+                        help="สัดส่วนเวลาที่ถือว่าช้าลง (ค่าเริ่มต้น 1.2)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    groups = BENCHMARK_GROUPS if args.only is None else [group.strip() for group in args.only.split(',')]
+    unknown = [group for group in groups if group not in BENCHMARK_GROUPS]
+    if unknown:
+        print(f"ไม่รู้จักกลุ่ม: {', '.join(unknown)}", file=sys.stderr)
+        return 2
+
+    # ไม่ใช้แคชโมเดลบนดิสก์ เพื่อให้รอบแรกของ rerun เทรนจริงทุกครั้ง
+    os.environ.pop('FORECAST_MODEL_CACHE_DIR', None)
+    lengths = QUICK_HISTORY_LENGTHS if args.quick else HISTORY_LENGTHS
+    n_multi_series = QUICK_MULTI_SERIES_COUNT if args.quick else MULTI_SERIES_COUNT
+    parallel = not args.no_parallel
+    recorder = BenchmarkRecorder()
+    started = time.perf_counter()
+
+    if 'parse_csv' in groups:
+        bench_parse_csv(recorder, lengths, n_multi_series, args.repeat)
+    if 'sheets' in groups:
+        bench_sheets(recorder, lengths, args.repeat)
+    if 'quality' in groups:
+        bench_quality(recorder, lengths, n_multi_series, args.repeat)
+    if 'fit' in groups:
+        bench_fit(recorder, lengths, QUICK_FACTOR_COUNTS if args.quick else FACTOR_COUNTS,
+                  args.fit_repeat, parallel)
+    if 'predict' in groups or 'figures' in groups:
+        fitted = _fitted_forecasts(lengths, parallel)
+        if 'predict' in groups:
+            bench_predict(recorder, fitted, PREDICT_HORIZONS, args.repeat)
+        if 'figures' in groups:
+            bench_figures(recorder, fitted, args.repeat)
+    if 'rerun' in groups:
+        bench_rerun(recorder, QUICK_RERUN_LENGTHS if args.quick else RERUN_LENGTHS, args.repeat)
+    startup = None
+    if 'startup' in groups:
+        startup = bench_startup(recorder, args.repeat)
+
+    report = {
+        'meta': {
+            'created_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'git_commit': _git_commit(),
+            'versions': _library_versions(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'args': vars(args),
+            'total_seconds': time.perf_counter() - started,
+            'startup': startup,
+        },
+        'results': recorder.results,
+    }
+    directory = os.path.dirname(args.output)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"บันทึกผล {len(recorder.results)} รายการที่ {args.output}")
+
+    status = 0
+    if startup is not None and not startup['within_budget']:
+        print(f"⚠️ เปิดแอปใช้เวลา {startup['median_seconds']:.2f}s (งบ {startup['budget_seconds']:.2f}s)"
+              + (f", โหลด {', '.join(startup['eager_modules'])} ตั้งแต่เริ่ม" if startup['eager_modules'] else ''))
+        status = 1
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        comparison = compare_results(report, baseline, args.threshold)
+        if len(comparison) == 0:
+            print("ไม่มีรายการที่ตรงกับผลเดิม")
+            return status
+        with pd.option_context('display.width', 160, 'display.max_rows', None):
+            print(comparison.round(2).to_string(index=False))
+        n_regressions = int(comparison['regression'].sum())
+        if n_regressions:
+            print(f"⚠️ ช้าลงเกิน {args.threshold:.2f} เท่า {n_regressions} รายการ")
+            return 1
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
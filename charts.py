@@ -0,0 +1,528 @@
+"""สร้างกราฟ Plotly ของแอป (ไม่เรียก Streamlit)
+
+แยกออกจาก app.py เพื่อให้ benchmark และสคริปต์อื่นวัด/ใช้การสร้างกราฟได้โดยตรง
+Plotly ถูก import ในแต่ละฟังก์ชัน เพื่อไม่ให้ถ่วงการเปิดแอปก่อนมีข้อมูลให้วาดกราฟ
+
+ข้อมูลยาว: เส้นที่ใช้แสดงผลอย่างเดียวถูกลดจุดด้วย LTTB, เส้นที่มีจุดมากใช้ Scattergl (WebGL)
+และส่งค่าเป็น numpy array ซึ่ง Plotly เข้ารหัสเป็น binary (base64) แทนรายการตัวเลขใน JSON
+"""
+import numpy as np
+
+# จำนวนจุดสูงสุดต่อเส้นที่ส่งไปเบราว์เซอร์ (เกินนี้จะลดจุดด้วย LTTB)
+DISPLAY_MAX_POINTS = 2000
+# เส้นที่มีจุดมากกว่านี้วาดด้วย WebGL แทน SVG
+WEBGL_MIN_POINTS = 1000
+# สีของแต่ละสถานการณ์ (RGB) ใช้วนซ้ำเมื่อมีสถานการณ์มากกว่านี้
+SCENARIO_COLORS = [
+    (214, 39, 40), (31, 119, 180), (44, 160, 44), (255, 127, 14),
+    (148, 103, 189), (140, 86, 75), (227, 119, 194), (23, 190, 207),
+]
+# จำนวนสัปดาห์ล่าสุดของข้อมูลจริงที่แสดงในกราฟเปรียบเทียบสถานการณ์
+SCENARIO_HISTORY_WEEKS = 26
+
+
+def lttb_indices(x, y, max_points=DISPLAY_MAX_POINTS):
+    """ตำแหน่งของจุดที่เลือกด้วย Largest-Triangle-Three-Buckets (x เป็นตัวเลขหรือวันที่ เรียงจากน้อยไปมาก)
+
+    เก็บจุดแรกและจุดสุดท้ายเสมอ แล้วเลือกจุดละหนึ่งต่อช่วงที่ทำให้สามเหลี่ยมกับจุดก่อนหน้า
+    และค่าเฉลี่ยของช่วงถัดไปมีพื้นที่มากที่สุด จึงรักษายอดและจุดต่ำของเส้นไว้
+    """
+    x = np.asarray(x)
+    if np.issubdtype(x.dtype, np.datetime64):
+        x = x.astype('datetime64[ns]').view(np.int64)
+    x = x.astype(float)
+    y = np.asarray(y, dtype=float)
+    n = len(x)
+    if max_points >= n or max_points < 3:
+        return np.arange(n)
+
+    edges = np.linspace(1, n - 1, max_points - 1).astype(np.int64)
+    selected = np.empty(max_points, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    previous = 0
+    for bucket in range(max_points - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        next_end = edges[bucket + 2] if bucket + 2 < len(edges) else n
+        next_x = x[end:next_end].mean()
+        next_y = y[end:next_end].mean()
+        area = np.abs(
+            (x[previous] - next_x) * (y[start:end] - y[previous])
+            - (x[previous] - x[start:end]) * (next_y - y[previous])
+        )
+        previous = start + int(np.argmax(area))
+        selected[bucket + 1] = previous
+    return selected
+
+
+def downsample(x, y, max_points=DISPLAY_MAX_POINTS):
+    """ลดจุดของเส้นสำหรับแสดงผล คืนค่า (x, y) เป็น numpy array"""
+    x = np.asarray(x)
+    y = np.asarray(y)
+    index = lttb_indices(x, y, max_points)
+    return x[index], y[index]
+
+
+def scatter_trace(n_points, **kwargs):
+    """go.Scatter หรือ go.Scattergl (เมื่อจุดมากกว่า WEBGL_MIN_POINTS)"""
+    import plotly.graph_objects as go
+
+    if n_points > WEBGL_MIN_POINTS:
+        return go.Scattergl(**kwargs)
+    return go.Scatter(**kwargs)
+
+
+def build_box_figure(df):
+    """Box plot สำหรับดู outliers พร้อมเส้นค่าเฉลี่ย
+
+    ข้อมูลที่ยาวกว่า DISPLAY_MAX_POINTS คำนวณ quartile และ fence ฝั่งเซิร์ฟเวอร์ แล้วส่งเฉพาะ outliers
+    """
+    import plotly.graph_objects as go
+
+    cases = df['cases'].to_numpy(dtype=float)
+    name = 'จำนวนผู้ป่วย'
+    fig_box = go.Figure()
+    if len(cases) <= DISPLAY_MAX_POINTS:
+        fig_box.add_trace(go.Box(
+            y=cases,
+            name=name,
+            boxpoints='outliers',
+            marker_color='lightblue'
+        ))
+    else:
+        # quartile แบบ linear และ fence 1.5 IQR เหมือนที่ Plotly คำนวณในเบราว์เซอร์
+        q1, median, q3 = np.percentile(cases, [25, 50, 75])
+        iqr = q3 - q1
+        inside = cases[(cases >= q1 - 1.5 * iqr) & (cases <= q3 + 1.5 * iqr)]
+        outliers = np.unique(cases[(cases < inside.min()) | (cases > inside.max())])
+        if len(outliers) > DISPLAY_MAX_POINTS:
+            outliers = outliers[np.linspace(0, len(outliers) - 1, DISPLAY_MAX_POINTS).astype(np.int64)]
+        fig_box.add_trace(go.Box(
+            x=[name],
+            q1=[q1], median=[median], q3=[q3],
+            lowerfence=[inside.min()], upperfence=[inside.max()],
+            name=name,
+            marker_color='lightblue'
+        ))
+        fig_box.add_trace(scatter_trace(
+            len(outliers),
+            x=np.full(len(outliers), name, dtype=object),
+            y=outliers,
+            mode='markers',
+            name='outliers',
+            marker=dict(color='lightblue'),
+            showlegend=False
+        ))
+
+    # เพิ่มเส้นค่าเฉลี่ย
+    fig_box.add_hline(
+        y=cases.mean(),
+        line_dash="dash",
+        line_color="red",
+        annotation_text=f"ค่าเฉลี่ย: {cases.mean():.1f}"
+    )
+
+    fig_box.update_layout(
+        title="Box Plot: การกระจายของข้อมูล",
+        yaxis_title="จำนวนผู้ป่วย (ราย)",
+        height=400
+    )
+    return fig_box
+
+
+def build_histogram_figure(df):
+    """Histogram ของจำนวนผู้ป่วย (ข้อมูลที่ยาวกว่า DISPLAY_MAX_POINTS นับความถี่ฝั่งเซิร์ฟเวอร์)"""
+    nbins = min(20, len(df)//2)
+    title = "Histogram: การแจกแจงของข้อมูล"
+    if len(df) <= DISPLAY_MAX_POINTS:
+        import plotly.express as px
+
+        fig_hist = px.histogram(
+            df,
+            x='cases',
+            nbins=nbins,
+            title=title,
+            labels={'cases': 'จำนวนผู้ป่วย (ราย)', 'count': 'ความถี่'}
+        )
+    else:
+        import plotly.graph_objects as go
+
+        counts, edges = np.histogram(df['cases'].to_numpy(dtype=float), bins=nbins)
+        fig_hist = go.Figure(go.Bar(
+            x=(edges[:-1] + edges[1:]) / 2,
+            y=counts,
+            width=np.diff(edges),
+            hovertemplate='จำนวนผู้ป่วย (ราย): %{x}<br>ความถี่: %{y}<extra></extra>'
+        ))
+        fig_hist.update_layout(title=title, xaxis_title='จำนวนผู้ป่วย (ราย)', yaxis_title='ความถี่',
+                               bargap=0)
+    fig_hist.update_layout(height=400)
+    return fig_hist
+
+
+def build_forecast_figure(df, history_forecast, forecast_future, baseline_forecast, n_factors=0):
+    """กราฟแนวโน้มและการพยากรณ์แบบเชื่อมต่อ (ข้อมูลจริง, พยากรณ์, ช่วงความเชื่อมั่น, baseline, แนวโน้ม)
+
+    เส้นข้อมูลจริงและแนวโน้มในอดีตถูกลดจุดเมื่อยาวกว่า DISPLAY_MAX_POINTS ส่วนช่วงพยากรณ์ส่งครบทุกจุด
+    """
+    import plotly.graph_objects as go
+
+    weeks_to_forecast = len(forecast_future)
+    fig = go.Figure()
+
+    # 1. เพิ่มข้อมูลจริง
+    actual_weeks, actual_cases = downsample(df['week_num'], df['cases'])
+    fig.add_trace(scatter_trace(
+        len(actual_weeks),
+        x=actual_weeks,
+        y=actual_cases,
+        mode='lines+markers',
+        name='ข้อมูลจริง',
+        line=dict(color='blue', width=2),
+        marker=dict(size=8),
+        hovertemplate='สัปดาห์ที่: %{x}<br>ผู้ป่วย: %{y} ราย<extra></extra>'
+    ))
+
+    # 2. สร้างข้อมูลการพยากรณ์แบบเชื่อมต่อ
+    last_week = df['week_num'].max()
+    last_cases = df['cases'].iloc[-1]
+
+    # จุดเชื่อมต่อ + การพยากรณ์
+    future_weeks = np.arange(last_week + 1, last_week + weeks_to_forecast + 1)
+    forecast_weeks_connected = np.concatenate(([last_week], future_weeks))
+    forecast_values_connected = np.concatenate(([last_cases], forecast_future['yhat_adjusted']))
+
+    fig.add_trace(go.Scatter(
+        x=forecast_weeks_connected,
+        y=forecast_values_connected,
+        mode='lines+markers',
+        name='Prophet พยากรณ์',
+        line=dict(color='red', width=2),
+        marker=dict(size=8, symbol='diamond'),
+        hovertemplate='สัปดาห์ที่: %{x}<br>พยากรณ์: %{y:.0f} ราย<extra></extra>'
+    ))
+
+    # 3. เพิ่ม Confidence Interval แบบเชื่อมต่อ
+    ci_upper_connected = np.concatenate(([last_cases], forecast_future['yhat_upper_adjusted']))
+    ci_lower_connected = np.concatenate(([last_cases], forecast_future['yhat_lower_adjusted']))
+
+    fig.add_trace(go.Scatter(
+        x=np.concatenate((forecast_weeks_connected, forecast_weeks_connected[::-1])),
+        y=np.concatenate((ci_upper_connected, ci_lower_connected[::-1])),
+        fill='toself',
+        fillcolor='rgba(255,0,0,0.2)',
+        line=dict(color='rgba(255,255,255,0)'),
+        name='ช่วงความเชื่อมั่น 95%',
+        showlegend=True,
+        hoverinfo='skip'
+    ))
+
+    # 4. เพิ่ม Baseline แบบเชื่อมต่อ
+    baseline_connected = np.concatenate(([last_cases], baseline_forecast))
+    fig.add_trace(go.Scatter(
+        x=forecast_weeks_connected,
+        y=baseline_connected,
+        mode='lines+markers',
+        name='Baseline (เฉลี่ย 4 สัปดาห์)',
+        line=dict(color='orange', width=2, dash='dot'),
+        marker=dict(size=6, symbol='square'),
+        hovertemplate='สัปดาห์ที่: %{x}<br>Baseline: %{y:.0f} ราย<extra></extra>'
+    ))
+
+    # 5. เพิ่มเส้นแนวโน้มที่เชื่อมต่อ
+    trend_weeks, historical_trend = downsample(df['week_num'], history_forecast['yhat'])
+    trend_connected = np.concatenate((historical_trend, forecast_future['yhat_adjusted']))
+    trend_weeks_connected = np.concatenate((trend_weeks, future_weeks))
+
+    fig.add_trace(scatter_trace(
+        len(trend_weeks_connected),
+        x=trend_weeks_connected,
+        y=trend_connected,
+        mode='lines',
+        name='แนวโน้ม (Prophet)',
+        line=dict(color='green', dash='dash', width=1),
+        opacity=0.7,
+        hovertemplate='สัปดาห์ที่: %{x}<br>แนวโน้ม: %{y:.0f} ราย<extra></extra>'
+    ))
+
+    # 6. เพิ่มเส้นแบ่งระหว่างข้อมูลจริงกับการพยากรณ์
+    fig.add_vline(
+        x=last_week + 0.5,
+        line_dash="solid",
+        line_color="gray",
+        line_width=2,
+        annotation_text="จุดเริ่มพยากรณ์",
+        annotation_position="top"
+    )
+
+    # ตั้งค่ากราฟ
+    title = 'แนวโน้มผู้ป่วยและการพยากรณ์ (Facebook Prophet'
+    if n_factors:
+        title += f' + {n_factors} External Factors'
+    title += ')'
+
+    fig.update_layout(
+        title={
+            'text': title,
+            'x': 0.5,
+            'xanchor': 'center'
+        },
+        xaxis_title='สัปดาห์ที่',
+        yaxis_title='จำนวนผู้ป่วย (ราย)',
+        hovermode='x unified',
+        showlegend=True,
+        height=600,
+        font=dict(family="kanit, sans-serif", size=12),
+        plot_bgcolor='white'
+    )
+
+    # ตั้งค่าช่วงแกน
+    x_min = max(1, df['week_num'].min() - 1)
+    x_max = df['week_num'].max() + weeks_to_forecast + 1
+    fig.update_xaxes(
+        range=[x_min, x_max],
+        showgrid=True,
+        gridwidth=1,
+        gridcolor='lightgray',
+        dtick=max(1, (x_max - x_min) // 20)
+    )
+
+    y_min = 0
+    y_max = max(df['cases'].max(), forecast_future['yhat_upper'].max()) * 1.1
+    fig.update_yaxes(
+        range=[y_min, y_max],
+        showgrid=True,
+        gridwidth=1,
+        gridcolor='lightgray'
+    )
+    return fig
+
+
+def build_scenario_figure(df, forecasts):
+    """กราฟเปรียบเทียบสถานการณ์: ค่าพยากรณ์และช่วงความเชื่อมั่น 95% ของแต่ละสถานการณ์ซ้อนกัน
+
+    forecasts: dict ชื่อ → ผลของ forecast_future_weeks (ดู pipeline.forecast_scenarios)
+    แสดงข้อมูลจริงเฉพาะ SCENARIO_HISTORY_WEEKS สัปดาห์ล่าสุด
+    """
+    import plotly.graph_objects as go
+
+    fig = go.Figure()
+    recent = df.tail(SCENARIO_HISTORY_WEEKS)
+    fig.add_trace(go.Scatter(
+        x=recent['week_num'].to_numpy(),
+        y=recent['cases'].to_numpy(),
+        mode='lines+markers',
+        name='ข้อมูลจริง',
+        line=dict(color='black', width=2),
+        marker=dict(size=6),
+        hovertemplate='สัปดาห์ที่: %{x}<br>ผู้ป่วย: %{y} ราย<extra></extra>'
+    ))
+
+    last_week = df['week_num'].max()
+    last_cases = df['cases'].iloc[-1]
+    for i, (name, forecast) in enumerate(forecasts.items()):
+        r, g, b = SCENARIO_COLORS[i % len(SCENARIO_COLORS)]
+        weeks = np.concatenate(([last_week], forecast['week_num'].to_numpy()))
+        upper = np.concatenate(([last_cases], forecast['yhat_upper_adjusted'].to_numpy()))
+        lower = np.concatenate(([last_cases], forecast['yhat_lower_adjusted'].to_numpy()))
+        # แถบช่วงความเชื่อมั่นอยู่ในกลุ่ม legend เดียวกับเส้น คลิกชื่อสถานการณ์แล้วซ่อนทั้งคู่
+        fig.add_trace(go.Scatter(
+            x=np.concatenate((weeks, weeks[::-1])),
+            y=np.concatenate((upper, lower[::-1])),
+            fill='toself',
+            fillcolor=f'rgba({r},{g},{b},0.15)',
+            line=dict(color='rgba(255,255,255,0)'),
+            name=name,
+            legendgroup=name,
+            showlegend=False,
+            hoverinfo='skip'
+        ))
+        fig.add_trace(go.Scatter(
+            x=weeks,
+            y=np.concatenate(([last_cases], forecast['yhat_adjusted'].to_numpy())),
+            mode='lines+markers',
+            name=name,
+            legendgroup=name,
+            line=dict(color=f'rgb({r},{g},{b})', width=2),
+            marker=dict(size=6),
+            hovertemplate=f'{name}<br>สัปดาห์ที่: %{{x}}<br>พยากรณ์: %{{y:.0f}} ราย<extra></extra>'
+        ))
+
+    fig.add_vline(x=last_week + 0.5, line_dash="solid", line_color="gray", line_width=2)
+    fig.update_layout(
+        title={'text': 'เปรียบเทียบการพยากรณ์ตามสถานการณ์', 'x': 0.5, 'xanchor': 'center'},
+        xaxis_title='สัปดาห์ที่',
+        yaxis_title='จำนวนผู้ป่วย (ราย)',
+        showlegend=True,
+        height=500,
+        font=dict(family="kanit, sans-serif", size=12),
+        plot_bgcolor='white'
+    )
+    fig.update_xaxes(showgrid=True, gridwidth=1, gridcolor='lightgray')
+    fig.update_yaxes(rangemode='tozero', showgrid=True, gridwidth=1, gridcolor='lightgray')
+    return fig
+
+
+def build_sensitivity_figure(grid, x_factor, y_factor=None, statistic='total', label='ผู้ป่วยรวม (ราย)'):
+    """กราฟความไวของการพยากรณ์ต่อปัจจัย จากผลของ WhatIfEngine.grid
+
+    มี y_factor: heatmap ของ statistic ตามค่าของสองปัจจัย, ไม่มี: เส้นตามค่าของ x_factor
+    """
+    import plotly.graph_objects as go
+
+    if y_factor is None:
+        fig = go.Figure(go.Scatter(
+            x=grid[x_factor].to_numpy(),
+            y=grid[statistic].to_numpy(),
+            mode='lines+markers',
+            line=dict(color='purple', width=2),
+            hovertemplate=f'{x_factor}: %{{x:.2f}}<br>{label}: %{{y:.0f}}<extra></extra>'
+        ))
+        fig.update_yaxes(title=label)
+    else:
+        table = grid.pivot(index=y_factor, columns=x_factor, values=statistic)
+        fig = go.Figure(go.Heatmap(
+            x=table.columns.to_numpy(),
+            y=table.index.to_numpy(),
+            z=table.to_numpy(),
+            colorscale='YlOrRd',
+            colorbar=dict(title=label),
+            hovertemplate=f'{x_factor}: %{{x:.2f}}<br>{y_factor}: %{{y:.2f}}<br>{label}: %{{z:.0f}}<extra></extra>'
+        ))
+        fig.update_yaxes(title=y_factor)
+    fig.update_layout(
+        title={'text': f'ความไวของการพยากรณ์ต่อปัจจัย ({label})', 'x': 0.5, 'xanchor': 'center'},
+        xaxis_title=x_factor,
+        height=500,
+        font=dict(family="kanit, sans-serif", size=12),
+        plot_bgcolor='white'
+    )
+    return fig
+
+
+def build_residuals_figure(actual_values, predicted_values):
+    """กราฟ residuals เทียบกับค่าพยากรณ์ (ลดจุดด้วย LTTB ตามค่าพยากรณ์ที่เรียงแล้ว เก็บ residual ที่โดดเด่นไว้)"""
+    import plotly.graph_objects as go
+
+    predicted_values = np.asarray(predicted_values, dtype=float)
+    residuals = np.asarray(actual_values, dtype=float) - predicted_values
+    order = np.argsort(predicted_values, kind='stable')
+    predicted_shown, residuals_shown = downsample(predicted_values[order], residuals[order])
+
+    fig_residuals = go.Figure()
+
+    # กราฟ residuals vs predicted
+    fig_residuals.add_trace(scatter_trace(
+        len(predicted_shown),
+        x=predicted_shown,
+        y=residuals_shown,
+        mode='markers',
+        name='Residuals',
+        marker=dict(color='purple', size=8)
+    ))
+
+    # เส้น y=0
+    fig_residuals.add_hline(y=0, line_dash="dash", line_color="red")
+
+    fig_residuals.update_layout(
+        title="Residuals vs Predicted Values",
+        xaxis_title="ค่าพยากรณ์",
+        yaxis_title="Residuals (จริง - พยากรณ์)",
+        height=400
+    )
+    return fig_residuals
+
+
+def build_backtest_figure(bt_summary):
+    """ความผิดพลาด (MAE, RMSE) ตามจำนวนสัปดาห์ที่พยากรณ์ล่วงหน้า"""
+    import plotly.graph_objects as go
+
+    fig_backtest = go.Figure()
+    for metric, color in [('mae', 'blue'), ('rmse', 'purple')]:
+        fig_backtest.add_trace(go.Scatter(
+            x=bt_summary['horizon'],
+            y=bt_summary[metric],
+            mode='lines+markers',
+            name=metric.upper(),
+            line=dict(color=color, width=2)
+        ))
+    fig_backtest.update_layout(
+        title="ความผิดพลาดตามจำนวนสัปดาห์ที่พยากรณ์ล่วงหน้า",
+        xaxis_title="สัปดาห์ข้างหน้า",
+        yaxis_title="ความผิดพลาด (ราย)",
+        height=400
+    )
+    return fig_backtest
+
+
+def component_panels(model, forecast):
+    """รายการองค์ประกอบที่จะแสดง [(คอลัมน์ใน forecast, ชื่อ, เป็น multiplicative หรือไม่)]
+    ตามลำดับเดียวกับ model.plot_components: trend, seasonality, ปัจจัยภายนอก
+    """
+    panels = [('trend', 'Trend', False)]
+    for name, props in model.seasonalities.items():
+        panels.append((name, f'Seasonality: {name}', props['mode'] == 'multiplicative'))
+    modes = {props['mode'] for props in model.extra_regressors.values()}
+    if 'additive' in modes:
+        panels.append(('extra_regressors_additive', 'ปัจจัยภายนอก (additive)', False))
+    if 'multiplicative' in modes:
+        panels.append(('extra_regressors_multiplicative', 'ปัจจัยภายนอก (multiplicative)', True))
+    return [panel for panel in panels if panel[0] in forecast.columns]
+
+
+def build_components_figure(model, forecast):
+    """กราฟองค์ประกอบ (trend, seasonality, ปัจจัยภายนอก) จากคอลัมน์ของ forecast โดยตรง
+
+    ใช้แทน model.plot_components (matplotlib) - ไม่คำนวณอะไรใหม่ แสดงค่าตามวันที่ของ forecast
+    องค์ประกอบแบบ multiplicative แสดงเป็นเปอร์เซ็นต์เหมือน Prophet
+    """
+    import plotly.graph_objects as go
+    from plotly.subplots import make_subplots
+
+    panels = component_panels(model, forecast)
+    fig = make_subplots(
+        rows=len(panels), cols=1, shared_xaxes=True, vertical_spacing=0.06,
+        subplot_titles=[title for _, title, _ in panels]
+    )
+    # วันที่ส่งเป็นมิลลิวินาทีบนแกนแบบ date เพื่อให้เข้ารหัสแบบ binary ได้เหมือนค่าอื่น
+    dates = forecast['ds'].to_numpy().astype('datetime64[ms]').view(np.int64)
+    for row, (column, title, multiplicative) in enumerate(panels, start=1):
+        scale = 100 if multiplicative else 1
+        index = lttb_indices(dates, forecast[column].to_numpy())
+        x = dates[index]
+        values = forecast[column].to_numpy()[index] * scale
+        lower, upper = f'{column}_lower', f'{column}_upper'
+        # แสดงช่วงความเชื่อมั่นเฉพาะเมื่อมีความกว้าง (ถ้าไม่ใช้ MCMC ช่วงของ seasonality กว้างเป็นศูนย์)
+        if lower in forecast.columns and upper in forecast.columns and (forecast[upper] > forecast[lower]).any():
+            upper_values = forecast[upper].to_numpy()[index] * scale
+            lower_values = forecast[lower].to_numpy()[index] * scale
+            fig.add_trace(go.Scatter(
+                x=np.concatenate((x, x[::-1])),
+                y=np.concatenate((upper_values, lower_values[::-1])),
+                fill='toself',
+                fillcolor='rgba(0,114,178,0.2)',
+                line=dict(color='rgba(255,255,255,0)'),
+                hoverinfo='skip',
+                showlegend=False
+            ), row=row, col=1)
+        fig.add_trace(scatter_trace(
+            len(x),
+            x=x,
+            y=values,
+            mode='lines',
+            name=title,
+            line=dict(color='#0072B2', width=2),
+            showlegend=False,
+            hovertemplate='%{x|%d/%m/%Y}<br>%{y:.2f}' + ('%' if multiplicative else '') + '<extra></extra>'
+        ), row=row, col=1)
+        if multiplicative:
+            fig.update_yaxes(ticksuffix='%', row=row, col=1)
+
+    fig.update_layout(
+        height=260 * len(panels),
+        hovermode='x unified',
+        plot_bgcolor='white',
+        margin=dict(t=40)
+    )
+    fig.update_xaxes(type='date', showgrid=True, gridcolor='lightgray')
+    fig.update_yaxes(showgrid=True, gridcolor='lightgray')
+    return fig
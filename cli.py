@@ -0,0 +1,228 @@
+"""รันการพยากรณ์จาก command line โดยไม่ต้องเปิด Streamlit
+
+ตัวอย่าง:
+    python cli.py data.csv --output-dir forecasts --weeks 4
+    python cli.py "https://docs.google.com/spreadsheets/d/<ID>/edit" --factors temperature,humidity
+    python cli.py "https://docs.google.com/spreadsheets/d/<ID>/edit" --tabs all   # ทุกแท็บ (แท็บละพื้นที่ + แท็บปัจจัย)
+    python cli.py provinces.csv --output-dir out   # ข้อมูลหลายพื้นที่ (long format) ใช้ batch อัตโนมัติ
+    python cli.py hospital_daily.csv --daily       # ข้อมูลรายวัน/รายเคส รวมเป็นรายสัปดาห์ก่อนพยากรณ์
+    python cli.py big.csv --dataset-dir datasets   # เก็บข้อมูลที่ทำความสะอาดแล้ว ครั้งต่อไปไม่ต้องอ่านไฟล์ใหม่
+    python cli.py data.csv --tune --cache-dir cache  # ค้นหาค่าโมเดลที่ดีที่สุดก่อนพยากรณ์ (จำผลตามข้อมูล)
+    python cli.py data.csv --select-factors forward  # เลือกปัจจัยภายนอกอัตโนมัติด้วย backtest ก่อนพยากรณ์
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+from batch import run_batch_forecast
+from ingest import available_factors
+from intervals import INTERVAL_CONFIG, INTERVAL_MODES
+from dataset_store import DatasetStore
+from forecast_model import MODEL_CONFIG
+from pipeline import build_prophet_frame, default_future_factors, load_sheet_tabs, load_stored_source, run_pipeline
+from quality import find_quality_issues
+from selection import SELECTION_DIRECTIONS, select_factors, subset_cache
+from tuning import tune_model_config, tuning_cache
+
+logger = logging.getLogger('flu_forecast.cli')
+
+FORECAST_OUTPUT_COLUMNS = [
+    'week_num', 'ds', 'yhat', 'yhat_lower', 'yhat_upper',
+    'yhat_adjusted', 'yhat_lower_adjusted', 'yhat_upper_adjusted'
+]
+
+
+def _json_default(value):
+    """แปลงค่าชนิด numpy/pandas ให้เขียนเป็น JSON ได้"""
+    if isinstance(value, (np.integer, np.floating)):
+        return value.item()
+    if isinstance(value, pd.Timestamp):
+        return value.strftime('%Y-%m-%d')
+    if isinstance(value, pd.DataFrame):
+        return value.to_dict('records')
+    return str(value)
+
+
+def _write_json(path, payload):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(payload, f, ensure_ascii=False, indent=2, default=_json_default)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="พยากรณ์จำนวนผู้ป่วยรายสัปดาห์ด้วย Prophet (headless)")
+    parser.add_argument('source', help="path ของไฟล์ CSV หรือ URL ของ Google Sheets")
+    parser.add_argument('--output-dir', default='forecast_output', help="โฟลเดอร์สำหรับเขียนผลลัพธ์")
+    parser.add_argument('--weeks', type=int, default=4, help="จำนวนสัปดาห์ที่พยากรณ์ (ค่าเริ่มต้น 4)")
+    parser.add_argument('--factors', default=None,
+                        help="ปัจจัยภายนอกคั่นด้วยจุลภาค (ไม่ระบุ = ใช้ทุกตัวที่มี, '' = ไม่ใช้)")
+    parser.add_argument('--future-factor-method', choices=['mean', 'last'], default='mean',
+                        help="ค่าปัจจัยในอนาคต: ค่าเฉลี่ย (mean) หรือค่าล่าสุด (last)")
+    parser.add_argument('--interval-mode', choices=INTERVAL_MODES, default=INTERVAL_CONFIG['mode'],
+                        help="วิธีคำนวณช่วงความเชื่อมั่น: sampled = สุ่มเฉพาะช่วงพยากรณ์, analytic = สูตรประมาณ, "
+                             "prophet = model.predict เดิม")
+    parser.add_argument('--interval-samples', type=int, default=INTERVAL_CONFIG['samples'],
+                        help="จำนวนเส้นทางที่สุ่มในโหมด sampled")
+    parser.add_argument('--daily', action='store_true',
+                        help="ข้อมูลเป็นรายวันหรือรายเคส (อ่านทีละส่วนแล้วรวมเป็นรายสัปดาห์)")
+    parser.add_argument('--tabs', default=None,
+                        help="Google Sheets: ชื่อหรือ gid ของแท็บคั่นด้วยจุลภาค หรือ 'all' = ทุกแท็บ "
+                             "(แท็บผู้ป่วยรวมเป็นหลายพื้นที่ แท็บปัจจัยต่อตาม end_date)")
+    parser.add_argument('--dataset-dir', default=os.environ.get('FORECAST_DATASET_DIR'),
+                        help="โฟลเดอร์คลังชุดข้อมูลที่ทำความสะอาดแล้ว (ไฟล์เดิมเปิดจากคลังโดยไม่อ่านใหม่)")
+    parser.add_argument('--tune', action='store_true',
+                        help="ค้นหา prior/Fourier order ที่ดีที่สุดจาก backtest ก่อนพยากรณ์ (เฉพาะข้อมูลอนุกรมเดียว)")
+    parser.add_argument('--select-factors', choices=SELECTION_DIRECTIONS, default=None,
+                        help="เลือกปัจจัยภายนอกแบบ stepwise จาก backtest ก่อนพยากรณ์ (เฉพาะข้อมูลอนุกรมเดียว)")
+    parser.add_argument('--cache-dir', default=os.environ.get('FORECAST_MODEL_CACHE_DIR'),
+                        help="โฟลเดอร์แคชผลการปรับค่าโมเดลและการเลือกปัจจัย (รันครั้งถัดไปกับข้อมูลเดิมไม่ต้องค้นหาใหม่)")
+    parser.add_argument('--chunk-size', type=int, default=8, help="จำนวนอนุกรมต่องานใน batch mode")
+    parser.add_argument('--no-parallel', action='store_true', help="เทรนทีละโมเดลใน process เดียว")
+    parser.add_argument('--verbose', action='store_true')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.basicConfig(
+        level=logging.INFO if args.verbose else logging.WARNING,
+        format='%(asctime)s %(levelname)s %(name)s: %(message)s'
+    )
+    if args.weeks < 1:
+        logger.error("--weeks ต้องมากกว่า 0")
+        return 2
+
+    try:
+        if args.tabs:
+            tab_names = None if args.tabs == 'all' else [name.strip() for name in args.tabs.split(',') if name.strip()]
+            df, series_col, notes = load_sheet_tabs(args.source, tab_names)
+        else:
+            store = DatasetStore(args.dataset_dir) if args.dataset_dir else None
+            df, series_col, notes = load_stored_source(
+                args.source, store, daily=args.daily,
+                progress=lambda rows: logger.info("อ่านข้อมูลรายวันแล้ว %d แถว", rows)
+            )
+    except Exception as e:
+        logger.error("อ่านข้อมูลไม่สำเร็จ: %s", e)
+        return 1
+    for note in notes:
+        logger.info(note)
+
+    if args.factors is None:
+        factors = available_factors(df)
+    else:
+        factors = [factor.strip() for factor in args.factors.split(',') if factor.strip()]
+        missing = [factor for factor in factors if factor not in df.columns]
+        if missing:
+            logger.error("ไม่พบคอลัมน์ปัจจัย: %s", ', '.join(missing))
+            return 2
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    forecast_path = os.path.join(args.output_dir, 'forecast.csv')
+    summary_path = os.path.join(args.output_dir, 'summary.json')
+
+    if series_col:
+        # ข้อมูลหลายพื้นที่ - ใช้ batch engine
+        logger.info("พบข้อมูลหลายพื้นที่ในคอลัมน์ '%s'", series_col)
+        if args.tune:
+            logger.warning("--tune ใช้ได้เฉพาะข้อมูลอนุกรมเดียว - ใช้ค่าเริ่มต้นของโมเดล")
+        if args.select_factors:
+            logger.warning("--select-factors ใช้ได้เฉพาะข้อมูลอนุกรมเดียว - ใช้ปัจจัยทั้งหมดที่ระบุ")
+        forecast_table, errors = run_batch_forecast(
+            df, series_col, factors,
+            weeks_to_forecast=args.weeks,
+            chunk_size=args.chunk_size,
+            parallel=not args.no_parallel,
+            progress=lambda done, total: logger.info("เสร็จแล้ว %d/%d พื้นที่", done, total),
+            interval_mode=args.interval_mode,
+            interval_samples=args.interval_samples
+        )
+        forecast_table.to_csv(forecast_path, index=False)
+        quality_path = os.path.join(args.output_dir, 'quality_issues.csv')
+        quality_issues = find_quality_issues(df, series_col)
+        quality_issues.to_csv(quality_path, index=False)
+        _write_json(summary_path, {
+            'source': args.source,
+            'series_col': series_col,
+            'factors': factors,
+            'weeks': args.weeks,
+            'n_series': int(df[series_col].nunique()),
+            'n_failed': len(errors),
+            'n_series_with_quality_issues': int(quality_issues['series'].nunique()),
+            'errors': errors.to_dict('records')
+        })
+        exit_code = 0 if forecast_table['series'].nunique() > 0 else 1
+    else:
+        config = MODEL_CONFIG
+        selection = None
+        tuning = None
+        try:
+            if args.select_factors and factors:
+                selection = select_factors(
+                    build_prophet_frame(df, factors), factors, args.select_factors,
+                    parallel=not args.no_parallel,
+                    cache=subset_cache(args.cache_dir) if args.cache_dir else None,
+                    progress=lambda done, total: logger.info("เลือกปัจจัย %d/%d", done, total)
+                )
+                factors = selection['factors']
+                logger.info("ปัจจัยที่เลือก: %s (MAE %.2f, ทุกปัจจัย %.2f, เทรน %d โมเดล)",
+                            ', '.join(factors) or '-', selection['mae'], selection['all_factors_mae'],
+                            selection['n_fits'])
+            future_factors = default_future_factors(df, factors, args.future_factor_method)
+            if args.tune:
+                tuning = tune_model_config(
+                    build_prophet_frame(df, factors), factors,
+                    parallel=not args.no_parallel,
+                    cache=tuning_cache(args.cache_dir) if args.cache_dir else None,
+                    progress=lambda done, total: logger.info("ปรับค่าโมเดล %d/%d", done, total)
+                )
+                config = tuning['config']
+                logger.info("ค่าที่เลือก: %s (MAE %.2f, ค่าเริ่มต้น %.2f)",
+                            tuning['params'], tuning['mae'], tuning['default_mae'])
+            result = run_pipeline(
+                df, factors,
+                weeks_to_forecast=args.weeks,
+                future_factors=future_factors,
+                config=config,
+                parallel=not args.no_parallel,
+                interval_mode=args.interval_mode,
+                interval_samples=args.interval_samples
+            )
+        except Exception as e:
+            logger.error("พยากรณ์ไม่สำเร็จ: %s", e)
+            return 1
+
+        result['forecast'][FORECAST_OUTPUT_COLUMNS].to_csv(forecast_path, index=False)
+        _write_json(summary_path, {
+            'source': args.source,
+            'factors': result['factors'],
+            'weeks': args.weeks,
+            'n_weeks_history': len(df),
+            'metrics': result['metrics'],
+            'validation': result['validation'],
+            'factor_selection': None if selection is None else {
+                key: selection[key] for key in (
+                    'direction', 'factors', 'mae', 'all_factors_mae', 'n_cutoffs', 'n_fits', 'n_cached_fits',
+                    'fit_seconds', 'seconds'
+                )
+            },
+            'tuning': None if tuning is None else {
+                key: tuning[key] for key in ('params', 'mae', 'default_mae', 'n_cutoffs', 'n_fits', 'cached')
+            },
+            'quality_issues': [
+                {key: value for key, value in issue.items() if key != 'details'}
+                for issue in result['quality_issues']
+            ]
+        })
+        exit_code = 0
+
+    logger.info("เขียนผลลัพธ์ที่ %s และ %s", forecast_path, summary_path)
+    return exit_code
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,192 @@
+"""นำเข้าข้อมูลรายวันหรือรายเคส (line list) ขนาดใหญ่แล้วรวมเป็นรายสัปดาห์แบบ streaming
+
+อ่าน CSV ทีละ chunk และเก็บเพียงผลรวมรายวัน (ต่ออนุกรม) ไว้ในหน่วยความจำ
+หน่วยความจำจึงขึ้นกับจำนวนวัน × จำนวนอนุกรม ไม่ขึ้นกับขนาดไฟล์
+
+- มีคอลัมน์ cases: รวมจำนวนผู้ป่วยของทุกแถว (เช่น รายโรงพยาบาล) ในแต่ละวัน
+- ไม่มีคอลัมน์ cases: ถือว่าหนึ่งแถวคือหนึ่งเคส แล้วนับจำนวนแถว
+- ปัจจัยภายนอก: เฉลี่ยทุกแถวของวันเดียวกันก่อน (แถวซ้ำต่อโรงพยาบาล/เคสจึงไม่ถูกนับซ้ำ)
+  แล้วรวมเป็นรายสัปดาห์ตาม FACTOR_AGGREGATION
+
+ผลลัพธ์มีรูปแบบเดียวกับข้อมูลที่ผ่าน clean_raw_data แล้ว (end_date วันอาทิตย์, cases, week_num, ปัจจัย)
+"""
+import pandas as pd
+
+from ingest import DATE_FORMAT, EXTERNAL_FACTOR_COLUMNS, SERIES_KEY_CANDIDATES, read_csv_columns
+
+DAILY_CONFIG = {
+    'chunk_rows': 250_000,
+}
+
+# ชื่อคอลัมน์วันที่ในข้อมูลรายวัน (เรียงตามลำดับความสำคัญ)
+DAILY_DATE_CANDIDATES = ['date', 'report_date', 'onset_date', 'end_date']
+
+# วิธีรวมค่ารายวันเป็นรายสัปดาห์ (ค่าที่ไม่ได้กำหนด = mean)
+FACTOR_AGGREGATION = {
+    'temperature': 'mean',
+    'humidity': 'mean',
+    'holiday_flag': 'max',
+    'campaign': 'max',
+    'outbreak_index': 'mean',
+    'population_density': 'mean',
+    'school_closed': 'max',
+    'tourists': 'sum',
+}
+
+
+def _parse_dates(values):
+    """แปลงวันที่รูปแบบ dd/mm/yyyy (แบบเดียวกับข้อมูลรายสัปดาห์) หรือ ISO เป็นวันที่ (ไม่มีเวลา)
+
+    แปลงเฉพาะค่าที่ไม่ซ้ำแล้วกระจายกลับ (หนึ่ง chunk มีวันที่ไม่ซ้ำเพียงไม่กี่ค่า)
+    """
+    codes, uniques = pd.factorize(values)
+    uniques = pd.Series(uniques, dtype=object)
+    dates = pd.to_datetime(uniques, format=DATE_FORMAT, errors='coerce')
+    missing = dates.isna()
+    if missing.any():
+        dates[missing] = pd.to_datetime(uniques[missing], format='ISO8601', errors='coerce')
+    parsed = dates.dt.normalize().to_numpy()[codes]
+    parsed[codes < 0] = None
+    return pd.Series(parsed, index=values.index)
+
+
+def _resolve_columns(columns, date_col, count_col, series_col):
+    """เลือกคอลัมน์วันที่/จำนวน/อนุกรม/ปัจจัย จาก header"""
+    if date_col is None:
+        date_col = next((col for col in DAILY_DATE_CANDIDATES if col in columns), None)
+    if date_col is None or date_col not in columns:
+        raise ValueError(f"ไม่พบคอลัมน์วันที่ ({', '.join(DAILY_DATE_CANDIDATES)})")
+    if count_col is not None and count_col not in columns:
+        count_col = None
+    if series_col is None:
+        series_col = next((col for col in SERIES_KEY_CANDIDATES if col in columns), None)
+    elif series_col not in columns:
+        raise ValueError(f"ไม่พบคอลัมน์อนุกรม: {series_col}")
+    factor_sources = {}
+    for factor in EXTERNAL_FACTOR_COLUMNS:
+        if factor in columns:
+            factor_sources[factor] = factor
+        elif factor == 'holiday_flag' and 'holidays' in columns:
+            factor_sources[factor] = 'holidays'
+    return date_col, count_col, series_col, factor_sources
+
+
+def _reduce_chunk(chunk, date_col, count_col, series_col, factor_sources):
+    """ผลรวมรายวันของหนึ่ง chunk (index = [อนุกรม,] วันที่) และจำนวนแถวที่ใช้ไม่ได้"""
+    frame = pd.DataFrame({'date': _parse_dates(chunk[date_col])})
+    keys = ['date']
+    if series_col:
+        frame[series_col] = chunk[series_col].astype('string')
+        keys = [series_col, 'date']
+    frame['cases'] = pd.to_numeric(chunk[count_col], errors='coerce') if count_col else 1
+    for factor, source_col in factor_sources.items():
+        values = pd.to_numeric(chunk[source_col], errors='coerce')
+        frame[f'{factor}__sum'] = values.fillna(0)
+        frame[f'{factor}__n'] = values.notna().astype('int64')
+
+    valid = frame[keys + ['cases']].notna().all(axis=1)
+    reduced = frame[valid].groupby(keys, sort=False).sum()
+    return reduced, int((~valid).sum())
+
+
+def aggregate_daily_csv(source, date_col=None, count_col='cases', series_col=None,
+                        chunk_rows=None, progress=None):
+    """อ่าน CSV รายวัน/รายเคสทีละ chunk แล้วรวมเป็นรายสัปดาห์
+
+    source: path, URL หรือ file-like ที่ pd.read_csv อ่านได้
+    date_col: ไม่ระบุ = คอลัมน์แรกที่พบใน DAILY_DATE_CANDIDATES
+    count_col: คอลัมน์จำนวนผู้ป่วย ถ้าไม่มีในไฟล์จะนับหนึ่งแถวเป็นหนึ่งเคส
+    series_col: ไม่ระบุ = คอลัมน์แรกที่พบใน SERIES_KEY_CANDIDATES (คอลัมน์อื่น เช่น โรงพยาบาล ถูกรวมกัน)
+    progress: callback(จำนวนแถวที่อ่านแล้ว) หลังแต่ละ chunk
+
+    คืนค่า (DataFrame รายสัปดาห์, คอลัมน์อนุกรมหรือ None, รายการข้อความแจ้งเตือน)
+    """
+    chunk_rows = DAILY_CONFIG['chunk_rows'] if chunk_rows is None else chunk_rows
+    requested_count_col = count_col
+    date_col, count_col, series_col, factor_sources = _resolve_columns(
+        read_csv_columns(source), date_col, count_col, series_col
+    )
+    usecols = {date_col, *factor_sources.values()}
+    if count_col:
+        usecols.add(count_col)
+    if series_col:
+        usecols.add(series_col)
+
+    notes = []
+    daily = None
+    rows_read = rows_dropped = 0
+    # วันที่และอนุกรมอ่านเป็นข้อความ ค่าตัวเลขให้ parser แปลงเอง (เร็วกว่า to_numeric จากข้อความ)
+    text_columns = {col: str for col in (date_col, series_col) if col}
+    for chunk in pd.read_csv(source, usecols=sorted(usecols), chunksize=chunk_rows, dtype=text_columns):
+        reduced, dropped = _reduce_chunk(chunk, date_col, count_col, series_col, factor_sources)
+        rows_read += len(chunk)
+        rows_dropped += dropped
+        # รวมกับผลของ chunk ก่อนหน้าทันที ให้ขนาดคงที่ตามจำนวนวัน
+        daily = reduced if daily is None else pd.concat([daily, reduced]).groupby(level=daily.index.names).sum()
+        if progress:
+            progress(rows_read)
+
+    if daily is None or len(daily) == 0:
+        raise ValueError("ไม่พบข้อมูลที่ถูกต้อง")
+    if rows_dropped:
+        notes.append(f"⚠️ ข้ามแถวที่วันที่หรือจำนวนผู้ป่วยไม่ถูกต้อง {rows_dropped:,} แถว")
+    if not count_col:
+        notes.append(f"ℹ️ ไม่มีคอลัมน์ '{requested_count_col}' - นับหนึ่งแถวเป็นหนึ่งเคส ({rows_read - rows_dropped:,} เคส)")
+
+    weekly, weekly_notes = _to_weekly(daily.reset_index(), series_col, list(factor_sources))
+    notes.extend(weekly_notes)
+    if series_col and weekly[series_col].nunique() < 2:
+        weekly = weekly.drop(columns=[series_col])
+        series_col = None
+    notes.append(f"ℹ️ รวมข้อมูลรายวัน {rows_read:,} แถวเป็น {len(weekly):,} สัปดาห์")
+    return weekly, series_col, notes
+
+
+def _to_weekly(daily, series_col, factors):
+    """รวมผลรวมรายวันเป็นรายสัปดาห์ (สิ้นสุดวันอาทิตย์ เหมือน freq='W') เติมสัปดาห์ที่ไม่มีข้อมูล และตัดสัปดาห์ที่ไม่ครบ"""
+    notes = []
+    keys = [series_col] if series_col else []
+    for factor in factors:
+        count = daily.pop(f'{factor}__n')
+        daily[factor] = daily.pop(f'{factor}__sum').where(count > 0) / count.where(count > 0)
+    daily['end_date'] = daily['date'] + pd.to_timedelta((6 - daily['date'].dt.weekday) % 7, unit='D')
+
+    aggregation = {'cases': 'sum'}
+    aggregation.update({factor: FACTOR_AGGREGATION.get(factor, 'mean') for factor in factors})
+    weekly = daily.groupby(keys + ['end_date']).agg(aggregation)
+
+    # สัปดาห์แรก/สุดท้ายที่ข้อมูลไม่ครบ 7 วันจะมีผู้ป่วยน้อยกว่าจริง จึงตัดออก
+    first_day, last_day = daily['date'].min(), daily['date'].max()
+    end_dates = weekly.index.get_level_values('end_date')
+    complete = (end_dates - pd.Timedelta(days=6) >= first_day) & (end_dates <= last_day)
+    if (~complete).any() and complete.any():
+        weekly = weekly[complete]
+        notes.append("ℹ️ ตัดสัปดาห์แรก/สุดท้ายที่มีข้อมูลไม่ครบ 7 วันออก")
+
+    # สัปดาห์ที่ไม่มีแถวเลย = ไม่มีผู้ป่วย (ปัจจัยใช้ค่าสัปดาห์ใกล้เคียง)
+    all_weeks = pd.date_range(weekly.index.get_level_values('end_date').min(),
+                              weekly.index.get_level_values('end_date').max(), freq='W')
+    if series_col:
+        full_index = pd.MultiIndex.from_product(
+            [weekly.index.get_level_values(series_col).unique(), all_weeks], names=[series_col, 'end_date']
+        )
+    else:
+        full_index = pd.Index(all_weeks, name='end_date')
+    n_missing = len(full_index) - len(weekly)
+    weekly = weekly.reindex(full_index)
+    if n_missing:
+        weekly['cases'] = weekly['cases'].fillna(0)
+        notes.append(f"ℹ️ เติมสัปดาห์ที่ไม่มีข้อมูล {n_missing:,} สัปดาห์ด้วยผู้ป่วย 0 ราย")
+    if factors:
+        if series_col:
+            weekly[factors] = weekly.groupby(level=series_col)[factors].transform(lambda col: col.ffill().bfill())
+        else:
+            weekly[factors] = weekly[factors].ffill().bfill()
+
+    weekly = weekly.reset_index()
+    # คงชนิดจำนวนเต็มไว้ถ้าค่าเป็นจำนวนเต็มทั้งหมด (เช่น cases และ flag)
+    for col in ['cases'] + factors:
+        if weekly[col].notna().all() and (weekly[col] % 1 == 0).all():
+            weekly[col] = weekly[col].astype('int64')
+    weekly['week_num'] = weekly.groupby(keys).cumcount() + 1 if keys else range(1, len(weekly) + 1)
+    return weekly[keys + ['end_date', 'cases', 'week_num'] + factors], notes
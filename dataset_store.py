@@ -0,0 +1,176 @@
+"""คลังชุดข้อมูลที่ทำความสะอาดแล้วบนดิสก์ (Arrow IPC) ใช้ร่วมกันทุก session และคงอยู่หลังรีสตาร์ทเซิร์ฟเวอร์
+
+- คีย์คือ hash ของเนื้อหาไฟล์ดิบ + ชนิดข้อมูล (รายสัปดาห์/รายวัน) + DATASET_STORE_VERSION
+  ไฟล์เดิมจึงไม่ต้องอ่านและทำความสะอาดซ้ำ
+- แต่ละชุดมีสองไฟล์: <key>.arrow (ข้อมูล) และ <key>.json (ที่มา, จำนวนแถว, ปัจจัยที่พบ ฯลฯ)
+- ใช้ Arrow IPC แบบไม่บีบอัดแทน Parquet เพราะ memory-map ได้โดยตรง
+  คอลัมน์ตัวเลขและวันที่ชี้ไปที่ไฟล์โดยไม่คัดลอก (อ่านอย่างเดียว)
+  และทุก process ที่เปิดไฟล์เดียวกันใช้ page cache ร่วมกัน
+"""
+import hashlib
+import json
+import os
+import tempfile
+import time
+
+from ingest import available_factors
+
+# เพิ่มเมื่อวิธีทำความสะอาดเปลี่ยน ชุดข้อมูลเดิมจะไม่ถูกใช้อีก
+DATASET_STORE_VERSION = 1
+DATASET_STORE_MAX_ENTRIES = 64
+HASH_BLOCK_BYTES = 4 * 2 ** 20
+
+
+def hash_content(source):
+    """sha256 ของเนื้อหาไฟล์ (path, bytes หรือ file-like) อ่านทีละส่วนโดยไม่โหลดทั้งไฟล์"""
+    hasher = hashlib.sha256()
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        hasher.update(source)
+        return hasher.hexdigest()
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, 'rb') as f:
+            for block in iter(lambda: f.read(HASH_BLOCK_BYTES), b''):
+                hasher.update(block)
+        return hasher.hexdigest()
+    position = source.tell()
+    source.seek(0)
+    for block in iter(lambda: source.read(HASH_BLOCK_BYTES), b''):
+        hasher.update(block)
+    source.seek(position)
+    return hasher.hexdigest()
+
+
+def dataset_key(content_hash, kind='weekly'):
+    """คีย์ของชุดข้อมูลจาก hash ของไฟล์ดิบและชนิดข้อมูล ('weekly' หรือ 'daily')"""
+    return hashlib.sha256(f"{DATASET_STORE_VERSION}:{kind}:{content_hash}".encode('utf-8')).hexdigest()
+
+
+class DatasetStore:
+    """คลังชุดข้อมูลในโฟลเดอร์ root (ต้องมี pyarrow)
+
+    max_entries: จำนวนชุดสูงสุด เกินแล้วจะลบชุดที่เปิดล่าสุดนานที่สุด
+    """
+
+    def __init__(self, root, max_entries=DATASET_STORE_MAX_ENTRIES):
+        import pyarrow  # noqa: F401 - ตรวจว่ามี pyarrow ตั้งแต่สร้าง
+
+        if max_entries < 1:
+            raise ValueError("max_entries ต้องมากกว่า 0")
+        self.root = root
+        self.max_entries = max_entries
+        os.makedirs(root, exist_ok=True)
+
+    def __contains__(self, key):
+        return os.path.exists(self._meta_path(key)) and os.path.exists(self._data_path(key))
+
+    def load(self, key):
+        """เปิดชุดข้อมูลแบบ memory-map คืนค่า (DataFrame, metadata) หรือ None ถ้าไม่มี/ไฟล์เสีย"""
+        import pyarrow as pa
+        import pyarrow.ipc as ipc
+
+        metadata = self.metadata(key)
+        if metadata is None:
+            return None
+        try:
+            table = ipc.open_file(pa.memory_map(self._data_path(key))).read_all()
+        except (OSError, pa.ArrowInvalid):
+            self.remove(key)
+            return None
+        # split_blocks ไม่รวมคอลัมน์เป็นบล็อกเดียว คอลัมน์ที่ไม่มีค่าว่างจึงชี้ไปที่ไฟล์ได้โดยตรง
+        df = table.to_pandas(split_blocks=True)
+        # แตะไฟล์เพื่อให้การลบแบบ LRU รู้ว่าเพิ่งถูกใช้
+        os.utime(self._meta_path(key), None)
+        return df, metadata
+
+    def save(self, key, df, source, series_col=None, notes=(), kind='weekly'):
+        """บันทึกชุดข้อมูลที่ทำความสะอาดแล้ว คืนค่า metadata"""
+        import pyarrow as pa
+        import pyarrow.ipc as ipc
+
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        metadata = {
+            'key': key,
+            'kind': kind,
+            'source': source,
+            'rows': len(df),
+            'columns': [str(col) for col in df.columns],
+            'series_col': series_col,
+            'n_series': int(df[series_col].nunique()) if series_col else 1,
+            'factors': available_factors(df),
+            'start_date': str(df['end_date'].min().date()) if len(df) else None,
+            'end_date': str(df['end_date'].max().date()) if len(df) else None,
+            'notes': list(notes),
+            'bytes': table.nbytes,
+            'created_at': time.time(),
+        }
+
+        def write_table(f):
+            with ipc.new_file(f, table.schema) as writer:
+                writer.write_table(table)
+
+        # เขียนข้อมูลก่อน metadata (มี metadata = ชุดข้อมูลสมบูรณ์)
+        self._write_atomic(self._data_path(key), write_table)
+        self._write_atomic(
+            self._meta_path(key),
+            lambda f: f.write(json.dumps(metadata, ensure_ascii=False).encode('utf-8'))
+        )
+        self._prune()
+        return metadata
+
+    def metadata(self, key):
+        """metadata ของชุดข้อมูล (None ถ้าไม่มี)"""
+        if key not in self:
+            return None
+        try:
+            with open(self._meta_path(key), 'rb') as f:
+                return json.loads(f.read().decode('utf-8'))
+        except (OSError, ValueError):
+            return None
+
+    def entries(self):
+        """metadata ของทุกชุดข้อมูล เรียงจากที่เปิดล่าสุด"""
+        entries = []
+        for path in self._meta_files():
+            key = os.path.basename(path)[:-len('.json')]
+            metadata = self.metadata(key)
+            if metadata is not None:
+                metadata['last_used'] = os.path.getmtime(path)
+                entries.append(metadata)
+        return sorted(entries, key=lambda entry: entry['last_used'], reverse=True)
+
+    def remove(self, key):
+        """ลบชุดข้อมูล (ไฟล์ที่เปิดแบบ memory-map อยู่ยังใช้ได้จนกว่าจะปิด)"""
+        for path in (self._meta_path(key), self._data_path(key)):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def _data_path(self, key):
+        return os.path.join(self.root, f"{key}.arrow")
+
+    def _meta_path(self, key):
+        return os.path.join(self.root, f"{key}.json")
+
+    def _meta_files(self):
+        return [os.path.join(self.root, name) for name in os.listdir(self.root) if name.endswith('.json')]
+
+    def _write_atomic(self, path, write):
+        # เขียนลงไฟล์ชั่วคราวก่อนแล้วค่อยเปลี่ยนชื่อ ไฟล์ที่ session อื่นเปิดอยู่จึงไม่ถูกเขียนทับ
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                write(f)
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def _prune(self):
+        files = self._meta_files()
+        if len(files) <= self.max_entries:
+            return
+        files.sort(key=os.path.getmtime)
+        for path in files[:len(files) - self.max_entries]:
+            self.remove(os.path.basename(path)[:-len('.json')])
@@ -0,0 +1,358 @@
+"""สร้างและเทรนโมเดล Prophet พร้อมปัจจัยภายนอก
+
+โมเดลหลัก (primary), โมเดลสำรองแบบ conservative (adjusted) และโมเดลสุดท้าย (final)
+ถูกเทรนพร้อมกันใน process pool - เวลาเทรนรวมจึงเท่ากับการ optimize ของ Stan
+เพียงครั้งเดียวแทนที่จะเป็นสามครั้งต่อกัน
+"""
+import logging
+import multiprocessing
+import os
+import sys
+import threading
+import types
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+
+import numpy as np
+
+from profiling import optional_stage, profiled_call
+
+# การตั้งค่าโมเดล (เป็นส่วนหนึ่งของคีย์แคช - เปลี่ยนค่าแล้วโมเดลจะถูกเทรนใหม่)
+MODEL_CONFIG = {
+    'interval_width': 0.95,
+    'changepoint_prior_scale': 0.01,  # ลดความ sensitive ต่อ changepoints
+    'seasonality_prior_scale': 1.0,   # ลดความ flexible ของ seasonality
+    'uncertainty_samples': 100,       # ลดจำนวน samples สำหรับความเร็ว
+    # Fourier order ของ seasonality รายเดือน (ข้อมูล >= 12 สัปดาห์) และรายไตรมาส (>= 26 สัปดาห์), 0 = ไม่ใช้
+    'monthly_fourier_order': 3,
+    'quarterly_fourier_order': 2,
+    'factor_configs': {
+        'temperature': {'prior_scale': 0.1, 'mode': 'additive'},
+        'humidity': {'prior_scale': 0.1, 'mode': 'additive'},
+        'holiday_flag': {'prior_scale': 0.5, 'mode': 'additive'},
+        'campaign': {'prior_scale': 0.3, 'mode': 'additive'},
+        'outbreak_index': {'prior_scale': 0.5, 'mode': 'multiplicative'},
+        'population_density': {'prior_scale': 0.05, 'mode': 'additive'},
+        'school_closed': {'prior_scale': 0.3, 'mode': 'additive'},
+        'tourists': {'prior_scale': 0.1, 'mode': 'additive'}
+    },
+    'default_factor_config': {'prior_scale': 0.1, 'mode': 'additive'},
+    # โมเดลสำรองที่ conservative กว่า ใช้เมื่อ MAPE ของโมเดลหลักสูงเกินไป
+    'adjusted': {
+        'changepoint_prior_scale': 0.001,  # ลดให้มากกว่าเดิม
+        'seasonality_prior_scale': 0.1,    # ลดให้มากกว่าเดิม
+        'regressor_prior_scale': 0.01
+    },
+    'mape_adjust_threshold': 200
+}
+
+# พารามิเตอร์ของ Stan ที่ใช้เป็นจุดเริ่มต้นการ optimize รอบถัดไป (warm start)
+WARM_START_PARAMS = ('k', 'm', 'delta', 'beta', 'sigma_obs')
+
+# จำนวน worker processes สำหรับการเทรน (ค่าเริ่มต้น = จำนวน CPU)
+MAX_WORKERS = int(os.environ.get('FORECAST_MAX_WORKERS', '0')) or os.cpu_count() or 1
+
+_process_pool = None
+_process_pool_lock = threading.Lock()
+_main_module_lock = threading.Lock()
+
+
+@contextmanager
+def _neutral_main_module():
+    """ซ่อนโมดูล __main__ ระหว่าง spawn worker
+
+    Streamlit แทน __main__ ด้วยสคริปต์ app.py ถ้าไม่ซ่อนไว้ worker ที่ spawn ใหม่
+    จะรันทั้งแอปซ้ำตอนเริ่มต้น (งานที่ส่งไป worker ทั้งหมดอยู่ในโมดูลที่ import ได้อยู่แล้ว)
+    """
+    with _main_module_lock:
+        main_module = sys.modules.get('__main__')
+        sys.modules['__main__'] = types.ModuleType('__main__')
+        try:
+            yield
+        finally:
+            if main_module is not None:
+                sys.modules['__main__'] = main_module
+
+
+class _NeutralMainSpawnProcess(multiprocessing.context.SpawnProcess):
+    """worker ของ process pool: ซ่อน __main__ เฉพาะตอนเริ่ม process (ไม่ใช่ทุกครั้งที่ส่งงาน)"""
+
+    def start(self):
+        with _neutral_main_module():
+            super().start()
+
+
+class _NeutralMainSpawnContext(multiprocessing.context.SpawnContext):
+    Process = _NeutralMainSpawnProcess
+
+
+def get_process_pool():
+    """คืน process pool ที่ใช้ร่วมกันทั้งแอป (สร้างครั้งแรกเมื่อถูกเรียก)"""
+    global _process_pool
+    with _process_pool_lock:
+        if _process_pool is None:
+            # ใช้ spawn เพื่อไม่ fork process ของ Streamlit ที่มีหลาย thread
+            # worker ถูกสร้างเมื่อมีงานเข้ามา จึงซ่อน __main__ ใน Process.start ของ context แทน
+            _process_pool = ProcessPoolExecutor(
+                max_workers=MAX_WORKERS,
+                mp_context=_NeutralMainSpawnContext()
+            )
+        return _process_pool
+
+
+def reset_process_pool():
+    """ปิด process pool ที่เสียแล้ว ให้สร้างใหม่ในการเรียกครั้งถัดไป"""
+    global _process_pool
+    with _process_pool_lock:
+        if _process_pool is not None:
+            _process_pool.shutdown(wait=False, cancel_futures=True)
+            _process_pool = None
+
+
+def submit_task(fn, *args, **kwargs):
+    """ส่งงานเข้า process pool ที่ใช้ร่วมกัน คืนค่า Future"""
+    return get_process_pool().submit(fn, *args, **kwargs)
+
+
+def calculate_safe_mape(actual, predicted):
+    """คำนวณ MAPE โดยหลีกเลี่ยงการหารด้วยศูนย์"""
+    # กรองเฉพาะค่าที่ actual > 0 เพื่อหลีกเลี่ยงการหารด้วยศูนย์
+    mask = actual > 0
+    if mask.sum() == 0:
+        return np.inf  # ถ้าไม่มีค่า actual ที่ > 0
+
+    actual_filtered = actual[mask]
+    predicted_filtered = predicted[mask]
+
+    mape = np.mean(np.abs((actual_filtered - predicted_filtered) / actual_filtered)) * 100
+    return mape
+
+
+def build_prophet_model(variant, n_rows, factors, config=MODEL_CONFIG):
+    """สร้างโมเดล Prophet (ยังไม่เทรน) ตาม variant: 'primary', 'adjusted' หรือ 'final'
+
+    n_rows คือจำนวนแถวของข้อมูลทั้งหมด ใช้เลือก seasonality ที่เหมาะกับความยาวข้อมูล
+    """
+    from prophet import Prophet
+
+    if variant == 'adjusted':
+        adjusted = config['adjusted']
+        model = Prophet(
+            daily_seasonality=False,
+            weekly_seasonality=False,
+            yearly_seasonality=False,  # ปิด yearly seasonality
+            seasonality_mode='additive',
+            interval_width=config['interval_width'],
+            changepoint_prior_scale=adjusted['changepoint_prior_scale'],
+            seasonality_prior_scale=adjusted['seasonality_prior_scale']
+        )
+        # เพิ่ม regressors แบบ conservative มาก
+        for factor in factors:
+            model.add_regressor(factor, prior_scale=adjusted['regressor_prior_scale'], mode='additive')
+        return model
+
+    if variant not in ('primary', 'final'):
+        raise ValueError(f"ไม่รู้จัก variant ของโมเดล: {variant}")
+
+    model_kwargs = dict(
+        daily_seasonality=False,
+        weekly_seasonality=False,  # ปิดก่อน จะเพิ่มเองที่ละเอียดกว่า
+        yearly_seasonality=True if n_rows >= 52 else False,
+        seasonality_mode='additive',
+        interval_width=config['interval_width'],
+        changepoint_prior_scale=config['changepoint_prior_scale'],
+        seasonality_prior_scale=config['seasonality_prior_scale']
+    )
+    if variant == 'primary':
+        model_kwargs['uncertainty_samples'] = config['uncertainty_samples']
+    model = Prophet(**model_kwargs)
+
+    # เพิ่ม seasonality ที่กำหนดเอง
+    if n_rows >= 12 and config['monthly_fourier_order']:
+        model.add_seasonality(name='monthly', period=30.5/7, fourier_order=config['monthly_fourier_order'])
+    if n_rows >= 26 and config['quarterly_fourier_order']:
+        model.add_seasonality(name='quarterly', period=91.25/7, fourier_order=config['quarterly_fourier_order'])
+
+    # เพิ่ม external regressors ด้วยการตั้งค่าที่ conservative
+    factor_configs = config['factor_configs']
+    for factor in factors:
+        # ใช้ค่า conservative สำหรับปัจจัยที่ไม่ได้กำหนดไว้
+        factor_config = factor_configs.get(factor, config['default_factor_config'])
+        model.add_regressor(factor, prior_scale=factor_config['prior_scale'], mode=factor_config['mode'])
+
+    return model
+
+
+def _silence_fit_logs():
+    """ปิด log ของ cmdstanpy/prophet ที่รกหน้าจอระหว่างเทรน"""
+    for name in ('cmdstanpy', 'prophet'):
+        logging.getLogger(name).setLevel(logging.WARNING)
+
+
+def extract_warm_start(model):
+    """ดึงพารามิเตอร์ที่เทรนแล้ว (k, m, delta, beta, sigma_obs) สำหรับใช้ warm start"""
+    params = {}
+    for name in WARM_START_PARAMS:
+        value = np.asarray(model.params[name])[0]
+        params[name] = value if name in ('delta', 'beta') else float(value[0])
+    return params
+
+
+def fit_prophet_model(variant, data, n_rows, factors, config=MODEL_CONFIG, init=None):
+    """สร้างและเทรนโมเดลหนึ่งตัวใน process ปัจจุบัน
+
+    init: พารามิเตอร์จาก extract_warm_start ของโมเดลก่อนหน้า (ไม่บังคับ)
+    พารามิเตอร์ที่ขนาดไม่ตรงกับโมเดลใหม่ Prophet จะใช้ค่าเริ่มต้นปกติแทน
+    """
+    _silence_fit_logs()
+    model = build_prophet_model(variant, n_rows, factors, config)
+    if init is not None:
+        model.fit(data, init=init)
+    else:
+        model.fit(data)
+    return model
+
+
+def _fit_variant_serialized(variant, data, n_rows, factors, config, init=None):
+    """เทรนโมเดลใน worker process แล้วส่งกลับเป็น (JSON รูปแบบ serialize ของ Prophet, เวลาที่ใช้)"""
+    from prophet.serialize import model_to_json
+
+    model, stats = profiled_call(fit_prophet_model, variant, data, n_rows, factors, config, init)
+    return model_to_json(model), stats
+
+
+def fit_models(jobs, parallel=True, profiler=None):
+    """เทรนหลายโมเดลพร้อมกัน
+
+    jobs: dict ของ ชื่อ -> (variant, data, n_rows, factors, config[, init])
+    คืนค่า dict ของ ชื่อ -> โมเดลที่เทรนแล้ว
+    ถ้า process pool ใช้ไม่ได้ จะเทรนทีละโมเดลใน process ปัจจุบันแทน
+    profiler: StageProfiler สำหรับบันทึกเวลาของแต่ละโมเดลเป็นขั้นตอน fit:<ชื่อ> (ไม่บังคับ)
+    """
+    if parallel and len(jobs) > 1:
+        from prophet.serialize import model_from_json
+
+        try:
+            futures = {
+                name: submit_task(_fit_variant_serialized, *job)
+                for name, job in jobs.items()
+            }
+            models = {}
+            for name, future in futures.items():
+                model_json, stats = future.result()
+                models[name] = model_from_json(model_json)
+                if profiler is not None:
+                    profiler.add(f"fit:{name}", rows=len(jobs[name][1]), **stats)
+            return models
+        except (BrokenProcessPool, OSError):
+            reset_process_pool()
+
+    models = {}
+    for name, job in jobs.items():
+        with optional_stage(profiler, f"fit:{name}", rows=len(job[1])):
+            models[name] = fit_prophet_model(*job)
+    return models
+
+
+def train_prophet_model_with_factors(data, factors, config=MODEL_CONFIG, parallel=True, notify=None,
+                                     profiler=None):
+    """สร้างและเทรนโมเดล Prophet พร้อมปัจจัยภายนอก (แก้ไขแล้ว)
+
+    คืนค่า (model, validation_mae, validation_mape, has_validation)
+    notify(level, message) ใช้แจ้งความคืบหน้า เช่น level='warning' หรือ 'info'
+    profiler: StageProfiler สำหรับบันทึกเวลาของแต่ละขั้นตอน (ไม่บังคับ)
+    """
+    models, validation_mae, validation_mape, has_validation = train_prophet_variants(
+        data, factors, config, parallel, notify, profiler=profiler
+    )
+    return models['final'], validation_mae, validation_mape, has_validation
+
+
+def train_prophet_variants(data, factors, config=MODEL_CONFIG, parallel=True, notify=None,
+                           warm_start=None, profiler=None):
+    """เทรนโมเดลทุก variant แบบเดียวกับ train_prophet_model_with_factors
+
+    คืนค่า (dict ของ variant -> โมเดล, validation_mae, validation_mape, has_validation)
+    warm_start: dict ของ variant -> พารามิเตอร์จาก extract_warm_start ใช้เริ่มการ optimize
+    จากคำตอบของรอบก่อน (ไม่บังคับ)
+    profiler: StageProfiler สำหรับบันทึกเวลาของการเทรนแต่ละโมเดลและการ validate (ไม่บังคับ)
+    """
+    factors = list(factors)
+    warm_start = warm_start or {}
+
+    # ปรับการแบ่งข้อมูลให้เหมาะสมกว่า
+    if len(data) >= 20:
+        # ใช้ time series split สำหรับข้อมูลเยอะ
+        test_size = max(3, min(8, len(data) // 4))  # 3-8 สัปดาห์สำหรับ test
+    elif len(data) >= 10:
+        test_size = 3  # 3 สัปดาห์สำหรับข้อมูลปานกลาง
+    else:
+        test_size = 0  # ไม่ split ถ้าข้อมูลน้อยเกินไป
+
+    if test_size == 0:
+        models = fit_models({
+            'final': ('primary', data, len(data), factors, config, warm_start.get('final'))
+        }, parallel=False, profiler=profiler)
+        return models, None, None, False
+
+    split_point = len(data) - test_size
+    train_data = data.iloc[:split_point]
+    test_data = data.iloc[split_point:]
+
+    # เทรนทั้งสามโมเดลพร้อมกัน: โมเดลสำรองเทรนไว้ล่วงหน้าเผื่อ MAPE สูง
+    # และโมเดลสุดท้ายไม่ขึ้นกับผล validation จึงเทรนด้วยข้อมูลทั้งหมดได้ทันที
+    models = fit_models({
+        variant: (variant, variant_data, len(data), factors, config, warm_start.get(variant))
+        for variant, variant_data in (('primary', train_data), ('adjusted', train_data), ('final', data))
+    }, parallel=parallel, profiler=profiler)
+
+    with optional_stage(profiler, 'validate', rows=len(test_data)):
+        # import ตอนใช้ (sklearn โหลดช้า ไม่ให้ถ่วงการเปิดแอป)
+        from sklearn.metrics import mean_absolute_error
+
+        # ทดสอบกับข้อมูล test
+        model = models['primary']
+        future_test = model.make_future_dataframe(periods=len(test_data), freq='W', include_history=False)
+        for factor in factors:
+            if factor in test_data.columns:
+                future_test[factor] = test_data[factor].values
+
+        # คำนวณ validation metrics
+        test_actual = test_data['y'].values
+        test_predicted = model.predict(future_test)['yhat'].values
+
+        # ใช้ safe MAPE calculation
+        validation_mae = mean_absolute_error(test_actual, test_predicted)
+        validation_mape = calculate_safe_mape(test_actual, test_predicted)
+
+        # ป้องกัน MAPE ที่ผิดปกติ
+        if validation_mape > config['mape_adjust_threshold']:
+            if notify:
+                notify('warning', f"⚠️ MAPE เบื้องต้น {validation_mape:.1f}% สูงเกินไป - กำลังปรับโมเดล...")
+
+            test_predicted_adjusted = models['adjusted'].predict(future_test)['yhat'].values
+            validation_mape_adjusted = calculate_safe_mape(test_actual, test_predicted_adjusted)
+
+            if validation_mape_adjusted < validation_mape:
+                validation_mape = validation_mape_adjusted
+                validation_mae = mean_absolute_error(test_actual, test_predicted_adjusted)
+                if notify:
+                    notify('info', f"✅ ปรับโมเดลสำเร็จ - MAPE ลดเหลือ {validation_mape:.1f}%")
+
+    return models, validation_mae, validation_mape, True
+
+
+def reasonable_bounds(historical_mean):
+    """ช่วงค่าพยากรณ์ที่สมเหตุสมผล (ต่ำสุด, สูงสุด) จากค่าเฉลี่ยในอดีต"""
+    return max(0, historical_mean * 0.1), historical_mean * 5
+
+
+def clip_forecast(forecast_future, historical_mean):
+    """จำกัดค่าพยากรณ์ให้อยู่ในช่วงที่สมเหตุสมผล โดยเพิ่มคอลัมน์ *_adjusted"""
+    min_reasonable, max_reasonable = reasonable_bounds(historical_mean)
+
+    forecast_future['yhat_adjusted'] = forecast_future['yhat'].clip(min_reasonable, max_reasonable)
+    forecast_future['yhat_upper_adjusted'] = forecast_future['yhat_upper'].clip(min_reasonable, max_reasonable)
+    forecast_future['yhat_lower_adjusted'] = forecast_future['yhat_lower'].clip(0, max_reasonable)
+    return forecast_future
@@ -0,0 +1,74 @@
+"""อัปเดตโมเดลแบบต่อยอดเมื่อข้อมูลรายสัปดาห์ถูกเพิ่มต่อท้าย (append-only)
+
+เมื่อข้อมูลใหม่ขึ้นต้นด้วยข้อมูลชุดก่อนทุกแถว การเทรนจะเริ่ม optimize ของ Stan
+จากพารามิเตอร์ที่เทรนแล้วของรอบก่อน (k, m, delta, beta, sigma_obs) แทนค่าเริ่มต้น
+จำนวนรอบของ optimizer จึงขึ้นกับปริมาณข้อมูลใหม่ ไม่ใช่ความยาวของข้อมูลทั้งหมด
+ถ้าข้อมูลเก่าถูกแก้ไข ปัจจัยเปลี่ยน หรือการตั้งค่าเปลี่ยน จะเทรนใหม่ตั้งแต่ต้นตามปกติ
+"""
+import json
+
+from forecast_model import MODEL_CONFIG, extract_warm_start, train_prophet_variants
+
+
+def detect_append(previous, current):
+    """คืนจำนวนแถวที่ถูกเพิ่มต่อท้าย (0 = เหมือนเดิม) หรือ None ถ้าข้อมูลเดิมถูกแก้ไข"""
+    if previous is None or list(previous.columns) != list(current.columns):
+        return None
+    n_previous = len(previous)
+    if len(current) < n_previous:
+        return None
+    head = current.iloc[:n_previous].reset_index(drop=True)
+    if not head.equals(previous.reset_index(drop=True)):
+        return None
+    return len(current) - n_previous
+
+
+def _config_signature(factors, config):
+    return json.dumps([list(factors), config], sort_keys=True, default=str)
+
+
+def seed_state(data, factors, result, config=MODEL_CONFIG):
+    """สร้างสถานะจากผลการเทรนที่มีอยู่แล้ว (เช่น โมเดลจากแคช) เพื่อใช้ warm start รอบถัดไป"""
+    return {
+        'signature': _config_signature(factors, config),
+        'data': data.copy(),
+        'params': {'final': extract_warm_start(result[0])},
+        'result': result,
+    }
+
+
+def train_incremental(data, factors, state=None, config=MODEL_CONFIG, parallel=True, notify=None,
+                      profiler=None):
+    """เทรนโมเดลโดยใช้สถานะของรอบก่อน (ถ้ามี) เป็นจุดเริ่มต้น
+
+    คืนค่า (ผลการเทรนรูปแบบเดียวกับ train_prophet_model_with_factors, สถานะใหม่, โหมด)
+    โหมด: 'cold' = เทรนใหม่ทั้งหมด, 'warm' = warm start จากรอบก่อน, 'unchanged' = ใช้ผลเดิม
+    state: dict ที่คืนจากการเรียกครั้งก่อน (เก็บไว้ใน session หรือที่อื่นก็ได้)
+    profiler: StageProfiler สำหรับบันทึกเวลาการเทรนแต่ละโมเดล (ไม่บังคับ)
+    """
+    factors = list(factors)
+    signature = _config_signature(factors, config)
+
+    appended = None
+    if state is not None and state['signature'] == signature:
+        appended = detect_append(state['data'], data)
+
+    if appended == 0:
+        return state['result'], state, 'unchanged'
+
+    warm_start = None
+    if appended:
+        # variant ที่ไม่มีพารามิเตอร์ของตัวเอง (เช่น สถานะที่สร้างจากโมเดลในแคช) ใช้ของโมเดล final แทน
+        params = state['params']
+        warm_start = {variant: params.get(variant, params['final']) for variant in ('primary', 'adjusted', 'final')}
+    models, validation_mae, validation_mape, has_validation = train_prophet_variants(
+        data, factors, config, parallel, notify, warm_start=warm_start, profiler=profiler
+    )
+    result = (models['final'], validation_mae, validation_mape, has_validation)
+    new_state = {
+        'signature': signature,
+        'data': data.copy(),
+        'params': {variant: extract_warm_start(model) for variant, model in models.items()},
+        'result': result,
+    }
+    return result, new_state, 'warm' if warm_start else 'cold'
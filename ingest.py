@@ -0,0 +1,370 @@
+"""นำเข้าและทำความสะอาดข้อมูลรายสัปดาห์ (ทั้งแบบอนุกรมเดียวและแบบ long format หลายพื้นที่)"""
+import io
+
+import numpy as np
+import pandas as pd
+
+REQUIRED_COLUMNS = ['end_date', 'cases', 'week_num']
+
+EXTERNAL_FACTOR_COLUMNS = [
+    'temperature', 'humidity', 'holiday_flag', 'campaign', 'outbreak_index',
+    'population_density', 'school_closed', 'tourists'
+]
+
+# ชื่อคอลัมน์ที่ใช้ระบุพื้นที่/อนุกรมในข้อมูลแบบ long format (เรียงตามลำดับความสำคัญ)
+SERIES_KEY_CANDIDATES = ['series_id', 'province', 'district', 'region', 'area']
+
+DATE_FORMAT = '%d/%m/%Y'
+
+# ขนาดของแต่ละส่วนที่อ่านจากไฟล์ CSV (Arrow อ่านเป็น block ขนาดนี้และอ่านล่วงหน้าหลาย block
+# block ใหญ่จึงใช้หน่วยความจำมากขึ้น; pandas อ่านทีละ CSV_CHUNK_ROWS แถว)
+CSV_BLOCK_BYTES = 4 * 2 ** 20
+CSV_CHUNK_ROWS = 250_000
+
+# ชนิดข้อมูลหลังทำความสะอาด ถ้าค่าในคอลัมน์เป็นจำนวนเต็มทั้งหมด (ไม่มีค่าว่าง) จะเก็บแบบประหยัดหน่วยความจำ
+# คอลัมน์ตัวเลขอื่นเก็บเป็น float64
+COMPACT_INT_DTYPES = {
+    'cases': 'int64',
+    'week_num': 'int32',
+    'holiday_flag': 'int8',
+    'campaign': 'int8',
+    'school_closed': 'int8',
+    'population_density': 'int32',
+    'tourists': 'int32',
+}
+
+
+def detect_series_column(df):
+    """คืนชื่อคอลัมน์ระบุอนุกรมที่พบในข้อมูล (None ถ้าเป็นอนุกรมเดียว)"""
+    for col in SERIES_KEY_CANDIDATES:
+        if col in df.columns and df[col].nunique(dropna=True) > 1:
+            return col
+    return None
+
+
+def available_factors(df):
+    """คืนรายชื่อปัจจัยภายนอกที่มีข้อมูลอยู่จริง"""
+    return [col for col in EXTERNAL_FACTOR_COLUMNS if col in df.columns and not df[col].isna().all()]
+
+
+def clean_raw_data(df, series_col=None):
+    """ทำความสะอาดข้อมูลดิบ: แปลงชนิดข้อมูล, ลบแถวที่ไม่ครบ และเรียงตามวันที่
+
+    คืนค่า (DataFrame ที่สะอาดแล้ว, รายการข้อความแจ้งเตือน)
+    ถ้ากำหนด series_col ข้อมูลจะถูกเรียงตามอนุกรมแล้วตามวันที่
+    """
+    missing_columns = [col for col in REQUIRED_COLUMNS if col not in df.columns]
+    if missing_columns:
+        raise ValueError(f"ขาดคอลัมน์: {', '.join(missing_columns)}")
+
+    notes = []
+    df = df.copy()
+
+    # แปลงประเภทข้อมูลพื้นฐาน
+    df['end_date'] = pd.to_datetime(df['end_date'], format=DATE_FORMAT, errors='coerce')
+    df['cases'] = pd.to_numeric(df['cases'], errors='coerce')
+    df['week_num'] = pd.to_numeric(df['week_num'], errors='coerce')
+
+    # รองรับทั้ง 'holidays' และ 'holiday_flag'
+    if 'holidays' in df.columns and 'holiday_flag' not in df.columns:
+        df = df.rename(columns={'holidays': 'holiday_flag'})
+        notes.append("ℹ️ แปลงคอลัมน์ 'holidays' เป็น 'holiday_flag' แล้ว")
+
+    # ทำความสะอาดข้อมูลปัจจัยภายนอก
+    for col in EXTERNAL_FACTOR_COLUMNS:
+        if col in df.columns:
+            df[col] = pd.to_numeric(df[col], errors='coerce')
+
+    # ลบแถวที่มีข้อมูลหลักไม่ครบ
+    subset = REQUIRED_COLUMNS + ([series_col] if series_col else [])
+    df = df.dropna(subset=subset)
+
+    # เรียงข้อมูลตามวันที่ (แยกตามอนุกรมถ้าเป็น long format)
+    sort_columns = [series_col, 'end_date'] if series_col else ['end_date']
+    df = df.sort_values(sort_columns).reset_index(drop=True)
+
+    return df, notes
+
+
+def read_csv_columns(source):
+    """ชื่อคอลัมน์จาก header ของ CSV (ถ้า source เป็น file-like จะย้อนกลับไปต้นไฟล์)"""
+    columns = list(pd.read_csv(source, nrows=0).columns)
+    if hasattr(source, 'seek'):
+        source.seek(0)
+    return columns
+
+
+def parse_dates(values, date_format=DATE_FORMAT):
+    """แปลงวันที่ (ค่าที่แปลงไม่ได้เป็น NaT) โดยแปลงเฉพาะค่าที่ไม่ซ้ำแล้วกระจายกลับ"""
+    codes, uniques = pd.factorize(values)
+    parsed = pd.to_datetime(pd.Series(uniques, dtype=object), format=date_format, errors='coerce').to_numpy()
+    dates = parsed[codes]
+    dates[codes < 0] = np.datetime64('NaT')
+    return pd.Series(dates, index=values.index, name=values.name)
+
+
+def _compact(series, dtype):
+    """แปลงเป็นจำนวนเต็มชนิด dtype ถ้าทุกค่าเป็นจำนวนเต็มที่อยู่ในช่วงของชนิดนั้น"""
+    values = series.to_numpy()
+    if len(values) == 0 or np.isnan(values).any() or (values % 1 != 0).any():
+        return series
+    info = np.iinfo(dtype)
+    if values.min() < info.min or values.max() > info.max:
+        return series
+    return series.astype(dtype)
+
+
+def _clean_chunk(chunk, numeric_columns, rename_holidays):
+    """ทำความสะอาดหนึ่งส่วนของไฟล์: แปลงวันที่/ตัวเลข ตัดแถวที่ข้อมูลหลักไม่ครบ และลดขนาดชนิดข้อมูล
+
+    ส่วนที่ลดขนาดไม่ได้ (เช่น มีค่าว่าง) ยังเป็น float64 และ pd.concat จะแปลงทั้งคอลัมน์เป็น float64 ตาม
+    """
+    chunk['end_date'] = parse_dates(chunk['end_date'])
+    for col in numeric_columns:
+        if not pd.api.types.is_float_dtype(chunk[col]):
+            chunk[col] = pd.to_numeric(chunk[col], errors='coerce').astype('float64')
+    chunk = chunk[chunk[REQUIRED_COLUMNS].notna().all(axis=1)]
+    if rename_holidays:
+        chunk = chunk.rename(columns={'holidays': 'holiday_flag'})
+    for col, dtype in COMPACT_INT_DTYPES.items():
+        if col in chunk.columns:
+            chunk[col] = _compact(chunk[col], dtype)
+    # คัดลอกเพื่อปล่อย block float64 เดิมของทั้ง chunk (คอลัมน์ที่แปลงชนิดแล้วยังถูกอ้างถึงจาก block เดิม)
+    return chunk.copy()
+
+
+def _iter_arrow_chunks(source, numeric_columns, series_candidates):
+    """อ่านด้วย Arrow CSV reader แบบ streaming ตาม schema ที่ประกาศไว้ คืน DataFrame ทีละ block"""
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+
+    column_types = {'end_date': pa.string()}
+    for col in numeric_columns:
+        column_types[col] = pa.float64()
+    for col in series_candidates:
+        column_types[col] = pa.dictionary(pa.int32(), pa.string())
+    reader = pa_csv.open_csv(
+        source,
+        read_options=pa_csv.ReadOptions(block_size=CSV_BLOCK_BYTES),
+        convert_options=pa_csv.ConvertOptions(column_types=column_types, strings_can_be_null=True)
+    )
+    for batch in reader:
+        yield batch.to_pandas()
+
+
+def _iter_pandas_chunks(source, series_candidates):
+    dtype = {col: 'string' for col in ['end_date'] + series_candidates}
+    yield from pd.read_csv(source, dtype=dtype, chunksize=CSV_CHUNK_ROWS)
+
+
+def read_weekly_csv(source):
+    """อ่านและทำความสะอาด CSV รายสัปดาห์ทีละส่วน (ผลเหมือน pd.read_csv แล้วตามด้วย clean_raw_data)
+
+    ประกาศชนิดของคอลัมน์ที่รู้จักล่วงหน้าและใช้ Arrow CSV reader ถ้ามี pyarrow
+    (ถ้าไฟล์มีค่าที่ไม่ใช่ตัวเลขในคอลัมน์ตัวเลข จะอ่านใหม่ด้วย pandas แบบแปลงค่าผิดเป็นค่าว่าง)
+    แต่ละส่วนถูกแปลงและตัดแถวที่ไม่ครบทันที จึงไม่ต้องเก็บข้อความดิบของทั้งไฟล์
+    คอลัมน์อนุกรมเก็บเป็น categorical และคอลัมน์จำนวนเต็มใช้ชนิดตาม COMPACT_INT_DTYPES
+
+    คืนค่า (DataFrame, คอลัมน์ระบุอนุกรมหรือ None, รายการข้อความแจ้งเตือน)
+    """
+    columns = read_csv_columns(source)
+    missing_columns = [col for col in REQUIRED_COLUMNS if col not in columns]
+    if missing_columns:
+        raise ValueError(f"ขาดคอลัมน์: {', '.join(missing_columns)}")
+
+    notes = []
+    series_candidates = [col for col in SERIES_KEY_CANDIDATES if col in columns]
+    numeric_columns = [col for col in ['cases', 'week_num'] + EXTERNAL_FACTOR_COLUMNS if col in columns]
+    rename_holidays = 'holidays' in columns and 'holiday_flag' not in columns
+    if rename_holidays:
+        numeric_columns.append('holidays')
+    try:
+        import pyarrow as pa
+        chunks = [_clean_chunk(chunk, numeric_columns, rename_holidays)
+                  for chunk in _iter_arrow_chunks(source, numeric_columns, series_candidates)]
+    except ImportError:
+        chunks = None
+    except pa.ArrowInvalid:
+        # มีค่าที่แปลงตามชนิดที่ประกาศไม่ได้ - อ่านใหม่แบบแปลงค่าผิดเป็นค่าว่าง
+        if hasattr(source, 'seek'):
+            source.seek(0)
+        chunks = None
+    if not chunks:
+        # ไม่มี pyarrow, อ่านตามชนิดไม่ได้ หรือไฟล์มีแค่ header (pandas คืน chunk ว่างพร้อมคอลัมน์)
+        chunks = [_clean_chunk(chunk, numeric_columns, rename_holidays)
+                  for chunk in _iter_pandas_chunks(source, series_candidates)]
+
+    # แต่ละส่วนมีชุด category ของตัวเอง รวมเป็นชุดเดียวก่อนต่อกัน
+    for col in series_candidates:
+        categories = sorted(set().union(*(chunk[col].dropna().unique() for chunk in chunks)))
+        for chunk in chunks:
+            chunk[col] = pd.Categorical(chunk[col], categories=categories)
+    df = _concat_chunks(chunks)
+
+    # รองรับทั้ง 'holidays' และ 'holiday_flag' (เปลี่ยนชื่อไปแล้วในแต่ละส่วน)
+    if rename_holidays:
+        notes.append("ℹ️ แปลงคอลัมน์ 'holidays' เป็น 'holiday_flag' แล้ว")
+
+    series_col = detect_series_column(df)
+    if series_col and df[series_col].isna().any():
+        df = df[df[series_col].notna()].reset_index(drop=True)
+    # เรียงข้อมูลตามวันที่ (แยกตามอนุกรมถ้าเป็น long format) - ไฟล์ส่วนใหญ่เรียงมาแล้ว จึงตรวจก่อนเพื่อไม่ต้องคัดลอก
+    if not _is_sorted(df, series_col):
+        sort_columns = [series_col, 'end_date'] if series_col else ['end_date']
+        df = df.sort_values(sort_columns, ignore_index=True, kind='stable')
+    return df, series_col, notes
+
+
+def _concat_chunks(chunks):
+    """ต่อส่วนต่างๆ ทีละคอลัมน์และลบคอลัมน์ออกจากแต่ละส่วนทันที (ไม่ต้องเก็บสำเนาของทั้งไฟล์สองชุดพร้อมกัน)"""
+    if len(chunks) == 1:
+        return chunks.pop().reset_index(drop=True)
+    columns = list(chunks[0].columns)
+    data = {}
+    for col in columns:
+        data[col] = pd.concat([chunk.pop(col) for chunk in chunks], ignore_index=True)
+    chunks.clear()
+    return pd.DataFrame(data, columns=columns, copy=False)
+
+
+def _is_sorted(df, series_col):
+    """ข้อมูลเรียงตาม (อนุกรม, วันที่) อยู่แล้วหรือไม่"""
+    if series_col is None:
+        return df['end_date'].is_monotonic_increasing
+    codes = np.diff(df[series_col].cat.codes.to_numpy().astype(np.int64))
+    dates = np.diff(df['end_date'].to_numpy().view(np.int64))
+    return bool(((codes > 0) | ((codes == 0) & (dates >= 0))).all())
+
+
+# คอลัมน์ระบุอนุกรมเมื่อรวมหลายแท็บผู้ป่วย (หนึ่งแท็บต่อพื้นที่) เป็น long format
+TAB_SERIES_COLUMN = 'region'
+UTF8_BOM = b'\xef\xbb\xbf'
+
+
+def _read_covariate_tab(content):
+    """อ่านแท็บปัจจัย (มี end_date แต่ไม่มี cases) คืนค่า DataFrame หนึ่งแถวต่อสัปดาห์ และรายชื่อคอลัมน์ที่ตัดทิ้ง"""
+    raw = pd.read_csv(io.BytesIO(content), dtype={'end_date': str})
+    if 'holidays' in raw.columns and 'holiday_flag' not in raw.columns:
+        raw = raw.rename(columns={'holidays': 'holiday_flag'})
+    covariates = pd.DataFrame({'end_date': parse_dates(raw['end_date'])})
+    dropped = []
+    for col in raw.columns:
+        if col == 'end_date' or col in SERIES_KEY_CANDIDATES or col == 'week_num':
+            continue
+        values = pd.to_numeric(raw[col], errors='coerce').astype('float64')
+        if values.isna().all():
+            dropped.append(col)
+        else:
+            covariates[col] = values
+    covariates = covariates[covariates['end_date'].notna()]
+    # วันที่ซ้ำในแท็บเดียวกันใช้ค่าเฉลี่ย
+    return covariates.groupby('end_date', as_index=False, sort=True).mean(), dropped
+
+
+def _csv_field(value):
+    """ค่าหนึ่งช่องของ CSV (ใส่เครื่องหมายคำพูดเมื่อจำเป็น)"""
+    if any(char in value for char in ',"\r\n'):
+        return '"' + value.replace('"', '""') + '"'
+    return value
+
+
+def _read_case_tabs(case_tabs):
+    """อ่านแท็บผู้ป่วยหลายแท็บ [(ชื่อ, เนื้อหา, คอลัมน์), ...] เป็น long format (คอลัมน์ TAB_SERIES_COLUMN = ชื่อแท็บ)
+
+    แท็บที่ header เหมือนกันถูกต่อเป็น CSV เดียว (เติมชื่อแท็บหน้าทุกบรรทัด) แล้วอ่านครั้งเดียว
+    เพราะการอ่านแต่ละไฟล์มีค่าใช้จ่ายคงที่ซึ่งมากกว่าเวลาอ่านข้อมูลของแท็บเล็กๆ
+    แท็บที่มีคอลัมน์อนุกรมของตัวเองหรือมีเครื่องหมายคำพูด (ช่องอาจมีขึ้นบรรทัดใหม่) อ่านทีละแท็บ
+    """
+    frames, notes, groups = [], [], {}
+    for name, content, columns in case_tabs:
+        if b'"' in content or any(col in SERIES_KEY_CANDIDATES for col in columns):
+            df_tab, tab_series_col, tab_notes = read_weekly_csv(io.BytesIO(content))
+            notes.extend(f"{note} ({name})" for note in tab_notes)
+            if tab_series_col:
+                labels = name + '/' + df_tab[tab_series_col].astype(str)
+            else:
+                labels = pd.Series(name, index=df_tab.index)
+            df_tab = df_tab.drop(columns=[col for col in SERIES_KEY_CANDIDATES if col in df_tab.columns])
+            df_tab.insert(0, TAB_SERIES_COLUMN, labels)
+            frames.append(df_tab)
+        else:
+            # BOM ต้องตัดก่อนแยก header ไม่เช่นนั้นจะติดไปกับชื่อคอลัมน์ของ CSV ที่ต่อแล้ว
+            if content.startswith(UTF8_BOM):
+                content = content[len(UTF8_BOM):]
+            header, _, body = content.partition(b'\n')
+            groups.setdefault(header.rstrip(b'\r'), []).append((name, body))
+
+    for header, bodies in groups.items():
+        parts = [TAB_SERIES_COLUMN.encode('utf-8') + b',' + header + b'\n']
+        for name, body in bodies:
+            body = body.rstrip(b'\r\n')
+            if body:
+                prefix = _csv_field(name).encode('utf-8') + b','
+                parts.append(prefix + body.replace(b'\n', b'\n' + prefix) + b'\n')
+        df_group, _, group_notes = read_weekly_csv(io.BytesIO(b''.join(parts)))
+        notes.extend(group_notes)
+        df_group[TAB_SERIES_COLUMN] = df_group[TAB_SERIES_COLUMN].astype(str)
+        frames.append(df_group)
+
+    df = pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+    labels = df[TAB_SERIES_COLUMN].astype(str)
+    df[TAB_SERIES_COLUMN] = pd.Categorical(labels, categories=sorted(labels.unique()))
+    return df, notes
+
+
+def combine_sheet_tabs(tabs):
+    """รวมหลายแท็บของ workbook เดียวกัน [(ชื่อแท็บ, เนื้อหา CSV), ...] เป็นข้อมูลชุดเดียว
+
+    - แท็บที่มี REQUIRED_COLUMNS คือแท็บผู้ป่วย: ถ้ามีหลายแท็บจะรวมเป็น long format
+      โดยคอลัมน์ TAB_SERIES_COLUMN เป็นชื่อแท็บ (ถ้าแท็บมีหลายอนุกรมอยู่แล้ว ใช้ "ชื่อแท็บ/อนุกรม")
+    - แท็บที่มี end_date แต่ไม่มี cases คือแท็บปัจจัย: นำคอลัมน์ตัวเลขมาต่อกับทุกอนุกรมตาม end_date
+      (คอลัมน์ที่แท็บผู้ป่วยมีอยู่แล้วไม่ถูกแทนที่)
+    - แท็บอื่นถูกข้ามพร้อมข้อความแจ้งเตือน
+
+    คืนค่า (DataFrame, คอลัมน์ระบุอนุกรมหรือ None, รายการข้อความแจ้งเตือน) แบบเดียวกับ read_weekly_csv
+    """
+    case_tabs, covariate_frames, notes = [], [], []
+    for name, content in tabs:
+        columns = read_csv_columns(io.BytesIO(content))
+        if all(col in columns for col in REQUIRED_COLUMNS):
+            case_tabs.append((name, content, columns))
+        elif 'end_date' in columns:
+            covariates, dropped = _read_covariate_tab(content)
+            if dropped:
+                notes.append(f"ℹ️ ข้ามคอลัมน์ที่ไม่ใช่ตัวเลขในแท็บ '{name}': {', '.join(map(str, dropped))}")
+            if len(covariates.columns) > 1:
+                covariate_frames.append((name, covariates))
+        else:
+            notes.append(f"⚠️ ข้ามแท็บ '{name}' (ไม่มีคอลัมน์ end_date)")
+    if not case_tabs:
+        raise ValueError(f"ไม่พบแท็บที่มีคอลัมน์ {', '.join(REQUIRED_COLUMNS)}")
+
+    if len(case_tabs) == 1:
+        df, series_col, tab_notes = read_weekly_csv(io.BytesIO(case_tabs[0][1]))
+        notes.extend(tab_notes)
+    else:
+        df, tab_notes = _read_case_tabs(case_tabs)
+        notes.extend(tab_notes)
+        series_col = TAB_SERIES_COLUMN
+        notes.append(f"ℹ️ รวมแท็บผู้ป่วย {len(case_tabs)} แท็บเป็นข้อมูลหลายพื้นที่ (คอลัมน์ '{TAB_SERIES_COLUMN}')")
+
+    for name, covariates in covariate_frames:
+        new_columns = [col for col in covariates.columns if col != 'end_date' and col not in df.columns]
+        skipped = [col for col in covariates.columns if col != 'end_date' and col in df.columns]
+        if skipped:
+            notes.append(f"ℹ️ แท็บ '{name}': คอลัมน์ {', '.join(map(str, skipped))} มีอยู่แล้ว จึงไม่นำมาใช้")
+        if not new_columns:
+            continue
+        df = df.merge(covariates[['end_date'] + new_columns], on='end_date', how='left', sort=False)
+        n_missing = int(df[new_columns[0]].isna().sum())
+        if n_missing:
+            notes.append(f"⚠️ แท็บ '{name}' ไม่มีข้อมูลของ {n_missing:,} แถว (ค่าว่าง)")
+        for col in new_columns:
+            if col in COMPACT_INT_DTYPES:
+                df[col] = _compact(df[col], COMPACT_INT_DTYPES[col])
+        notes.append(f"🌍 นำปัจจัยจากแท็บ '{name}' มาต่อตาม end_date: {', '.join(map(str, new_columns))}")
+
+    if not _is_sorted(df, series_col):
+        sort_columns = [series_col, 'end_date'] if series_col else ['end_date']
+        df = df.sort_values(sort_columns, ignore_index=True, kind='stable')
+    return df, series_col, notes
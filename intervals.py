@@ -0,0 +1,247 @@
+"""ช่วงความเชื่อมั่นของการพยากรณ์แบบเร็ว (ใช้แทน model.predict ของ Prophet ได้โดยตรง)
+
+model.predict ของ Prophet สุ่ม uncertainty_samples เส้นทาง (โมเดล final ใช้ค่าเริ่มต้น 1000)
+ให้ทุกแถวรวมถึงข้อมูลในอดีตทั้งหมด ทั้งที่แถวในอดีตไม่มีความไม่แน่นอนของ trend
+โมดูลนี้คำนวณค่ากลางแบบไม่สุ่ม แล้วคำนวณช่วงตามโหมด:
+
+- 'prophet': เรียก model.predict ตามเดิม
+- 'sampled': สุ่มเส้นทาง trend (changepoint ในอนาคต) + noise เฉพาะแถวอนาคต ตามวิธีเดียวกับ Prophet
+  เส้นทางที่สุ่มแล้วขึ้นกับวันที่และพารามิเตอร์ของโมเดลเท่านั้น จึงถูกแคชไว้
+  เปลี่ยนเพียงค่าปัจจัยในอนาคตจะไม่สุ่มใหม่
+- 'analytic': ประมาณด้วยการแจกแจงปกติจากความแปรปรวนของ trend และ sigma_obs (ไม่สุ่มเลย เหมาะกับการใช้งานแบบโต้ตอบ)
+
+แถวในอดีตทุกโหมด (ยกเว้น 'prophet') ใช้ yhat ± z·sigma_obs ซึ่งเป็นการแจกแจงเดียวกับที่ Prophet สุ่มได้
+โมเดลที่ไม่ใช่ linear growth หรือใช้ MCMC จะใช้ model.predict เสมอ
+
+predict_scenarios พยากรณ์หลายสถานการณ์ (ค่าปัจจัยในอนาคตต่างกัน วันที่เดียวกัน) ในการคำนวณครั้งเดียว
+ทุกสถานการณ์ใช้เส้นทาง trend ที่สุ่มชุดเดียวกัน ความต่างระหว่างสถานการณ์จึงมาจากค่าปัจจัยเท่านั้น
+"""
+from statistics import NormalDist
+
+import numpy as np
+import pandas as pd
+
+from model_cache import ModelCache
+
+INTERVAL_MODES = ['prophet', 'sampled', 'analytic']
+
+# ค่าเริ่มต้นของการคำนวณช่วงความเชื่อมั่น (จำนวนเส้นทางเท่ากับค่าเริ่มต้นของ Prophet)
+INTERVAL_CONFIG = {
+    'mode': 'sampled',
+    'samples': 1000,
+    'seed': 42,
+}
+
+# จำนวนชุดเส้นทาง trend ที่เก็บไว้ (ชุดละ samples × จำนวนสัปดาห์อนาคต × 2 ค่า)
+TREND_PATH_CACHE_MAX_ENTRIES = 32
+
+_trend_path_cache = ModelCache(max_entries=TREND_PATH_CACHE_MAX_ENTRIES)
+
+
+def _point_forecast(model, df):
+    """ค่ากลางของการพยากรณ์แบบเดียวกับ model.predict แต่ไม่สุ่มช่วงความเชื่อมั่น"""
+    frame = model.setup_dataframe(df.copy())
+    frame['trend'] = model.predict_trend(frame)
+    components = model.predict_seasonal_components(frame)
+    cols = ['ds', 'trend']
+    if 'cap' in frame:
+        cols.append('cap')
+    if model.logistic_floor:
+        cols.append('floor')
+    return frame, frame[cols], components
+
+
+def _future_step(model, t_future):
+    """ระยะห่างของ t ต่อหนึ่งแถวในอนาคต (ใช้ของข้อมูลในอดีตถ้ามีแถวอนาคตแถวเดียว)"""
+    if len(t_future) > 1:
+        return float(np.diff(t_future).mean())
+    return float(np.diff(model.history['t']).mean())
+
+
+def _trend_change_params(model, t_future):
+    """(ระยะห่างของ t, โอกาสเกิด changepoint ต่อแถว, ขนาดเฉลี่ยของการเปลี่ยน slope) แบบเดียวกับ Prophet"""
+    single_diff = _future_step(model, t_future)
+    likelihood = len(model.changepoints_t) * single_diff
+    mean_delta = float(np.mean(np.abs(model.params['delta'][0]))) + 1e-8
+    return single_diff, likelihood, mean_delta
+
+
+def _sigma_obs(model):
+    return float(np.ravel(model.params['sigma_obs'])[0]) * float(model.y_scale)
+
+
+def sample_trend_paths(model, t_future, n_samples, seed, cache=None):
+    """สุ่มส่วนเบี่ยงเบนของ trend และ noise ของแถวอนาคต คืนค่า (deviation, noise) ขนาด (n_samples, แถว)
+
+    คีย์แคชประกอบด้วยพารามิเตอร์ที่มีผลต่อการสุ่มเท่านั้น ค่าปัจจัยภายนอกไม่มีผล
+    """
+    cache = _trend_path_cache if cache is None else cache
+    single_diff, likelihood, mean_delta = _trend_change_params(model, t_future)
+    y_scale = float(model.y_scale)
+    sigma = _sigma_obs(model)
+    key = repr((single_diff, likelihood, mean_delta, y_scale, sigma, len(t_future), n_samples, seed))
+    paths = cache.get(key)
+    if paths is not None:
+        return paths
+
+    rng = np.random.default_rng(seed)
+    shape = (n_samples, len(t_future))
+    # changepoint ในอนาคต: เกิดด้วยโอกาส likelihood ต่อแถว ขนาดตาม Laplace (เหมือน Prophet._sample_uncertainty)
+    changes = rng.laplace(0, mean_delta, size=shape) * (rng.uniform(size=shape) < likelihood)
+    changes = (changes + np.hstack([np.zeros((n_samples, 1)), changes])[:, :-1]) / 2
+    deviation = changes.cumsum(axis=1).cumsum(axis=1) * single_diff * y_scale
+    noise = rng.normal(0, sigma, size=shape)
+    paths = (deviation, noise)
+    cache.put(key, paths)
+    return paths
+
+
+def trend_variance(model, t_future):
+    """ความแปรปรวนของส่วนเบี่ยงเบนของ trend ในแต่ละแถวอนาคต (สูตรปิดของกระบวนการสุ่มเดียวกัน)"""
+    single_diff, likelihood, mean_delta = _trend_change_params(model, t_future)
+    # การเปลี่ยน slope แต่ละครั้ง: ความแปรปรวน = โอกาสเกิด × 2·b² ของ Laplace(0, b)
+    change_variance = min(likelihood, 1.0) * 2 * mean_delta ** 2
+    # ส่วนเบี่ยงเบนที่แถว j = single_diff · Σ ((2(j-m)+1)/2) · x_m
+    weights = ((2 * np.arange(len(t_future)) + 1) / 2) ** 2
+    return change_variance * np.cumsum(weights) * (single_diff * float(model.y_scale)) ** 2
+
+
+def _future_intervals(model, t_future, trend, scale, additive, mode, n_samples, seed, cache):
+    """ช่วงความเชื่อมั่นของแถวอนาคต
+
+    trend: (แถว,) ใช้ร่วมกันทุกกลุ่ม, scale = 1 + multiplicative และ additive: (กลุ่ม, แถว)
+    คืนค่า (yhat_lower, yhat_upper) ขนาด (กลุ่ม, แถว) และ (trend_lower, trend_upper) ขนาด (แถว,)
+    """
+    z = NormalDist().inv_cdf((1 + model.interval_width) / 2)
+    sigma = _sigma_obs(model)
+    if mode == 'sampled':
+        deviation, noise = sample_trend_paths(model, t_future, n_samples, seed, cache)
+        trend_samples = trend + deviation
+        yhat_samples = trend_samples[:, None, :] * scale + additive + noise[:, None, :]
+        lower_p = 100 * (1 - model.interval_width) / 2
+        upper_p = 100 * (1 + model.interval_width) / 2
+        yhat_lower, yhat_upper = np.percentile(yhat_samples, [lower_p, upper_p], axis=0)
+        trend_lower, trend_upper = np.percentile(trend_samples, [lower_p, upper_p], axis=0)
+    else:
+        variance = trend_variance(model, t_future)
+        yhat = trend * scale + additive
+        yhat_std = np.sqrt(variance * scale ** 2 + sigma ** 2)
+        yhat_lower, yhat_upper = yhat - z * yhat_std, yhat + z * yhat_std
+        trend_lower = trend - z * np.sqrt(variance)
+        trend_upper = trend + z * np.sqrt(variance)
+    return yhat_lower, yhat_upper, trend_lower, trend_upper
+
+
+def _resolve_options(mode, n_samples, seed):
+    mode = INTERVAL_CONFIG['mode'] if mode is None else mode
+    n_samples = INTERVAL_CONFIG['samples'] if n_samples is None else int(n_samples)
+    seed = INTERVAL_CONFIG['seed'] if seed is None else seed
+    if mode not in INTERVAL_MODES:
+        raise ValueError(f"ไม่รู้จักโหมดช่วงความเชื่อมั่น: {mode}")
+    if n_samples < 1:
+        raise ValueError("จำนวนเส้นทางที่สุ่มต้องมากกว่า 0")
+    return mode, n_samples, seed
+
+
+def predict_with_intervals(model, df, mode=None, n_samples=None, seed=None, cache=None):
+    """พยากรณ์เหมือน model.predict(df) แต่คำนวณช่วงความเชื่อมั่นตามโหมด (ดูคำอธิบายของโมดูล)
+
+    mode, n_samples, seed: ค่าเริ่มต้นจาก INTERVAL_CONFIG
+    cache: ModelCache สำหรับเส้นทาง trend ที่สุ่มแล้ว (ค่าเริ่มต้น = แคชร่วมของ process)
+    """
+    mode, n_samples, seed = _resolve_options(mode, n_samples, seed)
+    if mode == 'prophet' or model.growth != 'linear' or model.mcmc_samples:
+        return model.predict(df)
+
+    frame, forecast, components = _point_forecast(model, df)
+    trend = frame['trend'].to_numpy(dtype=float)
+    multiplicative = components['multiplicative_terms'].to_numpy(dtype=float)
+    additive = components['additive_terms'].to_numpy(dtype=float)
+    yhat = trend * (1 + multiplicative) + additive
+
+    # แถวในอดีต: ไม่มีความไม่แน่นอนของ trend เหลือเพียง noise
+    z = NormalDist().inv_cdf((1 + model.interval_width) / 2)
+    sigma = _sigma_obs(model)
+    yhat_lower, yhat_upper = yhat - z * sigma, yhat + z * sigma
+    trend_lower, trend_upper = trend.copy(), trend.copy()
+
+    t = frame['t'].to_numpy(dtype=float)
+    future = t > 1
+    if future.any():
+        lower, upper, trend_lower[future], trend_upper[future] = _future_intervals(
+            model, t[future], trend[future], 1 + multiplicative[future][None], additive[future][None],
+            mode, n_samples, seed, cache
+        )
+        yhat_lower[future], yhat_upper[future] = lower[0], upper[0]
+
+    # ลำดับคอลัมน์เหมือนผลของ model.predict
+    intervals = pd.DataFrame({
+        'yhat_lower': yhat_lower,
+        'yhat_upper': yhat_upper,
+        'trend_lower': trend_lower,
+        'trend_upper': trend_upper,
+    })
+    result = pd.concat((forecast, intervals, components), axis=1)
+    result['yhat'] = yhat
+    return result
+
+
+def predict_scenarios(model, future, scenarios, mode=None, n_samples=None, seed=None, cache=None):
+    """พยากรณ์หลายสถานการณ์ในครั้งเดียว
+
+    future: DataFrame ของแถวอนาคต (ds และคอลัมน์ที่ทุกสถานการณ์ใช้ร่วมกัน)
+    scenarios: dict ชื่อ → dict คอลัมน์ปัจจัย → ค่า (scalar หรือ array ยาวเท่าจำนวนแถว)
+    คืนค่า DataFrame เดียวที่เรียงต่อกันทีละสถานการณ์ (สถานการณ์ละ len(future) แถว ตามลำดับของ scenarios)
+    คอลัมน์เหมือน predict_with_intervals และเพิ่มคอลัมน์ scenario
+    """
+    mode, n_samples, seed = _resolve_options(mode, n_samples, seed)
+    names = list(scenarios)
+    n_rows = len(future)
+    stacked = future.iloc[np.tile(np.arange(n_rows), len(names))].reset_index(drop=True)
+    for col in dict.fromkeys(col for name in names for col in scenarios[name]):
+        stacked[col] = np.concatenate([
+            np.broadcast_to(np.asarray(scenarios[name][col] if col in scenarios[name] else future[col], dtype=float),
+                            (n_rows,))
+            for name in names
+        ])
+    labels = pd.Categorical(np.repeat(np.arange(len(names)), n_rows))
+    labels = labels.rename_categories(names) if names else labels
+
+    if mode == 'prophet' or model.growth != 'linear' or model.mcmc_samples:
+        parts = [predict_with_intervals(model, stacked.iloc[i * n_rows:(i + 1) * n_rows].reset_index(drop=True),
+                                        mode, n_samples, seed, cache)
+                 for i in range(len(names))]
+        result = pd.concat(parts, ignore_index=True) if parts else model.predict(stacked)
+        result['scenario'] = labels
+        return result
+
+    # ค่ากลางของทุกสถานการณ์คำนวณใน DataFrame เดียว
+    # Prophet เรียงแถวตาม ds (ไม่ stable) จึงเก็บลำดับเดิมไว้แล้วเรียงกลับ
+    stacked['_scenario_row'] = np.arange(len(stacked))
+    frame, forecast, components = _point_forecast(model, stacked)
+    order = np.argsort(frame['_scenario_row'].to_numpy(), kind='stable')
+    frame = frame.iloc[order].reset_index(drop=True)
+    forecast = forecast.iloc[order].reset_index(drop=True)
+    components = components.iloc[order].reset_index(drop=True)
+
+    shape = (len(names), n_rows)
+    trend = frame['trend'].to_numpy(dtype=float)[:n_rows]
+    multiplicative = components['multiplicative_terms'].to_numpy(dtype=float).reshape(shape)
+    additive = components['additive_terms'].to_numpy(dtype=float).reshape(shape)
+    t = frame['t'].to_numpy(dtype=float)[:n_rows]
+    if not (t > 1).all():
+        raise ValueError("predict_scenarios ใช้กับแถวอนาคตเท่านั้น")
+    yhat_lower, yhat_upper, trend_lower, trend_upper = _future_intervals(
+        model, t, trend, 1 + multiplicative, additive, mode, n_samples, seed, cache
+    )
+
+    intervals = pd.DataFrame({
+        'yhat_lower': yhat_lower.ravel(),
+        'yhat_upper': yhat_upper.ravel(),
+        'trend_lower': np.tile(trend_lower, len(names)),
+        'trend_upper': np.tile(trend_upper, len(names)),
+    })
+    result = pd.concat((forecast, intervals, components), axis=1)
+    result['yhat'] = (trend * (1 + multiplicative) + additive).ravel()
+    result['scenario'] = labels
+    return result
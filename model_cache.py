@@ -0,0 +1,190 @@
+"""แคชโมเดลแบบ content-addressed สำหรับโมเดล Prophet ที่เทรนแล้ว
+
+คีย์ของแคชคือ hash ของข้อมูล + ปัจจัยภายนอก + การตั้งค่าโมเดล
+ถ้าข้อมูลนำเข้าไม่เปลี่ยน การ rerun ของ Streamlit จะดึงโมเดลเดิมมาใช้ทันที
+"""
+import hashlib
+import json
+import os
+import pickle
+import tempfile
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+
+def hash_dataframe(df):
+    """คำนวณ hash ของเนื้อหา DataFrame (คอลัมน์, dtype และค่าทุกแถว)"""
+    hasher = hashlib.sha256()
+    hasher.update(json.dumps([str(col) for col in df.columns]).encode('utf-8'))
+    hasher.update(json.dumps([str(dtype) for dtype in df.dtypes]).encode('utf-8'))
+    hasher.update(pd.util.hash_pandas_object(df, index=False).values.tobytes())
+    return hasher.hexdigest()
+
+
+def make_cache_key(data, factors, config):
+    """สร้างคีย์แคชจากข้อมูล, รายชื่อปัจจัย และการตั้งค่าโมเดล"""
+    hasher = hashlib.sha256()
+    hasher.update(hash_dataframe(data).encode('utf-8'))
+    # ลำดับของปัจจัยมีผลต่อลำดับ regressors ในโมเดล จึงไม่เรียงใหม่
+    hasher.update(json.dumps(list(factors)).encode('utf-8'))
+    hasher.update(json.dumps(config, sort_keys=True, default=str).encode('utf-8'))
+    return hasher.hexdigest()
+
+
+class ModelCache:
+    """แคชแบบ LRU ในหน่วยความจำ (จำกัดจำนวนรายการ) และเลือกเก็บลงดิสก์ได้
+
+    - max_entries: จำนวนรายการสูงสุดในหน่วยความจำ เกินแล้วจะลบรายการที่ใช้ล่าสุดนานที่สุด
+    - disk_dir: โฟลเดอร์สำหรับเก็บแคชถาวร (None = ไม่ใช้ดิสก์)
+    - dumps/loads: ฟังก์ชันแปลงค่าเป็น bytes และกลับ สำหรับเก็บลงดิสก์
+    """
+
+    def __init__(self, max_entries=16, disk_dir=None, max_disk_entries=256,
+                 dumps=pickle.dumps, loads=pickle.loads):
+        if max_entries < 1:
+            raise ValueError("max_entries ต้องมากกว่า 0")
+        self.max_entries = max_entries
+        self.disk_dir = disk_dir
+        self.max_disk_entries = max_disk_entries
+        self._dumps = dumps
+        self._loads = loads
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        with self._lock:
+            if key in self._entries:
+                return True
+        return self.disk_dir is not None and os.path.exists(self._disk_path(key))
+
+    def get(self, key, default=None):
+        """ดึงค่าจากแคช (หน่วยความจำก่อน แล้วจึงดิสก์)"""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+
+        value = self._load_from_disk(key)
+        if value is None:
+            with self._lock:
+                self.misses += 1
+            return default
+
+        with self._lock:
+            self.hits += 1
+            self._store(key, value)
+        return value
+
+    def put(self, key, value):
+        """เก็บค่าลงแคช (และลงดิสก์ถ้าเปิดใช้)"""
+        with self._lock:
+            self._store(key, value)
+        self._save_to_disk(key, value)
+
+    def clear(self, include_disk=False):
+        """ล้างแคชในหน่วยความจำ (และบนดิสก์ถ้ากำหนด)"""
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+        if include_disk and self.disk_dir:
+            for name in os.listdir(self.disk_dir):
+                if name.endswith('.cache'):
+                    os.remove(os.path.join(self.disk_dir, name))
+
+    def _store(self, key, value):
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, f"{key}.cache")
+
+    def _load_from_disk(self, key):
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            with open(path, 'rb') as f:
+                payload = f.read()
+            # แตะไฟล์เพื่อให้การลบแบบ LRU บนดิสก์รู้ว่าเพิ่งถูกใช้
+            os.utime(path, None)
+            return self._loads(payload)
+        except FileNotFoundError:
+            return None
+        except Exception:
+            # ไฟล์แคชเสียหรือเข้ากันไม่ได้ - ทิ้งแล้วเทรนใหม่
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+
+    def _save_to_disk(self, key, value):
+        if not self.disk_dir:
+            return
+        payload = self._dumps(value)
+        # เขียนลงไฟล์ชั่วคราวก่อนแล้วค่อยเปลี่ยนชื่อ ป้องกันไฟล์ครึ่งๆ กลางๆ
+        fd, tmp_path = tempfile.mkstemp(dir=self.disk_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(payload)
+            os.replace(tmp_path, self._disk_path(key))
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self._prune_disk()
+
+    def _prune_disk(self):
+        files = [
+            os.path.join(self.disk_dir, name)
+            for name in os.listdir(self.disk_dir) if name.endswith('.cache')
+        ]
+        if len(files) <= self.max_disk_entries:
+            return
+        files.sort(key=os.path.getmtime)
+        for path in files[:len(files) - self.max_disk_entries]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def dump_training_result(result):
+    """แปลงผลการเทรน (model, mae, mape, has_validation) เป็น bytes สำหรับเก็บลงดิสก์"""
+    from prophet.serialize import model_to_json
+
+    model, val_mae, val_mape, has_validation = result
+    payload = {
+        'model': model_to_json(model),
+        'val_mae': val_mae,
+        'val_mape': val_mape,
+        'has_validation': has_validation,
+    }
+    return json.dumps(payload).encode('utf-8')
+
+
+def load_training_result(payload):
+    """แปลง bytes จาก dump_training_result กลับเป็นผลการเทรน"""
+    from prophet.serialize import model_from_json
+
+    data = json.loads(payload.decode('utf-8'))
+    return (
+        model_from_json(data['model']),
+        data['val_mae'],
+        data['val_mape'],
+        data['has_validation'],
+    )
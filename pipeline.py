@@ -0,0 +1,328 @@
+"""ขั้นตอนการพยากรณ์แบบไม่ต้องใช้ UI: นำเข้าข้อมูล → ตรวจคุณภาพ → เทรน → พยากรณ์ → ประเมินผล
+
+ทุกฟังก์ชันในโมดูลนี้ไม่เรียก Streamlit จึง import ใช้ได้จากสคริปต์, cron หรือ CLI (cli.py)
+"""
+import io
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+from forecast_model import (
+    MODEL_CONFIG, calculate_safe_mape, clip_forecast, reasonable_bounds, train_prophet_model_with_factors
+)
+from daily import aggregate_daily_csv
+from dataset_store import dataset_key, hash_content
+from ingest import available_factors, clean_raw_data, combine_sheet_tabs, detect_series_column, read_weekly_csv
+from intervals import predict_scenarios, predict_with_intervals
+from quality import describe_issues, find_quality_issues
+from scenarios import factor_path
+from sheets import SHEETS_MAX_WORKERS, SheetsFetcher, parse_sheet_tabs
+from whatif import WhatIfEngine
+
+SHEETS_HOST = "docs.google.com/spreadsheets"
+# ปลายทางสำหรับดาวน์โหลด CSV (เปลี่ยนเป็นเซิร์ฟเวอร์จำลองในเครื่องเพื่อทดสอบแบบ offline ได้)
+SHEETS_EXPORT_BASE = os.environ.get('FORECAST_SHEETS_EXPORT_BASE', 'https://docs.google.com')
+
+
+def get_prophet_reserved_names():
+    """ส่งคืนรายชื่อที่ Prophet จองไว้"""
+    return [
+        'ds', 'y', 't', 'trend', 'seasonal', 'seasonality',
+        'holidays', 'holiday', 'mcmc_samples', 'uncertainty_samples',
+        'yhat', 'yhat_lower', 'yhat_upper', 'cap', 'floor',
+        'additive_terms', 'multiplicative_terms', 'extra_regressors'
+    ]
+
+
+def validate_regressor_names(factors):
+    """ตรวจสอบว่าชื่อปัจจัยไม่ใช่ reserved names"""
+    reserved_names = get_prophet_reserved_names()
+    invalid_names = [factor for factor in factors if factor in reserved_names]
+
+    if invalid_names:
+        return False, invalid_names
+    return True, []
+
+
+def _sheets_id(sheets_url):
+    if SHEETS_HOST not in sheets_url or "/d/" not in sheets_url:
+        raise ValueError("URL ไม่ถูกต้อง กรุณาใช้ URL ของ Google Sheets")
+    return sheets_url.split("/d/")[1].split("/")[0]
+
+
+def sheets_gid(sheets_url):
+    """gid ของแท็บที่เปิดอยู่ใน URL (เช่น ...#gid=123) ไม่มี = แท็บแรก (0)"""
+    match = re.search(r'[#?&]gid=(\d+)', sheets_url)
+    return match.group(1) if match else '0'
+
+
+def sheets_csv_url(sheets_url, gid=None):
+    """แปลง URL ของ Google Sheets เป็น URL สำหรับดาวน์โหลด CSV (gid=None = แท็บที่ระบุใน URL)"""
+    sheet_id = _sheets_id(sheets_url)
+    gid = sheets_gid(sheets_url) if gid is None else gid
+    return f"{SHEETS_EXPORT_BASE.rstrip('/')}/spreadsheets/d/{sheet_id}/export?format=csv&gid={gid}"
+
+
+def sheets_tabs_url(sheets_url):
+    """URL ของหน้า htmlview ซึ่งมีรายชื่อแท็บทั้งหมดของ workbook"""
+    return f"{SHEETS_EXPORT_BASE.rstrip('/')}/spreadsheets/d/{_sheets_id(sheets_url)}/htmlview"
+
+
+def list_sheet_tabs(sheets_url, fetcher=None):
+    """รายการแท็บ [(gid, ชื่อ), ...] ของ workbook (ว่าง = หารายการไม่ได้ ให้ใช้แท็บใน URL)"""
+    fetcher = SheetsFetcher() if fetcher is None else fetcher
+    return parse_sheet_tabs(fetcher.fetch(sheets_tabs_url(sheets_url)).content)
+
+
+def fetch_sheet_tabs(sheets_url, tabs, fetcher=None, max_workers=SHEETS_MAX_WORKERS):
+    """ดาวน์โหลดหลายแท็บพร้อมกัน tabs = [(gid, ชื่อ), ...]
+
+    คืนค่า ([(ชื่อ, FetchResult), ...] ตามลำดับของ tabs, dict ชื่อแท็บ → exception ของแท็บที่ดึงไม่สำเร็จ)
+    """
+    fetcher = SheetsFetcher() if fetcher is None else fetcher
+    urls = {gid: sheets_csv_url(sheets_url, gid) for gid, _ in tabs}
+    results, errors = fetcher.fetch_many(urls.values(), max_workers=max_workers)
+    fetched = [(name, results[urls[gid]]) for gid, name in tabs if urls[gid] in results]
+    failed = {name: errors[urls[gid]] for gid, name in tabs if urls[gid] in errors}
+    return fetched, failed
+
+
+def load_sheet_tabs(sheets_url, tab_names=None, fetcher=None, max_workers=SHEETS_MAX_WORKERS):
+    """อ่านหลายแท็บของ Google Sheets พร้อมกันแล้วรวมด้วย combine_sheet_tabs
+
+    tab_names: ชื่อหรือ gid ของแท็บที่ต้องการ (None = ทุกแท็บ)
+    คืนค่า (DataFrame, คอลัมน์ระบุอนุกรมหรือ None, ข้อความแจ้งเตือน)
+    """
+    fetcher = SheetsFetcher() if fetcher is None else fetcher
+    tabs = list_sheet_tabs(sheets_url, fetcher)
+    if not tabs:
+        raise ValueError("ไม่พบรายชื่อแท็บใน Google Sheets")
+    if tab_names is not None:
+        wanted = set(tab_names)
+        unknown = wanted - {name for _, name in tabs} - {gid for gid, _ in tabs}
+        if unknown:
+            raise ValueError(f"ไม่พบแท็บ: {', '.join(sorted(unknown))}")
+        tabs = [(gid, name) for gid, name in tabs if name in wanted or gid in wanted]
+    fetched, failed = fetch_sheet_tabs(sheets_url, tabs, fetcher, max_workers)
+    if failed:
+        raise ValueError("ดาวน์โหลดแท็บไม่สำเร็จ: " + ', '.join(f"{name} ({error})" for name, error in failed.items()))
+    df, series_col, notes = combine_sheet_tabs([(name, result.content) for name, result in fetched])
+    if len(df) == 0:
+        raise ValueError("ไม่พบข้อมูลที่ถูกต้อง")
+    return df, series_col, notes
+
+
+def load_source(source):
+    """อ่านข้อมูลดิบจากไฟล์ CSV หรือ URL ของ Google Sheets"""
+    if isinstance(source, str) and SHEETS_HOST in source:
+        return pd.read_csv(sheets_csv_url(source))
+    return pd.read_csv(source)
+
+
+def load_weekly_source(source):
+    """อ่านและทำความสะอาดข้อมูลรายสัปดาห์จากไฟล์ CSV หรือ URL ของ Google Sheets ทีละส่วน
+
+    ได้ผลเหมือน prepare_data(load_source(source)) แต่ประกาศชนิดข้อมูลล่วงหน้าและใช้หน่วยความจำน้อยกว่า
+    """
+    if isinstance(source, str) and SHEETS_HOST in source:
+        source = sheets_csv_url(source)
+    if isinstance(source, str) and source.startswith(('http://', 'https://')):
+        # Arrow CSV reader อ่าน URL ไม่ได้ - ดาวน์โหลดทั้งไฟล์ก่อน
+        source = io.BytesIO(SheetsFetcher().fetch(source).content)
+    df, series_col, notes = read_weekly_csv(source)
+    if len(df) == 0:
+        raise ValueError("ไม่พบข้อมูลที่ถูกต้อง")
+    return df, series_col, notes
+
+
+def load_daily_source(source, progress=None):
+    """อ่านข้อมูลรายวัน/รายเคสจากไฟล์ CSV หรือ URL ของ Google Sheets ทีละส่วนแล้วรวมเป็นรายสัปดาห์
+
+    คืนค่าแบบเดียวกับ prepare_data: (DataFrame, คอลัมน์ระบุอนุกรมหรือ None, ข้อความแจ้งเตือน)
+    """
+    if isinstance(source, str) and SHEETS_HOST in source:
+        source = sheets_csv_url(source)
+    return aggregate_daily_csv(source, progress=progress)
+
+
+def load_stored_source(source, store, daily=False, progress=None):
+    """เหมือน load_weekly_source/load_daily_source แต่เปิดจากคลังชุดข้อมูล (DatasetStore) ถ้าไฟล์เคยถูกอ่านแล้ว
+
+    ใช้คลังกับไฟล์ในเครื่องเท่านั้น (URL ต้องดาวน์โหลดก่อนจึงรู้ hash)
+    """
+    if store is None or not (isinstance(source, (str, os.PathLike)) and os.path.isfile(source)):
+        return load_daily_source(source, progress) if daily else load_weekly_source(source)
+
+    kind = 'daily' if daily else 'weekly'
+    key = dataset_key(hash_content(source), kind)
+    loaded = store.load(key)
+    if loaded is not None:
+        df, metadata = loaded
+        return df, metadata['series_col'], metadata['notes']
+    df, series_col, notes = load_daily_source(source, progress) if daily else load_weekly_source(source)
+    store.save(key, df, os.path.basename(source), series_col=series_col, notes=notes, kind=kind)
+    return df, series_col, notes
+
+
+def prepare_data(raw_df):
+    """ทำความสะอาดข้อมูลดิบ คืนค่า (DataFrame, คอลัมน์ระบุอนุกรมหรือ None, ข้อความแจ้งเตือน)"""
+    series_col = detect_series_column(raw_df)
+    df, notes = clean_raw_data(raw_df, series_col)
+    if len(df) == 0:
+        raise ValueError("ไม่พบข้อมูลที่ถูกต้อง")
+    return df, series_col, notes
+
+
+def check_data_quality(df):
+    """ตรวจสอบคุณภาพข้อมูล คืนรายการปัญหา (dict ที่มี type, severity, message, suggestion, details)"""
+    return describe_issues(find_quality_issues(df))
+
+
+def build_prophet_frame(df, factors):
+    """เตรียมข้อมูลในรูปแบบที่ Prophet ต้องการ (ds, y, ปัจจัยภายนอก, week_num)"""
+    prophet_df = pd.DataFrame({
+        'ds': df['end_date'],
+        'y': df['cases']
+    })
+
+    # เพิ่มปัจจัยภายนอก
+    for factor in factors:
+        prophet_df[factor] = df[factor]
+
+    prophet_df['week_num'] = df['week_num']
+    return prophet_df
+
+
+def default_future_factors(df, factors, method='mean'):
+    """ค่าปัจจัยภายนอกในอนาคต: 'mean' = ใช้ค่าเฉลี่ย, 'last' = ใช้ค่าล่าสุด"""
+    if method == 'last':
+        return {factor: df[factor].iloc[-1] for factor in factors}
+    return {factor: df[factor].mean() for factor in factors}
+
+
+def _future_factor_columns(factors, future_factors, weeks_to_forecast):
+    """ค่าปัจจัยในอนาคตรายสัปดาห์ (ค่าเดียวหรือลำดับค่า → array ยาว weeks_to_forecast)"""
+    return {
+        factor: factor_path(future_factors[factor], weeks_to_forecast)
+        for factor in factors if factor in future_factors
+    }
+
+
+def _future_frame(model, factors, future_factors, weeks_to_forecast):
+    """แถวอนาคตสำหรับ model.predict พร้อมค่าปัจจัยภายนอก"""
+    future = model.make_future_dataframe(periods=weeks_to_forecast, freq='W', include_history=False)
+    for factor, values in _future_factor_columns(factors, future_factors, weeks_to_forecast).items():
+        future[factor] = values
+    return future
+
+
+def forecast_future_weeks(model, df, factors, future_factors, weeks_to_forecast,
+                          interval_mode=None, interval_samples=None):
+    """พยากรณ์เฉพาะช่วงอนาคต แล้วจำกัดค่าให้สมเหตุสมผลและเติม week_num
+
+    future_factors: dict ปัจจัย → ค่าเดียว หรือลำดับค่ารายสัปดาห์ (ดู scenarios.factor_path)
+    interval_mode, interval_samples: วิธีคำนวณช่วงความเชื่อมั่น (ดู intervals.py, ค่าเริ่มต้นจาก INTERVAL_CONFIG)
+    """
+    future = _future_frame(model, factors, future_factors, weeks_to_forecast)
+    forecast_future = predict_with_intervals(model, future, interval_mode, interval_samples)
+    forecast_future = clip_forecast(forecast_future, df['cases'].mean())
+
+    # เพิ่ม week_num สำหรับการแสดงผล
+    last_week_num = df['week_num'].max()
+    forecast_future['week_num'] = range(last_week_num + 1, last_week_num + weeks_to_forecast + 1)
+    return forecast_future
+
+
+def forecast_scenarios(model, df, factors, scenarios, weeks_to_forecast,
+                       interval_mode=None, interval_samples=None, base_factors=None):
+    """พยากรณ์หลายสถานการณ์ในการคำนวณครั้งเดียว (ดู intervals.predict_scenarios)
+
+    scenarios: dict ชื่อ → dict ปัจจัย → ค่าเดียวหรือลำดับค่ารายสัปดาห์
+    base_factors: ค่าของปัจจัยที่สถานการณ์ไม่ได้กำหนด (ค่าเริ่มต้น = ค่าเฉลี่ยในอดีต)
+    คืนค่า dict ชื่อ → DataFrame แบบเดียวกับ forecast_future_weeks
+    """
+    if not scenarios:
+        return {}
+    base_factors = default_future_factors(df, factors) if base_factors is None else base_factors
+    future = model.make_future_dataframe(periods=weeks_to_forecast, freq='W', include_history=False)
+    scenario_columns = {
+        name: _future_factor_columns(factors, {**base_factors, **values}, weeks_to_forecast)
+        for name, values in scenarios.items()
+    }
+    stacked = predict_scenarios(model, future, scenario_columns, interval_mode, interval_samples)
+    # จำกัดค่าทั้งก้อนครั้งเดียว แล้วแยกเป็นรายสถานการณ์
+    stacked = clip_forecast(stacked, df['cases'].mean())
+    last_week_num = df['week_num'].max()
+    stacked['week_num'] = np.tile(np.arange(last_week_num + 1, last_week_num + weeks_to_forecast + 1), len(scenarios))
+    stacked = stacked.drop(columns=['scenario'])
+    return {
+        name: stacked.iloc[i * weeks_to_forecast:(i + 1) * weeks_to_forecast].reset_index(drop=True)
+        for i, name in enumerate(scenarios)
+    }
+
+
+def build_whatif_engine(model, df, factors, future_factors, weeks_to_forecast):
+    """WhatIfEngine ของช่วงอนาคต (ค่าฐาน = future_factors) จำกัดค่าแบบเดียวกับ forecast_future_weeks"""
+    future = _future_frame(model, factors, future_factors, weeks_to_forecast)
+    return WhatIfEngine(model, future, bounds=reasonable_bounds(df['cases'].mean()))
+
+
+def compute_metrics(actual_values, predicted_values):
+    """คำนวณ MAE, RMSE, MAPE (แบบปลอดภัย) และ R²"""
+    from sklearn.metrics import mean_absolute_error, mean_squared_error, r2_score
+
+    return {
+        'mae': mean_absolute_error(actual_values, predicted_values),
+        'rmse': np.sqrt(mean_squared_error(actual_values, predicted_values)),
+        'mape': calculate_safe_mape(actual_values, predicted_values),
+        'r2': r2_score(actual_values, predicted_values)
+    }
+
+
+def run_pipeline(df, factors=None, weeks_to_forecast=4, future_factors=None,
+                 config=MODEL_CONFIG, parallel=True, interval_mode=None, interval_samples=None):
+    """รันขั้นตอนทั้งหมดกับข้อมูลอนุกรมเดียวที่ทำความสะอาดแล้ว
+
+    factors=None ใช้ปัจจัยภายนอกทุกตัวที่มีในข้อมูล
+    interval_mode, interval_samples: วิธีคำนวณช่วงความเชื่อมั่น (ดู intervals.py)
+    คืนค่า dict: forecast, history_forecast, metrics, validation, quality_issues, factors
+    """
+    if factors is None:
+        factors = available_factors(df)
+    factors = list(factors)
+
+    is_valid, invalid_names = validate_regressor_names(factors)
+    if not is_valid:
+        raise ValueError(f"ชื่อปัจจัยต่อไปนี้เป็น reserved names ของ Prophet: {', '.join(invalid_names)}")
+
+    quality_issues = check_data_quality(df)
+    prophet_df = build_prophet_frame(df, factors)
+
+    model, val_mae, val_mape, has_validation = train_prophet_model_with_factors(
+        prophet_df, factors, config=config, parallel=parallel
+    )
+
+    if future_factors is None:
+        future_factors = default_future_factors(df, factors)
+    forecast_future = forecast_future_weeks(
+        model, df, factors, future_factors, weeks_to_forecast, interval_mode, interval_samples
+    )
+
+    history_forecast = predict_with_intervals(model, prophet_df.drop(columns=['y', 'week_num']), interval_mode)
+    metrics = compute_metrics(df['cases'].values, history_forecast['yhat'].values)
+
+    return {
+        'model': model,
+        'factors': factors,
+        'forecast': forecast_future,
+        'history_forecast': history_forecast,
+        'metrics': metrics,
+        'validation': {
+            'has_validation': has_validation,
+            'mae': val_mae,
+            'mape': val_mape
+        },
+        'quality_issues': quality_issues
+    }
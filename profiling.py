@@ -0,0 +1,157 @@
+"""วัดเวลาแต่ละขั้นตอนแบบเบา (wall time, CPU time, หน่วยความจำสูงสุด) สำหรับ sidebar และ log
+
+- StageProfiler.stage(name) ครอบขั้นตอนที่ต้องการวัด ซ้อนกันได้
+- profiled_call ใช้วัดงานใน worker process แล้วส่งผลกลับมาบันทึกด้วย StageProfiler.add
+- CPU time รวม process ลูกที่จบแล้ว (เช่น Stan ที่ Prophet เรียกผ่าน cmdstanpy)
+- หน่วยความจำสูงสุดวัดจาก tracemalloc (เฉพาะหน่วยความจำของ Python) และวัดเมื่อเปิด track_memory เท่านั้น
+  เพราะ tracemalloc ทำให้ทุกการจองหน่วยความจำช้าลง
+"""
+import json
+import logging
+import os
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+
+import pandas as pd
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+logger = logging.getLogger('flu_forecast.profiling')
+
+STAGE_COLUMNS = ['stage', 'wall_ms', 'cpu_ms', 'peak_mb', 'pid', 'depth']
+
+
+def cpu_seconds():
+    """CPU time ของ process นี้ + process ลูกที่จบแล้ว (วินาที)"""
+    total = time.process_time()
+    if resource is not None:
+        children = resource.getrusage(resource.RUSAGE_CHILDREN)
+        total += children.ru_utime + children.ru_stime
+    return total
+
+
+def profiled_call(func, *args, **kwargs):
+    """เรียก func แล้วคืนค่า (ผลลัพธ์, dict ของ wall_ms, cpu_ms, peak_mb, pid) ที่วัดใน process ปัจจุบัน
+
+    peak_mb เป็น None ถ้า tracemalloc ไม่ได้ทำงานอยู่
+    """
+    tracing = tracemalloc.is_tracing()
+    if tracing:
+        start_memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+    started_wall = time.perf_counter()
+    started_cpu = cpu_seconds()
+    result = func(*args, **kwargs)
+    stats = {
+        'wall_ms': (time.perf_counter() - started_wall) * 1000,
+        'cpu_ms': (cpu_seconds() - started_cpu) * 1000,
+        'peak_mb': (tracemalloc.get_traced_memory()[1] - start_memory) / 2 ** 20 if tracing else None,
+        'pid': os.getpid(),
+    }
+    return result, stats
+
+
+def optional_stage(profiler, name, **fields):
+    """profiler.stage(name) ถ้ามี profiler ไม่เช่นนั้นไม่วัดอะไร"""
+    if profiler is None:
+        return nullcontext()
+    return profiler.stage(name, **fields)
+
+
+class StageProfiler:
+    """บันทึกเวลาของแต่ละขั้นตอนในหนึ่งรอบการทำงาน (เช่น หนึ่งการ rerun ของ Streamlit)
+
+    track_memory=True จะเริ่ม tracemalloc (ถ้ายังไม่ได้เริ่ม) เพื่อวัดหน่วยความจำสูงสุดต่อขั้นตอน
+    """
+
+    def __init__(self, track_memory=False):
+        self.records = []
+        self.track_memory = track_memory
+        self._stack = []
+        self._order = 0
+        self._started = time.perf_counter()
+        if track_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    @contextmanager
+    def stage(self, name, **fields):
+        """วัดขั้นตอน name (fields เพิ่มเติม เช่น rows ถูกเก็บไว้ในบันทึกด้วย)"""
+        frame = {'peak': None}
+        if self.track_memory and tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            if self._stack and self._stack[-1]['peak'] is not None:
+                # เก็บ peak ของขั้นตอนแม่ไว้ก่อน reset เพื่อวัดขั้นตอนย่อยแยก
+                self._stack[-1]['peak'] = max(self._stack[-1]['peak'], peak)
+            tracemalloc.reset_peak()
+            frame = {'start': current, 'peak': current}
+        depth = len(self._stack)
+        order = self._next_order()
+        self._stack.append(frame)
+        started_wall = time.perf_counter()
+        started_cpu = cpu_seconds()
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - started_wall
+            cpu = cpu_seconds() - started_cpu
+            self._stack.pop()
+            peak_mb = None
+            if frame['peak'] is not None:
+                frame['peak'] = max(frame['peak'], tracemalloc.get_traced_memory()[1])
+                peak_mb = (frame['peak'] - frame['start']) / 2 ** 20
+                if self._stack and self._stack[-1]['peak'] is not None:
+                    self._stack[-1]['peak'] = max(self._stack[-1]['peak'], frame['peak'])
+            self._record(order, name, wall * 1000, cpu * 1000, peak_mb, os.getpid(), depth, fields)
+
+    def add(self, name, wall_ms, cpu_ms, peak_mb=None, pid=None, **fields):
+        """บันทึกผลที่วัดจากที่อื่น (เช่น profiled_call ใน worker process) เป็นขั้นตอนย่อยของขั้นตอนปัจจุบัน"""
+        self._record(self._next_order(), name, wall_ms, cpu_ms, peak_mb, pid, len(self._stack), fields)
+
+    def _next_order(self):
+        self._order += 1
+        return self._order
+
+    def _record(self, order, name, wall_ms, cpu_ms, peak_mb, pid, depth, fields):
+        record = {
+            'order': order,
+            'stage': name,
+            'wall_ms': wall_ms,
+            'cpu_ms': cpu_ms,
+            'peak_mb': peak_mb,
+            'pid': pid,
+            'depth': depth,
+        }
+        record.update(fields)
+        self.records.append(record)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("stage %s", json.dumps(record, ensure_ascii=False, default=str))
+
+    def elapsed_ms(self):
+        """เวลาตั้งแต่สร้าง profiler (ms)"""
+        return (time.perf_counter() - self._started) * 1000
+
+    def table(self):
+        """ตารางผล เรียงตามลำดับที่ขั้นตอนเริ่ม (ขั้นตอนย่อยบันทึกก่อนขั้นตอนแม่ จึงจัดลำดับใหม่)"""
+        if not self.records:
+            return pd.DataFrame(columns=STAGE_COLUMNS)
+        table = pd.DataFrame(self.records).sort_values('order', ignore_index=True)
+        extra = [col for col in table.columns if col not in STAGE_COLUMNS and col != 'order']
+        return table[STAGE_COLUMNS + extra]
+
+    def to_json_lines(self, **context):
+        """แปลงผลเป็น JSON Lines (หนึ่งบรรทัดต่อขั้นตอน) พร้อมข้อมูลประกอบ เช่น session หรือแหล่งข้อมูล"""
+        return '\n'.join(
+            json.dumps({**context, **record}, ensure_ascii=False, default=str)
+            for record in sorted(self.records, key=lambda record: record['order'])
+        )
+
+    def log_summary(self, level=logging.INFO, **context):
+        """เขียนผลทุกขั้นตอนลง logger แบบ structured (JSON หนึ่งบรรทัดต่อขั้นตอน)"""
+        if not logger.isEnabledFor(level):
+            return
+        for line in self.to_json_lines(**context).splitlines():
+            logger.log(level, line)
@@ -0,0 +1,192 @@
+"""ตรวจสอบคุณภาพข้อมูลแบบ vectorized (ไม่ขึ้นกับ UI)
+
+find_quality_issues คืนตารางปัญหาแบบกะทัดรัด หนึ่งแถวต่อหนึ่งจุดที่พบ
+รองรับข้อมูล long format หลายอนุกรม (คำนวณแยกตามอนุกรมด้วย groupby ทีเดียว)
+describe_issues แปลงตารางของอนุกรมเดียวเป็นรายการข้อความสำหรับแสดงผล
+"""
+import numpy as np
+import pandas as pd
+
+# จำนวนสัปดาห์ขั้นต่ำที่แนะนำ
+MIN_WEEKS = 8
+
+QUALITY_ISSUE_COLUMNS = [
+    'series', 'type', 'severity', 'week_num', 'end_date', 'cases', 'value', 'lower', 'upper'
+]
+
+# ลำดับการแสดงผลของปัญหาแต่ละประเภท
+ISSUE_TYPES = ['insufficient_data', 'outliers', 'zero_negative', 'missing_weeks', 'sudden_jumps']
+
+ISSUE_SEVERITY = {
+    'insufficient_data': 'warning',
+    'outliers': 'warning',
+    'zero_negative': 'error',
+    'missing_weeks': 'warning',
+    'sudden_jumps': 'info',
+}
+
+
+def _issue_rows(issue_type, series, rows, value=np.nan, lower=np.nan, upper=np.nan):
+    """สร้างแถวของตารางปัญหาจากแถวข้อมูลที่ถูกเลือก"""
+    return pd.DataFrame({
+        'series': series,
+        'type': issue_type,
+        'severity': ISSUE_SEVERITY[issue_type],
+        'week_num': rows['week_num'].values,
+        'end_date': rows['end_date'].values,
+        'cases': rows['cases'].values,
+        'value': value,
+        'lower': lower,
+        'upper': upper,
+    })
+
+
+def find_quality_issues(df, series_col=None):
+    """ตรวจสอบจำนวนข้อมูล, ค่าผิดปกติ (IQR), ค่าศูนย์/ติดลบ, ช่องว่างของสัปดาห์ และการกระโดดของข้อมูล
+
+    df ต้องเรียงตามวันที่ภายในแต่ละอนุกรมแล้ว (เช่น ผลจาก clean_raw_data)
+    คืนค่า DataFrame คอลัมน์ QUALITY_ISSUE_COLUMNS
+    - value: จำนวนสัปดาห์ (insufficient_data), จำนวนสัปดาห์ที่ขาด (missing_weeks),
+      ขนาดการเปลี่ยนแปลง (sudden_jumps)
+    - lower/upper: ขอบเขตปกติของ IQR (outliers) หรือเกณฑ์การกระโดด (sudden_jumps)
+    """
+    # แปลงคีย์อนุกรมเป็นรหัสจำนวนเต็มครั้งเดียว แล้วใช้ groupby ด้วยรหัสนี้ทุกขั้นตอน
+    if series_col is None:
+        codes = np.zeros(len(df), dtype=np.intp)
+    else:
+        codes = pd.factorize(df[series_col])[0]
+    grouped = df.groupby(codes, sort=False)
+    cases = df['cases']
+    parts = []
+
+    def series_of(rows):
+        return rows[series_col].values if series_col is not None else None
+
+    # 1. ตรวจสอบจำนวนข้อมูล
+    sizes = grouped['cases'].transform('size')
+    first_rows = df[~pd.Series(codes, index=df.index).duplicated() & (sizes < MIN_WEEKS)]
+    if len(first_rows) > 0:
+        # ปัญหาระดับอนุกรม ไม่ผูกกับสัปดาห์ใด
+        no_rows = pd.DataFrame({
+            'week_num': np.full(len(first_rows), np.nan),
+            'end_date': pd.NaT,
+            'cases': np.nan,
+        })
+        parts.append(_issue_rows('insufficient_data', series_of(first_rows), no_rows,
+                                 value=sizes[first_rows.index].values))
+
+    # 2. ตรวจสอบค่าผิดปกติ (Outliers) ด้วย IQR ของแต่ละอนุกรม
+    q1 = grouped['cases'].transform('quantile', 0.25)
+    q3 = grouped['cases'].transform('quantile', 0.75)
+    iqr = q3 - q1
+    lower_bound = q1 - 1.5 * iqr
+    upper_bound = q3 + 1.5 * iqr
+    outlier_mask = (cases < lower_bound) | (cases > upper_bound)
+    if outlier_mask.any():
+        rows = df[outlier_mask]
+        parts.append(_issue_rows('outliers', series_of(rows), rows,
+                                 lower=lower_bound[outlier_mask].values,
+                                 upper=upper_bound[outlier_mask].values))
+
+    # 3. ตรวจสอบค่าศูนย์หรือติดลบ
+    zero_mask = cases <= 0
+    if zero_mask.any():
+        rows = df[zero_mask]
+        parts.append(_issue_rows('zero_negative', series_of(rows), rows))
+
+    # 4. ตรวจสอบช่องว่างในลำดับสัปดาห์ (เทียบกับแถวก่อนหน้าในอนุกรมเดียวกัน)
+    week_step = grouped['week_num'].diff()
+    gap_mask = week_step > 1
+    if gap_mask.any():
+        rows = df[gap_mask]
+        parts.append(_issue_rows('missing_weeks', series_of(rows), rows,
+                                 value=(week_step[gap_mask] - 1).values))
+
+    # 5. ตรวจสอบการกระโดดของข้อมูล (Sudden jumps) เรียงตาม week_num ภายในอนุกรม
+    order = np.lexsort((df['week_num'].values, codes))
+    by_week = df.iloc[order]
+    by_week_codes = codes[order]
+    jump = by_week['cases'].groupby(by_week_codes, sort=False).diff().abs()
+    jump_grouped = jump.groupby(by_week_codes, sort=False)
+    threshold = jump_grouped.transform('mean') + 2 * jump_grouped.transform('std')
+    jump_mask = jump > threshold
+    if jump_mask.any():
+        rows = by_week[jump_mask.values]
+        parts.append(_issue_rows('sudden_jumps', series_of(rows), rows,
+                                 value=jump[jump_mask].values, upper=threshold[jump_mask].values))
+
+    if not parts:
+        return pd.DataFrame(columns=QUALITY_ISSUE_COLUMNS)
+    issues = pd.concat(parts, ignore_index=True)
+    if pd.api.types.is_integer_dtype(df['week_num']):
+        # คงชนิดจำนวนเต็มไว้ (แถว insufficient_data ไม่มีสัปดาห์)
+        issues['week_num'] = issues['week_num'].astype('Int64')
+    if series_col is not None:
+        # เรียงตามอนุกรมโดยคงลำดับประเภทปัญหาไว้
+        issues = issues.sort_values('series', kind='stable', ignore_index=True)
+    return issues[QUALITY_ISSUE_COLUMNS]
+
+
+def summarize_issues(issues):
+    """นับจำนวนปัญหาแต่ละประเภทต่ออนุกรม (หนึ่งแถวต่ออนุกรม)"""
+    if len(issues) == 0:
+        return pd.DataFrame(columns=['series'] + ISSUE_TYPES)
+    counts = pd.crosstab(issues['series'], issues['type'])
+    return counts.reindex(columns=ISSUE_TYPES, fill_value=0).reset_index()
+
+
+def describe_issues(issues):
+    """แปลงตารางปัญหาของอนุกรมเดียวเป็นรายการ dict (type, severity, message, suggestion, details)"""
+    described = []
+    for issue_type in ISSUE_TYPES:
+        rows = issues[issues['type'] == issue_type]
+        if len(rows) == 0:
+            continue
+        severity = ISSUE_SEVERITY[issue_type]
+        details = rows[['week_num', 'end_date', 'cases']].reset_index(drop=True)
+
+        if issue_type == 'insufficient_data':
+            n_weeks = int(rows['value'].iloc[0])
+            described.append({
+                'type': issue_type,
+                'severity': severity,
+                'message': f"ข้อมูลมีเพียง {n_weeks} สัปดาห์ (ควรมีอย่างน้อย {MIN_WEEKS} สัปดาห์)",
+                'suggestion': "เพิ่มข้อมูลย้อนหลังให้มากขึ้นเพื่อเพิ่มความแม่นยำ"
+            })
+        elif issue_type == 'outliers':
+            described.append({
+                'type': issue_type,
+                'severity': severity,
+                'message': f"พบค่าผิดปกติ {len(rows)} จุด",
+                'details': details,
+                'bounds': (rows['lower'].iloc[0], rows['upper'].iloc[0]),
+                'suggestion': f"ตรวจสอบข้อมูลในสัปดาห์ที่ {', '.join(map(str, rows['week_num'].values))} - อาจเป็นช่วงระบาดหรือข้อมูลผิดพลาด"
+            })
+        elif issue_type == 'zero_negative':
+            described.append({
+                'type': issue_type,
+                'severity': severity,
+                'message': f"พบค่าศูนย์หรือติดลบ {len(rows)} จุด",
+                'details': details,
+                'suggestion': "แก้ไขให้เป็นค่าบวก หรือใช้ค่าเฉลี่ยของสัปดาห์ข้างเคียง"
+            })
+        elif issue_type == 'missing_weeks':
+            week_after = rows['week_num'].values
+            week_before = week_after - rows['value'].values - 1
+            described.append({
+                'type': issue_type,
+                'severity': severity,
+                'message': f"พบช่องว่างในลำดับสัปดาห์ {len(rows)} จุด",
+                'details': list(zip(week_before.astype(int).tolist(), week_after.astype(int).tolist())),
+                'suggestion': "เพิ่มข้อมูลในสัปดาห์ที่ขาดหายไป หรือปรับ week_num ให้ต่อเนื่องกัน"
+            })
+        elif issue_type == 'sudden_jumps':
+            details['cases_diff'] = rows['value'].values
+            described.append({
+                'type': issue_type,
+                'severity': severity,
+                'message': f"พบการเปลี่ยนแปลงกะทันหัน {len(rows)} จุด",
+                'details': details,
+                'suggestion': "ตรวจสอบว่าเป็นเหตุการณ์จริง (เช่น การระบาด) หรือข้อผิดพลาดในการบันทึก"
+            })
+    return described
@@ -0,0 +1,130 @@
+"""ค่าปัจจัยภายนอกในอนาคตแบบรายสัปดาห์ (factor path) และสถานการณ์สมมติ (scenario)
+
+- ค่าของปัจจัยหนึ่งตัวเป็นได้ทั้งค่าเดียว (ใช้ทุกสัปดาห์) หรือลำดับค่ารายสัปดาห์
+- path สร้างได้จาก: ค่าเฉลี่ย/ค่าล่าสุด, ค่าตามฤดูกาล (เฉลี่ยสัปดาห์เดียวกันของปีในอดีต),
+  การเปลี่ยนค่าตั้งแต่สัปดาห์ที่กำหนด, การไล่ระดับ หรือไฟล์ CSV
+- สถานการณ์คือ dict ชื่อ → dict ปัจจัย → ค่า ใช้กับ pipeline.forecast_scenarios
+"""
+import numpy as np
+import pandas as pd
+
+from ingest import parse_dates
+
+# คอลัมน์ของไฟล์สถานการณ์ (CSV): scenario (ไม่บังคับ), week (1 = สัปดาห์แรกที่พยากรณ์) หรือ end_date, ปัจจัย
+SCENARIO_NAME_COLUMN = 'scenario'
+SCENARIO_WEEK_COLUMN = 'week'
+DEFAULT_SCENARIO_NAME = 'สถานการณ์หลัก'
+
+
+def factor_path(value, weeks):
+    """แปลงค่าปัจจัยเป็น array รายสัปดาห์ยาว weeks
+
+    ค่าเดียวใช้ทุกสัปดาห์ ลำดับที่สั้นกว่าใช้ค่าสุดท้ายต่อ ลำดับที่ยาวกว่าถูกตัด
+    """
+    values = np.asarray(value, dtype=float)
+    if values.ndim == 0:
+        return np.full(weeks, float(values))
+    values = values.ravel()
+    if len(values) == 0:
+        raise ValueError("ลำดับค่าปัจจัยต้องมีอย่างน้อยหนึ่งค่า")
+    if len(values) >= weeks:
+        return values[:weeks].copy()
+    return np.concatenate((values, np.full(weeks - len(values), values[-1])))
+
+
+def climatology_path(df, factor, future_dates):
+    """ค่าเฉลี่ยของปัจจัยในสัปดาห์เดียวกันของปี (ISO week) จากข้อมูลในอดีต
+
+    สัปดาห์ที่ไม่มีในอดีตใช้ค่าเฉลี่ยของสัปดาห์ใกล้เคียง (±1) และถ้ายังไม่มีใช้ค่าเฉลี่ยรวม
+    """
+    history_weeks = pd.DatetimeIndex(df['end_date']).isocalendar().week.to_numpy(dtype=np.int64)
+    weekly_mean = pd.Series(df[factor].to_numpy(dtype=float)).groupby(history_weeks).mean()
+    target_weeks = pd.DatetimeIndex(future_dates).isocalendar().week.to_numpy(dtype=np.int64)
+    overall = float(df[factor].mean())
+    path = []
+    for week in target_weeks:
+        if week in weekly_mean.index:
+            path.append(weekly_mean[week])
+            continue
+        neighbours = [weekly_mean[w] for w in ((week - 2) % 53 + 1, week % 53 + 1) if w in weekly_mean.index]
+        path.append(float(np.mean(neighbours)) if neighbours else overall)
+    return np.asarray(path, dtype=float)
+
+
+def step_path(before, after, start_week, weeks):
+    """ค่า before จนถึงสัปดาห์ก่อน start_week แล้วเป็น after ตั้งแต่สัปดาห์ที่ start_week (นับจาก 1)"""
+    path = np.full(weeks, float(before))
+    path[max(int(start_week) - 1, 0):] = float(after)
+    return path
+
+
+def ramp_path(start, end, weeks):
+    """ไล่ระดับเชิงเส้นจาก start (สัปดาห์แรก) ถึง end (สัปดาห์สุดท้าย)"""
+    return np.linspace(float(start), float(end), weeks)
+
+
+def read_scenario_csv(source, factors, future_dates):
+    """อ่านสถานการณ์จาก CSV คืนค่า (dict ชื่อ → dict ปัจจัย → array, ข้อความแจ้งเตือน)
+
+    แต่ละแถวคือหนึ่งสัปดาห์ของหนึ่งสถานการณ์ ระบุสัปดาห์ด้วย week (1, 2, ...) หรือ end_date (dd/mm/yyyy)
+    ไม่มีคอลัมน์ scenario = สถานการณ์เดียวชื่อ DEFAULT_SCENARIO_NAME
+    ปัจจัยที่ไม่มีในไฟล์หรือสัปดาห์ที่ขาดใช้ค่าของสัปดาห์ก่อนหน้า (ไม่มีเลย = ไม่กำหนด ใช้ค่าของสถานการณ์หลัก)
+    """
+    raw = pd.read_csv(source, dtype={SCENARIO_NAME_COLUMN: str, 'end_date': str})
+    weeks = len(future_dates)
+    notes = []
+    if SCENARIO_WEEK_COLUMN in raw.columns:
+        week_index = pd.to_numeric(raw[SCENARIO_WEEK_COLUMN], errors='coerce') - 1
+    elif 'end_date' in raw.columns:
+        positions = pd.Series(np.arange(weeks), index=pd.DatetimeIndex(future_dates).normalize())
+        week_index = parse_dates(raw['end_date']).map(positions)
+    else:
+        raise ValueError(f"ไฟล์สถานการณ์ต้องมีคอลัมน์ '{SCENARIO_WEEK_COLUMN}' หรือ 'end_date'")
+    factor_columns = [factor for factor in factors if factor in raw.columns]
+    if not factor_columns:
+        raise ValueError(f"ไฟล์สถานการณ์ไม่มีคอลัมน์ปัจจัยที่ใช้ในโมเดล ({', '.join(factors)})")
+
+    names = raw[SCENARIO_NAME_COLUMN].fillna(DEFAULT_SCENARIO_NAME) if SCENARIO_NAME_COLUMN in raw.columns \
+        else pd.Series(DEFAULT_SCENARIO_NAME, index=raw.index)
+    valid = week_index.notna() & (week_index >= 0) & (week_index < weeks)
+    if (~valid).any():
+        notes.append(f"ℹ️ ข้าม {int((~valid).sum())} แถวที่อยู่นอกช่วงพยากรณ์ {weeks} สัปดาห์")
+
+    scenarios = {}
+    for name in dict.fromkeys(names[valid]):
+        rows = raw[valid & (names == name)]
+        positions = week_index[rows.index].astype(int)
+        values = {}
+        for factor in factor_columns:
+            column = pd.Series(np.nan, index=range(weeks))
+            column[positions.to_numpy()] = pd.to_numeric(rows[factor], errors='coerce').to_numpy()
+            column = column.ffill()
+            if column.notna().all():
+                values[factor] = column.to_numpy()
+            elif column.notna().any():
+                # สัปดาห์ต้นๆ ที่ไม่ได้ระบุใช้ค่าแรกที่ระบุ
+                values[factor] = column.bfill().to_numpy()
+        scenarios[str(name)] = values
+    return scenarios, notes
+
+
+def scenario_summary(forecasts, reference=None):
+    """ตารางสรุปแต่ละสถานการณ์: ผู้ป่วยรวม, สัปดาห์สูงสุด และความต่างจากสถานการณ์อ้างอิง (ค่าเริ่มต้น = สถานการณ์แรก)"""
+    if not forecasts:
+        return pd.DataFrame()
+    reference = next(iter(forecasts)) if reference is None else reference
+    reference_total = forecasts[reference]['yhat_adjusted'].sum()
+    rows = []
+    for name, forecast in forecasts.items():
+        total = forecast['yhat_adjusted'].sum()
+        peak = forecast['yhat_adjusted'].idxmax()
+        rows.append({
+            'สถานการณ์': name,
+            'ผู้ป่วยรวม (ราย)': int(round(total)),
+            'ต่างจากสถานการณ์หลัก': f"{(total - reference_total) / reference_total * 100:+.1f}%"
+            if reference_total else '-',
+            'สัปดาห์ที่สูงสุด': int(forecast['week_num'].iloc[peak]),
+            'ค่าสูงสุด (ราย)': int(round(forecast['yhat_adjusted'].iloc[peak])),
+            'ช่วงสูงสุด (95% CI)': int(round(forecast['yhat_upper_adjusted'].max())),
+        })
+    return pd.DataFrame(rows)
@@ -0,0 +1,176 @@
+"""เลือกปัจจัยภายนอกอัตโนมัติแบบ stepwise ตามความผิดพลาดของ backtest
+
+- forward: เริ่มจากไม่มีปัจจัย แต่ละขั้นลองเพิ่มปัจจัยที่เหลือทีละตัว แล้วเพิ่มตัวที่ MAE ต่ำสุด
+  หยุดเมื่อ MAE ลดลงน้อยกว่า min_improvement (สัดส่วน) หรือเพิ่มครบทุกตัว
+- backward: เริ่มจากทุกปัจจัย แต่ละขั้นลองตัดทีละตัว ตัดต่อเมื่อ MAE ไม่แย่ลง
+  (ปัจจัยที่ไม่ช่วยถูกตัดออก โมเดลจึงเทรนเร็วขึ้นและ overfit น้อยลง)
+- ทุกชุดปัจจัยในขั้นเดียวกัน × ทุกจุดตัด ถูกเทรนพร้อมกันใน process pool
+- ผลของแต่ละ (ชุดปัจจัย, จุดตัด) ถูกจำไว้ตาม hash ของข้อมูลเฉพาะคอลัมน์ที่ใช้
+  ชุดที่เคยลองแล้ว (อีกทิศทาง, ปัจจัยตั้งต้นต่างกัน หรือ session ก่อน) จึงไม่ถูกเทรนซ้ำ
+- ชุดที่มีทุกปัจจัยถูกประเมินเสมอ เพื่อรายงานความแม่นยำและเวลาเทรนเทียบกับการใช้ทุกปัจจัย
+"""
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from backtest import backtest_cutoff, recent_cutoffs, run_windows
+from forecast_model import MODEL_CONFIG
+from model_cache import ModelCache, make_cache_key
+from profiling import profiled_call
+
+SELECTION_DIRECTIONS = ['forward', 'backward']
+
+SELECTION_CONFIG = {
+    'horizon': 4,
+    'max_cutoffs': 4,
+    'min_improvement': 0.01,  # forward: หยุดเมื่อ MAE ลดลงน้อยกว่า 1%
+}
+
+# จำนวนผล (ชุดปัจจัย, จุดตัด) ที่จำไว้ และโฟลเดอร์ย่อยในโฟลเดอร์แคช (แยกจากไฟล์โมเดลเพื่อไม่ให้ลบกันเอง)
+SUBSET_CACHE_MAX_ENTRIES = 4096
+SUBSET_CACHE_SUBDIR = 'selection'
+
+
+def subset_cache(cache_dir=None):
+    """ModelCache สำหรับผลของแต่ละ (ชุดปัจจัย, จุดตัด) เก็บลง cache_dir/selection ถ้าระบุ"""
+    return ModelCache(
+        max_entries=SUBSET_CACHE_MAX_ENTRIES,
+        disk_dir=os.path.join(cache_dir, SUBSET_CACHE_SUBDIR) if cache_dir else None,
+        max_disk_entries=SUBSET_CACHE_MAX_ENTRIES
+    )
+
+
+_subset_cache = subset_cache()
+
+
+def _score_window(data, factors, cutoff, horizon, config):
+    """(ค่าความผิดพลาดสัมบูรณ์, เวลาเทรน+พยากรณ์ ms) ของหนึ่งจุดตัด (None = เทรนไม่สำเร็จ)"""
+    try:
+        window, stats = profiled_call(backtest_cutoff, data, factors, cutoff, horizon, config)
+    except Exception:
+        return None, None
+    errors = np.abs(window['y'].to_numpy(dtype=float) - window['yhat'].to_numpy(dtype=float))
+    return errors, stats['wall_ms']
+
+
+def _window_key(data, subset, cutoff, horizon, config):
+    # ใช้เฉพาะคอลัมน์ของชุดนี้ ผลจึงใช้ซ้ำได้แม้ข้อมูลมีปัจจัยอื่นเพิ่มหรือเปลี่ยน
+    window = data[['ds', 'y'] + list(subset)].iloc[:cutoff + horizon]
+    return make_cache_key(window, subset, {
+        'kind': 'selection_window', 'config': config, 'cutoff': cutoff, 'horizon': horizon
+    })
+
+
+def select_factors(data, factors, direction='forward', config=MODEL_CONFIG, selection=None,
+                   parallel=True, cache=None, progress=None):
+    """เลือกชุดปัจจัยจาก factors สำหรับข้อมูล data (DataFrame แบบ build_prophet_frame ที่มีทุกปัจจัย)
+
+    selection: ค่าที่ไม่ระบุใช้จาก SELECTION_CONFIG
+    cache: ModelCache สำหรับผลของแต่ละ (ชุดปัจจัย, จุดตัด) (ค่าเริ่มต้น = แคชร่วมของ process)
+    progress(done, total): callback หลังเทรนแต่ละงานในขั้นปัจจุบัน
+
+    คืนค่า dict: factors (ที่เลือก เรียงตาม factors), mae, all_factors_mae, direction, steps (DataFrame),
+    n_cutoffs, n_fits, n_cached_fits, n_fits_exhaustive, fit_seconds ({'all', 'selected'} ต่อจุดตัด), seconds
+    """
+    if direction not in SELECTION_DIRECTIONS:
+        raise ValueError(f"ไม่รู้จักทิศทางการเลือกปัจจัย: {direction}")
+    factors = list(factors)
+    selection = {**SELECTION_CONFIG, **(selection or {})}
+    horizon = selection['horizon']
+    cutoffs = recent_cutoffs(len(data), horizon, selection['max_cutoffs'])
+    if not cutoffs:
+        raise ValueError("ข้อมูลไม่พอสำหรับการเลือกปัจจัย")
+    cache = _subset_cache if cache is None else cache
+    started = time.perf_counter()
+    windows = {}
+    counts = {'fits': 0, 'cached': 0}
+
+    def canonical(subset):
+        return tuple(factor for factor in factors if factor in subset)
+
+    def evaluate(subsets):
+        """MAE ของแต่ละชุด (inf ถ้ามีจุดตัดที่เทรนไม่สำเร็จ)"""
+        keys = {}
+        for subset in subsets:
+            for cutoff in cutoffs:
+                if (subset, cutoff) in windows:
+                    continue
+                key = _window_key(data, subset, cutoff, horizon, config)
+                cached = cache.get(key)
+                if cached is not None:
+                    windows[(subset, cutoff)] = cached
+                    counts['cached'] += 1
+                else:
+                    keys[(subset, cutoff)] = key
+        jobs = list(keys)
+        outcomes = run_windows(
+            data, [(list(subset), cutoff, config) for subset, cutoff in jobs], horizon, parallel,
+            progress, task=_score_window
+        )
+        for job, outcome in zip(jobs, outcomes):
+            windows[job] = outcome
+            counts['fits'] += 1
+            if outcome[0] is not None:
+                cache.put(keys[job], outcome)
+        scores = {}
+        for subset in subsets:
+            errors = [windows[(subset, cutoff)][0] for cutoff in cutoffs]
+            scores[subset] = np.inf if any(e is None for e in errors) else float(np.mean(np.concatenate(errors)))
+        return scores
+
+    full = tuple(factors)
+    current = () if direction == 'forward' else full
+    scores = evaluate(list(dict.fromkeys([current, full])))
+    all_factors_mae = scores[full]
+    current_mae = scores[current]
+    steps = [{'step': 0, 'action': 'เริ่มต้น', 'factor': None, 'factors': ', '.join(current),
+              'mae': current_mae, 'chosen': True}]
+
+    step = 0
+    while True:
+        step += 1
+        if direction == 'forward':
+            candidates = {factor: canonical(current + (factor,)) for factor in factors if factor not in current}
+        else:
+            candidates = {factor: tuple(f for f in current if f != factor) for factor in current}
+        if not candidates:
+            break
+        scores = evaluate(list(candidates.values()))
+        best = min(candidates, key=lambda factor: scores[candidates[factor]])
+        best_mae = scores[candidates[best]]
+        if direction == 'forward':
+            accepted = best_mae < current_mae * (1 - selection['min_improvement'])
+        else:
+            accepted = best_mae <= current_mae
+        for factor, subset in candidates.items():
+            steps.append({
+                'step': step,
+                'action': 'เพิ่ม' if direction == 'forward' else 'ตัด',
+                'factor': factor,
+                'factors': ', '.join(subset),
+                'mae': scores[subset],
+                'chosen': accepted and factor == best,
+            })
+        if not accepted:
+            break
+        current, current_mae = candidates[best], best_mae
+
+    def fit_seconds(subset):
+        times = [windows[(subset, cutoff)][1] for cutoff in cutoffs]
+        return None if any(t is None for t in times) else float(np.median(times)) / 1000
+
+    return {
+        'factors': list(current),
+        'mae': current_mae,
+        'all_factors_mae': all_factors_mae,
+        'direction': direction,
+        'steps': pd.DataFrame(steps),
+        'n_cutoffs': len(cutoffs),
+        'n_fits': counts['fits'],
+        'n_cached_fits': counts['cached'],
+        'n_fits_exhaustive': 2 ** len(factors) * len(cutoffs),
+        'fit_seconds': {'all': fit_seconds(full), 'selected': fit_seconds(current)},
+        'seconds': time.perf_counter() - started,
+    }
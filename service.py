@@ -0,0 +1,374 @@
+"""บริการ HTTP สำหรับขอผลพยากรณ์จากระบบอื่น (รันในเครื่อง)
+
+โมเดลที่เทรนแล้วถูกเก็บไว้ในหน่วยความจำ (ModelCache) ตาม hash ของข้อมูล + ปัจจัย + การตั้งค่า
+เมื่อส่งชุดข้อมูลใหม่เข้ามา การเทรนจะถูกจัดคิวแบบ async แล้วตอบกลับทันที
+คำขอ /forecast ใช้เพียง model.predict กับโมเดลที่อุ่นไว้แล้ว
+
+Endpoints (JSON ทั้งหมด):
+    GET  /health                 สถานะบริการและจำนวนโมเดลที่พร้อมใช้
+    POST /datasets               {"csv": "..."} หรือ {"records": [...]}, "factors": [...] (ไม่บังคับ)
+                                 → 202 {"dataset_id", "status": "fitting"} หรือ 200 ถ้าพร้อมแล้ว
+    GET  /datasets/<dataset_id>  สถานะการเทรน (fitting / ready / failed) และค่า validation
+    POST /forecast               {"dataset_id", "weeks", "future_factors": {factor: ค่า หรือ [ค่ารายสัปดาห์]}}
+
+ตัวอย่าง:
+    python service.py --port 8765 --preload data.csv
+"""
+import argparse
+import io
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pandas as pd
+
+from forecast_model import MODEL_CONFIG, train_prophet_model_with_factors
+from ingest import available_factors
+from model_cache import ModelCache, dump_training_result, load_training_result, make_cache_key
+from pipeline import (
+    build_prophet_frame, default_future_factors, forecast_future_weeks, prepare_data,
+    validate_regressor_names
+)
+
+logger = logging.getLogger('flu_forecast.service')
+
+MAX_FORECAST_WEEKS = 52
+FORECAST_RESPONSE_COLUMNS = [
+    'week_num', 'ds', 'yhat', 'yhat_lower', 'yhat_upper',
+    'yhat_adjusted', 'yhat_lower_adjusted', 'yhat_upper_adjusted'
+]
+
+
+class ServiceError(Exception):
+    """ข้อผิดพลาดที่ตอบกลับไปยัง client พร้อม HTTP status"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+class ForecastService:
+    """เก็บชุดข้อมูลและโมเดลที่อุ่นไว้ พร้อมจัดคิวการเทรนแบบ async
+
+    - max_models: จำนวนโมเดลสูงสุดในหน่วยความจำ
+    - cache_dir: โฟลเดอร์แคชโมเดลบนดิสก์ (ใช้ร่วมกับแอป Streamlit ได้)
+    - fit_workers: จำนวนชุดข้อมูลที่เทรนพร้อมกัน (แต่ละชุดยังเทรน 3 โมเดลขนานใน process pool)
+    - max_datasets: จำนวนชุดข้อมูลที่จำไว้ (LRU, ค่าเริ่มต้น = max_models) ชุดที่ถูกลบต้องส่งใหม่
+    """
+
+    def __init__(self, config=MODEL_CONFIG, max_models=16, cache_dir=None, fit_workers=2,
+                 parallel=True, max_datasets=None):
+        self.config = config
+        self.parallel = parallel
+        self.max_datasets = max_models if max_datasets is None else max_datasets
+        if self.max_datasets < 1:
+            raise ValueError("max_datasets ต้องมากกว่า 0")
+        self.models = ModelCache(
+            max_entries=max_models,
+            disk_dir=cache_dir,
+            dumps=dump_training_result,
+            loads=load_training_result
+        )
+        self._executor = ThreadPoolExecutor(max_workers=fit_workers, thread_name_prefix='fit')
+        self._lock = threading.Lock()
+        self._datasets = OrderedDict()
+        self._fits = {}
+
+    def submit_dataset(self, raw_df, factors=None):
+        """ลงทะเบียนชุดข้อมูล คืนค่า (dataset_id, status) และจัดคิวการเทรนถ้ายังไม่มีโมเดล"""
+        try:
+            df, series_col, _ = prepare_data(raw_df)
+        except (ValueError, KeyError) as e:
+            raise ServiceError(400, str(e))
+        if series_col:
+            raise ServiceError(400, f"พบข้อมูลหลายพื้นที่ในคอลัมน์ '{series_col}' - กรุณาส่งทีละพื้นที่")
+
+        factors = available_factors(df) if factors is None else list(factors)
+        missing = [factor for factor in factors if factor not in df.columns]
+        if missing:
+            raise ServiceError(400, f"ไม่พบคอลัมน์ปัจจัย: {', '.join(missing)}")
+        is_valid, invalid_names = validate_regressor_names(factors)
+        if not is_valid:
+            raise ServiceError(400, f"ชื่อปัจจัยเป็น reserved names ของ Prophet: {', '.join(invalid_names)}")
+
+        prophet_df = build_prophet_frame(df, factors)
+        dataset_id = make_cache_key(prophet_df, factors, self.config)
+
+        with self._lock:
+            self._datasets[dataset_id] = {'data': df, 'factors': factors, 'prophet_df': prophet_df}
+            self._datasets.move_to_end(dataset_id)
+            while len(self._datasets) > self.max_datasets:
+                evicted, _ = self._datasets.popitem(last=False)
+                self._fits.pop(evicted, None)
+            fit = self._fits.get(dataset_id)
+            if fit is not None and not (fit.done() and fit.exception() is not None):
+                return dataset_id, self._status_of(dataset_id)
+            if dataset_id in self.models:
+                return dataset_id, 'ready'
+            # ยังไม่มีโมเดล (หรือรอบก่อนล้มเหลว) - จัดคิวเทรนใหม่
+            self._fits[dataset_id] = self._executor.submit(self._fit, dataset_id, prophet_df, factors)
+        logger.info("จัดคิวเทรนชุดข้อมูล %s (%d สัปดาห์, %d ปัจจัย)", dataset_id[:12], len(df), len(factors))
+        return dataset_id, 'fitting'
+
+    def _fit(self, dataset_id, prophet_df, factors):
+        result = train_prophet_model_with_factors(
+            prophet_df, factors, config=self.config, parallel=self.parallel
+        )
+        self.models.put(dataset_id, result)
+        logger.info("เทรนชุดข้อมูล %s เสร็จแล้ว", dataset_id[:12])
+        return result
+
+    def _status_of(self, dataset_id):
+        fit = self._fits.get(dataset_id)
+        if fit is not None and not fit.done():
+            return 'fitting'
+        if fit is not None and fit.exception() is not None:
+            return 'failed'
+        return 'ready' if dataset_id in self.models else 'unknown'
+
+    def dataset_status(self, dataset_id):
+        """สถานะของชุดข้อมูล พร้อมค่า validation เมื่อเทรนเสร็จแล้ว"""
+        with self._lock:
+            if dataset_id not in self._datasets:
+                raise ServiceError(404, "ไม่พบชุดข้อมูล")
+            self._datasets.move_to_end(dataset_id)
+            status = self._status_of(dataset_id)
+            fit = self._fits.get(dataset_id)
+            dataset = self._datasets[dataset_id]
+
+        body = {'dataset_id': dataset_id, 'status': status, 'factors': dataset['factors'],
+                'n_weeks': len(dataset['data'])}
+        if status == 'failed':
+            body['error'] = f"{type(fit.exception()).__name__}: {fit.exception()}"
+        elif status == 'ready':
+            _, val_mae, val_mape, has_validation = self.models.get(dataset_id)
+            body['validation'] = {'has_validation': has_validation, 'mae': val_mae, 'mape': val_mape}
+        return body
+
+    def wait_until_ready(self, dataset_id, timeout=None):
+        """รอจนการเทรนของชุดข้อมูลเสร็จ (ใช้ตอน preload และในการทดสอบ)"""
+        with self._lock:
+            fit = self._fits.get(dataset_id)
+        if fit is not None:
+            fit.result(timeout=timeout)
+
+    def forecast(self, dataset_id, weeks=4, future_factors=None):
+        """พยากรณ์ด้วยโมเดลที่อุ่นไว้แล้ว (เรียกเพียง predict ไม่มีการเทรน)"""
+        with self._lock:
+            dataset = self._datasets.get(dataset_id)
+            status = None
+            if dataset is not None:
+                self._datasets.move_to_end(dataset_id)
+                status = self._status_of(dataset_id)
+        if dataset is None:
+            raise ServiceError(404, "ไม่พบชุดข้อมูล - ส่งข้อมูลไปที่ /datasets ก่อน")
+        if status == 'fitting':
+            raise ServiceError(409, "โมเดลกำลังเทรน - ลองใหม่ภายหลัง")
+        if status == 'failed':
+            raise ServiceError(500, "การเทรนโมเดลล้มเหลว")
+
+        cached_result = self.models.get(dataset_id)
+        if cached_result is None:
+            # โมเดลถูกลบออกจากแคช - จัดคิวเทรนใหม่
+            self._refit(dataset_id)
+            raise ServiceError(409, "โมเดลถูกลบออกจากแคชและกำลังเทรนใหม่ - ลองใหม่ภายหลัง")
+
+        if not 1 <= weeks <= MAX_FORECAST_WEEKS:
+            raise ServiceError(400, f"weeks ต้องอยู่ระหว่าง 1 ถึง {MAX_FORECAST_WEEKS}")
+
+        df = dataset['data']
+        factors = dataset['factors']
+        values = default_future_factors(df, factors)
+        values.update(_parse_future_factors(future_factors, factors, weeks))
+
+        model = cached_result[0]
+        forecast_future = forecast_future_weeks(model, df, factors, values, weeks)
+        forecast_future = forecast_future[FORECAST_RESPONSE_COLUMNS].copy()
+        forecast_future['ds'] = forecast_future['ds'].dt.strftime('%Y-%m-%d')
+        return {'dataset_id': dataset_id, 'weeks': weeks, 'forecast': forecast_future.to_dict('records')}
+
+    def _refit(self, dataset_id):
+        """จัดคิวเทรนชุดข้อมูลที่ลงทะเบียนไว้แล้วใหม่อีกครั้ง"""
+        with self._lock:
+            dataset = self._datasets.get(dataset_id)
+            if dataset is None:
+                raise ServiceError(404, "ไม่พบชุดข้อมูล - ส่งข้อมูลไปที่ /datasets ก่อน")
+            fit = self._fits.get(dataset_id)
+            if fit is None or fit.done():
+                self._fits[dataset_id] = self._executor.submit(
+                    self._fit, dataset_id, dataset['prophet_df'], dataset['factors']
+                )
+
+    def health(self):
+        with self._lock:
+            statuses = [self._status_of(dataset_id) for dataset_id in self._datasets]
+        return {
+            'status': 'ok',
+            'datasets': len(statuses),
+            'ready': statuses.count('ready'),
+            'fitting': statuses.count('fitting'),
+            'models_in_memory': len(self.models)
+        }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _finite_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and np.isfinite(value)
+
+
+def _parse_future_factors(future_factors, factors, weeks):
+    """ตรวจค่าปัจจัยในอนาคตจาก client: dict ปัจจัย → ตัวเลข หรือ list ตัวเลขยาว weeks ค่า"""
+    if future_factors is None:
+        return {}
+    if not isinstance(future_factors, dict):
+        raise ServiceError(400, "future_factors ต้องเป็น JSON object (ปัจจัย → ค่า)")
+    values = {}
+    for factor, value in future_factors.items():
+        if factor not in factors:
+            raise ServiceError(400, f"โมเดลไม่ได้ใช้ปัจจัย '{factor}'")
+        if isinstance(value, list):
+            if len(value) != weeks:
+                raise ServiceError(400, f"ค่าของ '{factor}' ต้องมี {weeks} ค่า (หนึ่งค่าต่อสัปดาห์)")
+            if not all(_finite_number(item) for item in value):
+                raise ServiceError(400, f"ค่าของ '{factor}' ต้องเป็นตัวเลขทั้งหมด")
+            values[factor] = [float(item) for item in value]
+        elif _finite_number(value):
+            values[factor] = float(value)
+        else:
+            raise ServiceError(400, f"ค่าของ '{factor}' ต้องเป็นตัวเลขหรือ list ของตัวเลข")
+    return values
+
+
+def _json_default(value):
+    if isinstance(value, (np.integer, np.floating)):
+        return value.item()
+    if isinstance(value, np.bool_):
+        return bool(value)
+    return str(value)
+
+
+def _read_dataset_body(body):
+    """แปลง body ของ POST /datasets เป็น DataFrame ดิบ"""
+    if 'csv' in body:
+        return pd.read_csv(io.StringIO(body['csv']))
+    if 'records' in body:
+        return pd.DataFrame(body['records'])
+    raise ServiceError(400, "ต้องมี 'csv' หรือ 'records'")
+
+
+def make_handler(service):
+    """สร้างคลาส request handler ที่ผูกกับ ForecastService"""
+
+    class ForecastRequestHandler(BaseHTTPRequestHandler):
+        server_version = 'FluForecast/1.0'
+
+        def log_message(self, format, *args):
+            logger.info("%s - %s", self.address_string(), format % args)
+
+        def _send_json(self, status, body):
+            payload = json.dumps(body, ensure_ascii=False, default=_json_default).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def _read_json(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            try:
+                body = json.loads(self.rfile.read(length) or b'{}')
+            except json.JSONDecodeError:
+                raise ServiceError(400, "body ไม่ใช่ JSON ที่ถูกต้อง")
+            if not isinstance(body, dict):
+                raise ServiceError(400, "body ต้องเป็น JSON object")
+            return body
+
+        def _dispatch(self, handle):
+            try:
+                status, body = handle()
+            except ServiceError as e:
+                status, body = e.status, {'error': e.message}
+            except Exception as e:
+                logger.exception("จัดการคำขอ %s %s ไม่สำเร็จ", self.command, self.path)
+                status, body = 500, {'error': f"{type(e).__name__}: {e}"}
+            self._send_json(status, body)
+
+        def do_GET(self):
+            def handle():
+                if self.path == '/health':
+                    return 200, service.health()
+                if self.path.startswith('/datasets/'):
+                    return 200, service.dataset_status(self.path[len('/datasets/'):])
+                raise ServiceError(404, "ไม่พบ endpoint")
+            self._dispatch(handle)
+
+        def do_POST(self):
+            def handle():
+                body = self._read_json()
+                if self.path == '/datasets':
+                    dataset_id, status = service.submit_dataset(
+                        _read_dataset_body(body), body.get('factors')
+                    )
+                    return (200 if status == 'ready' else 202), {'dataset_id': dataset_id, 'status': status}
+                if self.path == '/forecast':
+                    if 'dataset_id' not in body:
+                        raise ServiceError(400, "ต้องระบุ dataset_id")
+                    try:
+                        weeks = int(body.get('weeks', 4))
+                    except (TypeError, ValueError):
+                        raise ServiceError(400, "weeks ต้องเป็นจำนวนเต็ม")
+                    return 200, service.forecast(body['dataset_id'], weeks, body.get('future_factors'))
+                raise ServiceError(404, "ไม่พบ endpoint")
+            self._dispatch(handle)
+
+    return ForecastRequestHandler
+
+
+def make_server(service, host='127.0.0.1', port=8765):
+    """สร้าง HTTP server (port=0 = ให้ระบบเลือก port ว่าง)"""
+    return ThreadingHTTPServer((host, port), make_handler(service))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="บริการ HTTP สำหรับพยากรณ์ด้วยโมเดล Prophet ที่อุ่นไว้")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--preload', action='append', default=[],
+                        help="ไฟล์ CSV ที่ต้องการเทรนไว้ล่วงหน้า (ระบุได้หลายครั้ง)")
+    parser.add_argument('--max-models', type=int,
+                        default=int(os.environ.get('FORECAST_MODEL_CACHE_SIZE', '16')))
+    parser.add_argument('--cache-dir', default=os.environ.get('FORECAST_MODEL_CACHE_DIR'))
+    parser.add_argument('--fit-workers', type=int, default=2)
+    parser.add_argument('--max-datasets', type=int, default=None,
+                        help="จำนวนชุดข้อมูลที่จำไว้ (ค่าเริ่มต้น = --max-models)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+    service = ForecastService(max_models=args.max_models, cache_dir=args.cache_dir,
+                              fit_workers=args.fit_workers, max_datasets=args.max_datasets)
+
+    for path in args.preload:
+        dataset_id, status = service.submit_dataset(pd.read_csv(path))
+        logger.info("preload %s → %s (%s)", path, dataset_id, status)
+
+    server = make_server(service, args.host, args.port)
+    logger.info("เริ่มบริการที่ http://%s:%d", *server.server_address[:2])
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.shutdown()
+
+
+if __name__ == '__main__':
+    main()
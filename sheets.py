@@ -0,0 +1,145 @@
+"""ดึงข้อมูล CSV จาก Google Sheets แบบมีแคช (TTL) และตรวจจับการเปลี่ยนแปลงด้วย hash ของเนื้อหา
+
+- ภายในช่วง TTL จะใช้เนื้อหาเดิมโดยไม่เรียกเครือข่าย
+- เมื่อหมด TTL (หรือสั่ง force) จะส่งคำขอแบบมีเงื่อนไข (If-None-Match / If-Modified-Since)
+  ถ้าเซิร์ฟเวอร์ตอบ 304 หรือเนื้อหาที่ได้มี hash เท่าเดิม ถือว่าข้อมูลไม่เปลี่ยน
+- ผู้เรียกใช้ content_hash เป็นคีย์แคชของขั้นตอนถัดไป (ทำความสะอาด, เทรนโมเดล)
+- fetch_many ดึงหลาย URL (เช่น หลายแท็บของ workbook เดียวกัน) พร้อมกันด้วย thread pool ที่จำกัดจำนวน
+  เวลารวมจึงใกล้กับแท็บที่ช้าที่สุด ไม่ใช่ผลรวมของทุกแท็บ
+"""
+import hashlib
+import html as html_lib
+import json
+import re
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+SHEETS_FETCH_TTL = 300
+SHEETS_FETCH_TIMEOUT = 30
+# จำนวนคำขอพร้อมกันสูงสุดของ fetch_many (workbook ~90 แท็บดึงเสร็จในรอบเดียว)
+SHEETS_MAX_WORKERS = 96
+
+# รายการแท็บในหน้า htmlview ของ Google Sheets: {name: "ชื่อแท็บ", pageUrl: "...", gid: "123", ...}
+_TAB_PATTERN = re.compile(r'name:\s*"((?:[^"\\]|\\.)*)"\s*,[^{}]*?gid:\s*"(\d+)"')
+_HEX_ESCAPE = re.compile(r'\\x([0-9a-fA-F]{2})')
+# ปุ่มแท็บด้านล่างของหน้า (ใช้เมื่อไม่พบรายการข้างบน)
+_TAB_BUTTON_PATTERN = re.compile(r'id="sheet-button-(\d+)"[^>]*>\s*<a[^>]*>([^<]*)</a>')
+
+# ผลการดึงข้อมูล: changed=True เมื่อเนื้อหาต่างจากครั้งก่อน, revalidated=True เมื่อมีการเรียกเครือข่าย
+FetchResult = namedtuple('FetchResult', ['content', 'content_hash', 'changed', 'revalidated', 'fetched_at'])
+
+
+class SheetsFetcher:
+    """ตัวดึงข้อมูลที่จำเนื้อหาล่าสุดของแต่ละ URL
+
+    - ttl: จำนวนวินาทีที่ถือว่าเนื้อหาในแคชยังใหม่อยู่
+    - timeout: เวลารอสูงสุดต่อคำขอ (วินาที)
+    - opener: ฟังก์ชันเปิด request (ค่าเริ่มต้น urllib.request.urlopen)
+    """
+
+    def __init__(self, ttl=SHEETS_FETCH_TTL, timeout=SHEETS_FETCH_TIMEOUT, opener=urllib.request.urlopen,
+                 clock=time.monotonic):
+        self.ttl = ttl
+        self.timeout = timeout
+        self._opener = opener
+        self._clock = clock
+        self._entries = {}
+        self._lock = threading.Lock()
+        self.requests = 0
+
+    def fetch(self, url, force=False):
+        """ดึงเนื้อหาของ url คืนค่า FetchResult (force=True = ตรวจสอบกับเซิร์ฟเวอร์เสมอ)"""
+        with self._lock:
+            entry = self._entries.get(url)
+        now = self._clock()
+
+        if entry is not None and not force and now - entry['checked_at'] < self.ttl:
+            return FetchResult(entry['content'], entry['content_hash'], False, False, entry['fetched_at'])
+
+        request = urllib.request.Request(url)
+        if entry is not None:
+            if entry.get('etag'):
+                request.add_header('If-None-Match', entry['etag'])
+            if entry.get('last_modified'):
+                request.add_header('If-Modified-Since', entry['last_modified'])
+
+        with self._lock:
+            self.requests += 1
+        try:
+            with self._opener(request, timeout=self.timeout) as response:
+                content = response.read()
+                headers = response.headers
+        except urllib.error.HTTPError as e:
+            if e.code == 304 and entry is not None:
+                with self._lock:
+                    entry['checked_at'] = now
+                return FetchResult(entry['content'], entry['content_hash'], False, True, entry['fetched_at'])
+            raise
+
+        content_hash = hashlib.sha256(content).hexdigest()
+        changed = entry is None or entry['content_hash'] != content_hash
+        fetched_at = time.time() if changed else entry['fetched_at']
+        with self._lock:
+            self._entries[url] = {
+                'content': content,
+                'content_hash': content_hash,
+                'etag': headers.get('ETag'),
+                'last_modified': headers.get('Last-Modified'),
+                'checked_at': now,
+                'fetched_at': fetched_at,
+            }
+        return FetchResult(content, content_hash, changed, True, fetched_at)
+
+    def fetch_many(self, urls, max_workers=SHEETS_MAX_WORKERS, force=False):
+        """ดึงหลาย URL พร้อมกัน คืนค่า (dict url → FetchResult, dict url → exception ของ URL ที่ดึงไม่สำเร็จ)"""
+        urls = list(dict.fromkeys(urls))
+        results, errors = {}, {}
+        if not urls:
+            return results, errors
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(urls)))) as executor:
+            futures = {url: executor.submit(self.fetch, url, force) for url in urls}
+            for url, future in futures.items():
+                try:
+                    results[url] = future.result()
+                except Exception as e:
+                    errors[url] = e
+        return results, errors
+
+    def invalidate(self, url=None):
+        """ลืมเวลาตรวจสอบล่าสุด (url=None = ทุก URL) ครั้งถัดไปจะตรวจสอบกับเซิร์ฟเวอร์"""
+        with self._lock:
+            entries = self._entries.values() if url is None else [self._entries.get(url)]
+            for entry in entries:
+                if entry is not None:
+                    entry['checked_at'] = float('-inf')
+
+
+def parse_sheet_tabs(html):
+    """ดึงรายการแท็บ [(gid, ชื่อ), ...] จากหน้า htmlview ของ Google Sheets ตามลำดับในไฟล์"""
+    if isinstance(html, bytes):
+        html = html.decode('utf-8', errors='replace')
+    tabs = []
+    for raw_name, gid in _TAB_PATTERN.findall(html):
+        # ชื่อแท็บเป็น string ของ JavaScript (อาจมี \xNN ซึ่ง JSON ไม่รองรับ)
+        name = _HEX_ESCAPE.sub(lambda match: '\\u00' + match.group(1), raw_name)
+        try:
+            name = json.loads(f'"{name}"')
+        except ValueError:
+            name = raw_name
+        if all(gid != seen for seen, _ in tabs):
+            tabs.append((gid, name))
+    if not tabs:
+        tabs = [(gid, html_lib.unescape(name).strip()) for gid, name in _TAB_BUTTON_PATTERN.findall(html)]
+    return tabs
+
+
+def combined_content_hash(named_results):
+    """hash ของหลายแท็บรวมกัน [(ชื่อ, FetchResult), ...] (เปลี่ยนเมื่อแท็บใดเปลี่ยนหรือเลือกแท็บต่างจากเดิม)"""
+    hasher = hashlib.sha256()
+    for name, result in named_results:
+        hasher.update(json.dumps([name, result.content_hash], ensure_ascii=False).encode('utf-8'))
+    return hasher.hexdigest()
@@ -0,0 +1,192 @@
+"""ค้นหาค่า prior ของโมเดล Prophet อัตโนมัติด้วย successive halving บนจุดตัดของ backtest
+
+ค่าที่ค้นหา (SEARCH_SPACE): changepoint_prior_scale, seasonality_prior_scale,
+ตัวคูณ prior_scale ของปัจจัยภายนอกทุกตัว และ Fourier order ของ seasonality รายเดือน/รายไตรมาส
+
+- สุ่มค่าผสม n_candidates ชุด (รวมค่าปัจจุบันของ MODEL_CONFIG เสมอ)
+- รอบแรกประเมินทุกชุดด้วยจุดตัดล่าสุดเพียง min_cutoffs จุด แล้วเก็บไว้ 1/eta ชุดที่ MAE ต่ำสุด
+  รอบถัดไปใช้จุดตัดมากขึ้น eta เท่า จนเหลือชุดเดียวหรือใช้จุดตัดครบ
+  ชุดที่แย่ตั้งแต่รอบแรกจึงถูกตัดทิ้งโดยไม่เทรนซ้ำ (จำนวนการเทรนน้อยกว่าค้นหาทุกชุดหลายเท่า)
+- ค่าปัจจุบันถูกประเมินทุกรอบเพื่อใช้เทียบ ค่าที่เลือกจึงไม่แย่กว่าค่าเดิมบนจุดตัดชุดสุดท้าย
+- การเทรนทุกคู่ (ค่าผสม, จุดตัด) ในรอบเดียวกันส่งเข้า process pool พร้อมกัน
+
+ผลถูกแคชตาม hash ของข้อมูล + ปัจจัย + การตั้งค่าการค้นหา (ModelCache ที่เก็บลงดิสก์ได้)
+session ถัดไปที่ใช้ข้อมูลเดิมจึงได้ค่าที่ดีที่สุดทันทีโดยไม่ค้นหาใหม่
+"""
+import copy
+import itertools
+import math
+import os
+
+import numpy as np
+import pandas as pd
+
+from backtest import backtest_cutoff, recent_cutoffs, run_windows
+from forecast_model import MODEL_CONFIG
+from model_cache import ModelCache, make_cache_key
+
+# ค่าที่ค้นหา (factor_prior_multiplier คูณ prior_scale ของปัจจัยภายนอกทุกตัว)
+SEARCH_SPACE = {
+    'changepoint_prior_scale': [0.001, 0.003, 0.01, 0.03, 0.1, 0.3],
+    'seasonality_prior_scale': [0.01, 0.1, 1.0, 10.0],
+    'factor_prior_multiplier': [0.1, 0.3, 1.0, 3.0, 10.0],
+    'monthly_fourier_order': [0, 2, 3, 5],
+    'quarterly_fourier_order': [0, 2, 4],
+}
+
+TUNING_CONFIG = {
+    'n_candidates': 27,
+    'eta': 3,            # รอบถัดไปเก็บ 1/eta ชุด และใช้จุดตัดมากขึ้น eta เท่า
+    'min_cutoffs': 1,    # จำนวนจุดตัดในรอบแรก
+    'max_cutoffs': 9,
+    'horizon': 4,        # จำนวนสัปดาห์ที่พยากรณ์ต่อจุดตัด (จุดตัดห่างกันเท่านี้ ช่วงทดสอบจึงไม่ซ้อนกัน)
+    'seed': 42,
+}
+
+# จำนวนผลการค้นหาที่จำไว้ และโฟลเดอร์ย่อยในโฟลเดอร์แคช (แยกจากไฟล์โมเดลเพื่อไม่ให้ลบกันเอง)
+TUNING_CACHE_MAX_ENTRIES = 16
+TUNING_CACHE_SUBDIR = 'tuning'
+
+
+def tuning_cache(cache_dir=None, max_entries=TUNING_CACHE_MAX_ENTRIES):
+    """ModelCache สำหรับผลการค้นหา เก็บลง cache_dir/tuning ถ้าระบุ"""
+    return ModelCache(
+        max_entries=max_entries,
+        disk_dir=os.path.join(cache_dir, TUNING_CACHE_SUBDIR) if cache_dir else None
+    )
+
+
+def default_params(config=MODEL_CONFIG):
+    """ค่าใน search space ที่ตรงกับ config ปัจจุบัน"""
+    return {
+        'changepoint_prior_scale': config['changepoint_prior_scale'],
+        'seasonality_prior_scale': config['seasonality_prior_scale'],
+        'factor_prior_multiplier': 1.0,
+        'monthly_fourier_order': config['monthly_fourier_order'],
+        'quarterly_fourier_order': config['quarterly_fourier_order'],
+    }
+
+
+def apply_params(params, config=MODEL_CONFIG):
+    """config ใหม่ที่ใช้ค่าจาก params (ไม่แก้ config เดิม)"""
+    tuned = copy.deepcopy(config)
+    multiplier = 1.0
+    for name, value in params.items():
+        if name == 'factor_prior_multiplier':
+            multiplier = value
+        elif name in tuned:
+            tuned[name] = value
+        else:
+            raise ValueError(f"ไม่รู้จักค่าที่ค้นหา: {name}")
+    if multiplier != 1.0:
+        for factor_config in list(tuned['factor_configs'].values()) + [tuned['default_factor_config']]:
+            factor_config['prior_scale'] *= multiplier
+    return tuned
+
+
+def sample_candidates(search_space, n_candidates, seed, config=MODEL_CONFIG):
+    """สุ่มค่าผสมจาก search space โดยไม่ซ้ำ ชุดแรกคือค่าปัจจุบันของ config เสมอ"""
+    names = list(search_space)
+    base = default_params(config)
+    grid = [dict(zip(names, values)) for values in itertools.product(*(search_space[name] for name in names))]
+    grid = [params for params in grid if params != {name: base[name] for name in names}]
+    rng = np.random.default_rng(seed)
+    picks = rng.choice(len(grid), size=min(max(n_candidates - 1, 0), len(grid)), replace=False)
+    return [dict(base)] + [{**base, **grid[i]} for i in picks]
+
+
+def _rung_schedule(n_candidates, n_cutoffs, eta, min_cutoffs):
+    """(จำนวนชุด, จำนวนจุดตัด) ของแต่ละรอบ (ไม่นับค่าปัจจุบันที่ถูกเก็บไว้เทียบ)"""
+    schedule = []
+    survivors, used = n_candidates, min(min_cutoffs, n_cutoffs)
+    while True:
+        schedule.append((survivors, used))
+        if survivors == 1 or used == n_cutoffs:
+            return schedule
+        survivors = max(1, math.ceil(survivors / eta))
+        used = min(used * eta, n_cutoffs)
+
+
+def _absolute_errors(data, factors, cutoff, horizon, config):
+    """ค่าความผิดพลาดสัมบูรณ์ของหนึ่งจุดตัด (None = เทรนไม่สำเร็จ ชุดนั้นได้คะแนนแย่สุด)"""
+    try:
+        window = backtest_cutoff(data, factors, cutoff, horizon, config)
+    except Exception:
+        return None
+    return np.abs(window['y'].to_numpy(dtype=float) - window['yhat'].to_numpy(dtype=float))
+
+
+def tune_model_config(data, factors, config=MODEL_CONFIG, search_space=None, tuning=None,
+                      parallel=True, cache=None, progress=None):
+    """ค้นหาค่าที่ดีที่สุดสำหรับข้อมูล data (DataFrame แบบ build_prophet_frame)
+
+    tuning: ค่าที่ไม่ระบุใช้จาก TUNING_CONFIG
+    cache: ModelCache (ไม่บังคับ) เก็บผลตาม hash ของข้อมูลและการตั้งค่าการค้นหา
+    progress(done, total): callback หลังเทรนแต่ละคู่ (total เป็นค่าประมาณจากตารางรอบ)
+
+    คืนค่า dict: params, config (ใช้กับ train_prophet_model_with_factors ได้ทันที), mae, default_mae,
+    n_cutoffs, n_fits, n_fits_exhaustive, trials (DataFrame ผลทุกชุดทุกรอบ), cached
+    """
+    factors = list(factors)
+    search_space = SEARCH_SPACE if search_space is None else search_space
+    tuning = {**TUNING_CONFIG, **(tuning or {})}
+    if tuning['eta'] < 2:
+        raise ValueError("eta ต้องมีค่าอย่างน้อย 2")
+    cutoffs = recent_cutoffs(len(data), tuning['horizon'], tuning['max_cutoffs'])
+    if not cutoffs:
+        raise ValueError("ข้อมูลไม่พอสำหรับการปรับค่าโมเดล")
+
+    cache_key = None
+    if cache is not None:
+        cache_key = make_cache_key(data, factors, {
+            'kind': 'tuning', 'config': config, 'search_space': search_space, 'tuning': tuning
+        })
+        cached = cache.get(cache_key)
+        if cached is not None:
+            return {**cached, 'cached': True}
+
+    candidates = sample_candidates(search_space, tuning['n_candidates'], tuning['seed'], config)
+    configs = [apply_params(params, config) for params in candidates]
+    schedule = _rung_schedule(len(candidates), len(cutoffs), tuning['eta'], tuning['min_cutoffs'])
+    total = sum(n * (used - previous) for (n, used), previous in zip(schedule, [0] + [u for _, u in schedule]))
+    errors = {}
+
+    survivors = list(range(len(candidates)))
+    trials = []
+    scores = {}
+    for rung, (n_keep, n_used) in enumerate(schedule):
+        if rung:
+            ranked = sorted(survivors, key=lambda i: scores[i])[:n_keep]
+            # ค่าปัจจุบัน (ชุดที่ 0) ถูกประเมินต่อทุกรอบเพื่อใช้เทียบ
+            survivors = ranked if 0 in ranked else ranked + [0]
+        used_cutoffs = cutoffs[:n_used]
+        jobs = [(i, cutoff) for i in survivors for cutoff in used_cutoffs if (i, cutoff) not in errors]
+        rung_progress = None
+        if progress:
+            done_before = len(errors)
+            rung_progress = lambda done, _: progress(done_before + done, max(total, done_before + done))
+        outcomes = run_windows(
+            data, [(factors, cutoff, configs[i]) for i, cutoff in jobs], tuning['horizon'], parallel,
+            rung_progress, task=_absolute_errors
+        )
+        errors.update(zip(jobs, outcomes))
+        for i in survivors:
+            windows = [errors[(i, cutoff)] for cutoff in used_cutoffs]
+            scores[i] = np.inf if any(w is None for w in windows) else float(np.mean(np.concatenate(windows)))
+            trials.append({'rung': rung, 'candidate': i, 'n_cutoffs': n_used, 'mae': scores[i], **candidates[i]})
+
+    best = min(survivors, key=lambda i: (scores[i], i))
+    result = {
+        'params': candidates[best],
+        'config': configs[best],
+        'mae': scores[best],
+        'default_mae': scores[0],
+        'n_cutoffs': len(used_cutoffs),
+        'n_fits': len(errors),
+        'n_fits_exhaustive': len(candidates) * len(cutoffs),
+        'trials': pd.DataFrame(trials),
+        'cached': False,
+    }
+    if cache is not None:
+        cache.put(cache_key, result)
+    return result
@@ -0,0 +1,110 @@
+"""การวิเคราะห์ what-if แบบเร็ว: เปลี่ยนค่าปัจจัยในอนาคตโดยไม่เรียก model.predict ซ้ำ
+
+ปัจจัยภายนอกทุกตัวเข้าโมเดลแบบเชิงเส้น (additive หรือ multiplicative ตาม factor_configs)
+    yhat = trend · (1 + multiplicative) + additive
+ส่วนของปัจจัยแต่ละตัวคือ coef · (ค่า - center) จึงพยากรณ์ด้วยค่าฐานเพียงครั้งเดียว
+แล้วค่าปัจจัยชุดอื่นคำนวณจาก coef · (ค่าใหม่ - ค่าฐาน) ด้วย numpy
+ชุดค่าผสมหลายพันชุด (เช่น temperature × campaign × school_closed) ใช้เวลาระดับมิลลิวินาที
+
+ผลเป็นค่ากลาง (ตรงกับ yhat ของ predict_with_intervals) ไม่มีช่วงความเชื่อมั่น
+"""
+import numpy as np
+import pandas as pd
+
+from intervals import _point_forecast
+
+# จำนวนค่าต่อแกนของตารางความไว (ปัจจัยที่มีค่าไม่ซ้ำน้อยกว่านี้ใช้ค่าที่มีจริง เช่น 0/1)
+WHATIF_GRID_POINTS = 25
+
+
+def factor_range(df, factor, n_points=WHATIF_GRID_POINTS):
+    """ค่าของปัจจัยสำหรับตารางความไว: ค่าที่มีจริงถ้าไม่เกิน n_points ค่า ไม่เช่นนั้นแบ่งช่วงต่ำสุด-สูงสุดในอดีต"""
+    values = df[factor].dropna().to_numpy(dtype=float)
+    if len(values) == 0:
+        raise ValueError(f"ไม่มีค่าของปัจจัย {factor}")
+    unique = np.unique(values)
+    if len(unique) <= n_points:
+        return unique
+    return np.linspace(unique[0], unique[-1], n_points)
+
+
+class WhatIfEngine:
+    """ส่วนประกอบของการพยากรณ์ช่วงอนาคตที่คำนวณไว้ล่วงหน้าสำหรับโมเดลหนึ่งตัว
+
+    model: โมเดล Prophet ที่เทรนแล้ว
+    future: DataFrame แถวอนาคตเรียงตาม ds พร้อมค่าฐานของทุกปัจจัย (แบบที่ส่งให้ model.predict)
+    bounds: (ต่ำสุด, สูงสุด) สำหรับจำกัด yhat (ดู forecast_model.reasonable_bounds) ไม่ระบุ = ไม่จำกัด
+    """
+
+    def __init__(self, model, future, bounds=None):
+        frame, _, components = _point_forecast(model, future)
+        self.ds = frame['ds'].to_numpy()
+        self.trend = frame['trend'].to_numpy(dtype=float)
+        self.multiplicative = components['multiplicative_terms'].to_numpy(dtype=float)
+        self.additive = components['additive_terms'].to_numpy(dtype=float)
+        self.bounds = bounds
+
+        # coef ในหน่วยเดิมของข้อมูล (แบบเดียวกับ prophet.utilities.regressor_coefficients)
+        self.modes = {}
+        self.coef = {}
+        self.base = {}
+        if model.extra_regressors:
+            from prophet.utilities import regressor_index
+
+            for factor, params in model.extra_regressors.items():
+                beta = float(np.mean(model.params['beta'][:, regressor_index(model, factor)]))
+                scale = float(model.y_scale) if params['mode'] == 'additive' else 1.0
+                self.modes[factor] = params['mode']
+                self.coef[factor] = beta * scale / params['std']
+                # frame ถูก standardize แล้ว ค่าฐานจึงอ่านจาก future
+                self.base[factor] = future[factor].to_numpy(dtype=float)
+
+    @property
+    def factors(self):
+        return list(self.coef)
+
+    @property
+    def weeks(self):
+        return len(self.trend)
+
+    def predict(self, values):
+        """yhat ของทุกชุดค่า ขนาด (ชุด, สัปดาห์)
+
+        values: dict ปัจจัย → ค่าเดียว, array (ชุด,) หนึ่งค่าต่อชุดใช้ทุกสัปดาห์ หรือ array (ชุด, สัปดาห์)
+        ปัจจัยที่ไม่ได้ระบุใช้ค่าฐาน
+        """
+        unknown = [factor for factor in values if factor not in self.coef]
+        if unknown:
+            raise ValueError(f"โมเดลไม่ได้ใช้ปัจจัย: {', '.join(unknown)}")
+        multiplicative = self.multiplicative[None, :]
+        additive = self.additive[None, :]
+        for factor, value in values.items():
+            value = np.asarray(value, dtype=float)
+            if value.ndim == 1:
+                value = value[:, None]
+            delta = self.coef[factor] * (value - self.base[factor])
+            if self.modes[factor] == 'additive':
+                additive = additive + delta
+            else:
+                multiplicative = multiplicative + delta
+        yhat = self.trend * (1 + multiplicative) + additive
+        yhat = np.atleast_2d(yhat)
+        if self.bounds is not None:
+            yhat = np.clip(yhat, *self.bounds)
+        return yhat
+
+    def grid(self, axes):
+        """ผลของทุกชุดค่าผสมใน axes (dict ปัจจัย → ลำดับค่า) ปัจจัยอื่นใช้ค่าฐาน
+
+        คืนค่า DataFrame หนึ่งแถวต่อชุด: ค่าของปัจจัย, total (ผู้ป่วยรวมทั้งช่วง),
+        peak (ค่าสูงสุดรายสัปดาห์) และ peak_week (1 = สัปดาห์แรกที่พยากรณ์)
+        """
+        names = list(axes)
+        mesh = np.meshgrid(*[np.asarray(axes[factor], dtype=float) for factor in names], indexing='ij')
+        values = {factor: points.ravel() for factor, points in zip(names, mesh)}
+        yhat = self.predict(values)
+        result = pd.DataFrame(values)
+        result['total'] = yhat.sum(axis=1)
+        result['peak'] = yhat.max(axis=1)
+        result['peak_week'] = yhat.argmax(axis=1) + 1
+        return result